@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import math
+import os
+import re
+import sys
+
+import inkex
+import numpy as np
+from inkex import bezier
+
+# The elevation grid lives with the elevation extension
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'elevation'))
+
+from elevation_grid import read_grid
+from rasterize import polygon_area, polygon_mask
+
+EARTHWORKS_LAYERS = ("Dams", "Swales", "Roads")
+# Per-path settings in the object's description, e.g. "level=412.5 slope=2 direction=135"
+OVERRIDE_PATTERN = re.compile(r'\b(level|slope|direction)\s*=\s*(-?[\d.]+)|\b(balanced)\b', re.IGNORECASE)
+
+
+class EarthworksExtension(inkex.EffectExtension):
+    def add_arguments(self, pars):
+        pars.add_argument("--dams", type=inkex.Boolean, default=True)
+        pars.add_argument("--swales", type=inkex.Boolean, default=True)
+        pars.add_argument("--roads", type=inkex.Boolean, default=True)
+        pars.add_argument("--target", type=str, default="balanced", help="balanced or level")
+        pars.add_argument("--level", type=float, default=0.0, help="Finished level (m)")
+        pars.add_argument("--slope", type=float, default=0.0, help="Finished slope (%%)")
+        pars.add_argument("--direction", type=float, default=0.0, help="Downhill direction of the slope (degrees from north)")
+
+    def effect(self):
+        scale_factor = self.get_scale_factor()
+        if scale_factor is None:
+            return
+        grid = read_grid(self.document.getroot(), scale_factor)
+        if grid is None:
+            inkex.errormsg("No elevation grid found in the document. Run '3. Elevation' with "
+                           "'keep the elevation grid in the document' ticked first.")
+            return
+
+        chosen = [label for label, wanted in zip(EARTHWORKS_LAYERS, (self.options.dams, self.options.swales, self.options.roads))
+                  if wanted]
+        count = 0
+        for label in chosen:
+            layer = self.find_layer(label)
+            if layer is None:
+                inkex.errormsg(f"No '{label}' layer found in the document.")
+                continue
+            for obj in layer.iterdescendants(inkex.addNS('path', 'svg')):
+                if self.is_closed_path(obj):
+                    count += self.label_volumes(obj, grid, scale_factor)
+        if not count:
+            inkex.errormsg(f"No closed paths found in the {', '.join(chosen)} layers.")
+
+    def label_volumes(self, obj, grid, scale_factor):
+        """Compute the cut and fill of one closed path and write them in its label."""
+        rings = self.document_rings(obj)
+        if not rings:
+            return 0
+        area_m2 = polygon_area(rings) / (scale_factor ** 2)
+        grid_rings = [np.column_stack(grid.to_grid(ring[:, 0], ring[:, 1])) for ring in rings]
+        covered = polygon_mask(grid_rings, grid.shape)
+        if covered is None:
+            inkex.errormsg(f"'{obj.get_id()}' covers no elevation grid point (outside the grid, or narrower "
+                           f"than its spacing of {grid.spacing_m[0]:.2f}m); it was skipped.")
+            return 0
+
+        mask, first_row, first_col = covered
+        rows, cols = np.nonzero(mask)
+        rows += first_row
+        cols += first_col
+        ground = grid.z[rows, cols]
+        valid = np.isfinite(ground)
+        if not valid.any():
+            inkex.errormsg(f"'{obj.get_id()}' lies where the elevation grid has no data; it was skipped.")
+            return 0
+        if not valid.all():
+            inkex.utils.debug(f"'{obj.get_id()}': {np.count_nonzero(~valid)} of {len(ground)} grid points have no "
+                              f"elevation and were left out.")
+        rows, cols, ground = rows[valid], cols[valid], ground[valid]
+
+        level, slope, direction, balanced = self.target_for(obj)
+        # Height of the finished surface relative to its value at the middle of the path, along the slope
+        x, y = grid.to_document(rows, cols)
+        east = (x - x.mean()) / scale_factor
+        north = -(y - y.mean()) / scale_factor
+        bearing = math.radians(direction)
+        offsets = -slope / 100 * (east * math.sin(bearing) + north * math.cos(bearing))
+        if balanced:
+            level = float(np.mean(ground - offsets))
+        depth = ground - (level + offsets)
+
+        # Each grid point stands for an equal share of the path's exact area
+        point_area = area_m2 / len(depth)
+        cut_m3 = float(depth[depth > 0].sum()) * point_area
+        fill_m3 = float(-depth[depth < 0].sum()) * point_area
+
+        target = f"level {level:.2f}m" + (f", {slope:g}% towards {direction:g}°" if slope else "")
+        inkex.utils.debug(f"'{obj.get_id()}' [{area_m2:.2f}m²] finished at {target}: "
+                          f"cut {cut_m3:.2f} m³, fill {fill_m3:.2f} m³, net {cut_m3 - fill_m3:+.2f} m³")
+        obj.set(inkex.addNS('label', 'inkscape'), f"cut {cut_m3:.2f} m³, fill {fill_m3:.2f} m³ [{area_m2:.2f}m²]")
+        return 1
+
+    def target_for(self, obj):
+        """The finished surface for a path: the extension options, overridden by its description.
+
+        A description with 'level=' uses that level instead of balancing cut and fill,
+        unless it also says 'balanced'.
+        """
+        level, slope, direction = self.options.level, self.options.slope, self.options.direction
+        balanced = self.options.target == "balanced"
+        desc = obj.find('svg:desc', inkex.NSS)
+        if desc is not None and desc.text:
+            found = {}
+            for key, value, flag in OVERRIDE_PATTERN.findall(desc.text):
+                if flag:
+                    found['balanced'] = True
+                else:
+                    try:
+                        found[key.lower()] = float(value)
+                    except ValueError:
+                        inkex.errormsg(f"'{obj.get_id()}': invalid {key} '{value}' in the description.")
+            level = found.get('level', level)
+            slope = found.get('slope', slope)
+            direction = found.get('direction', direction)
+            if 'level' in found:
+                balanced = found.get('balanced', False)
+            elif found.get('balanced'):
+                balanced = True
+        return level, slope, direction, balanced
+
+    def document_rings(self, obj):
+        """The path's subpaths as flattened (x, y) rings in document coordinates."""
+        path = obj.path.to_absolute().transform(obj.composed_transform())
+        superpath = path.to_superpath()
+        bezier.cspsubdiv(superpath, self.svg.unittouu('0.1mm'))
+        rings = []
+        for subpath in superpath:
+            if len(subpath) < 3:
+                continue
+            rings.append(np.array([point[1] for point in subpath], dtype=np.float64))
+        return rings
+
+    def is_closed_path(self, obj):
+        """Check if a path is closed."""
+        d = obj.get('d', '').strip().upper()
+        return d.endswith('Z')
+
+    def find_layer(self, label):
+        """Find a layer by its label."""
+        layers = self.document.getroot().xpath(
+            f"//svg:g[@inkscape:label='{label}']", namespaces=inkex.NSS
+        )
+        return layers[0] if layers else None
+
+    def get_scale_factor(self):
+        """Retrieve scale factor from metadata."""
+        scale_factor_element = self.document.getroot().xpath('//inkscape:scalefactor', namespaces=inkex.NSS)
+        if scale_factor_element:
+            try:
+                return float(scale_factor_element[0].text)
+            except ValueError:
+                inkex.errormsg("Invalid scale factor value in metadata.")
+        else:
+            inkex.errormsg("Scale factor not found in metadata.")
+        return None
+
+
+if __name__ == '__main__':
+    EarthworksExtension().run()
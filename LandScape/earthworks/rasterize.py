@@ -0,0 +1,83 @@
+"""Grid nodes covered by a polygon, found with one scanline pass per polygon.
+
+Every grid row inside the polygon's bounding box is intersected with every
+polygon edge at once; the sorted crossings pair up into inside spans
+(even-odd rule, so holes and several rings work), and the spans are
+painted with a difference array.
+"""
+import numpy as np
+
+
+def polygon_mask(rings, shape):
+    """Boolean grid of the nodes inside the polygon.
+
+    ``rings`` are arrays of (row, col) points in fractional grid coordinates;
+    they are closed automatically. Returns ``(mask, row_offset, col_offset)``
+    where the mask covers only the polygon's bounding box, or None when no
+    node is inside.
+    """
+    n_rows, n_cols = shape
+    starts = np.vstack([ring for ring in rings])
+    ends = np.vstack([np.roll(ring, -1, axis=0) for ring in rings])
+    r0, c0 = starts[:, 0], starts[:, 1]
+    r1, c1 = ends[:, 0], ends[:, 1]
+
+    first_row = max(0, int(np.ceil(starts[:, 0].min())))
+    last_row = min(n_rows - 1, int(np.floor(starts[:, 0].max())))
+    first_col = max(0, int(np.ceil(starts[:, 1].min())))
+    last_col = min(n_cols - 1, int(np.floor(starts[:, 1].max())))
+    if first_row > last_row or first_col > last_col:
+        return None
+
+    rows = np.arange(first_row, last_row + 1, dtype=np.float64)[:, None]
+    # Half-open in the row direction, so a vertex on a row counts once
+    crossing = (r0 <= rows) != (r1 <= rows)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = c0 + (rows - r0) / (r1 - r0) * (c1 - c0)
+    x = np.sort(np.where(crossing, x, np.inf), axis=1)
+    if x.shape[1] % 2:
+        x = np.hstack((x, np.full((len(x), 1), np.inf)))
+
+    # Nodes with span_start <= col < span_end, clipped to the bounding box
+    width = last_col - first_col + 1
+    span_start = np.clip(np.ceil(x[:, 0::2]) - first_col, 0, width)
+    span_end = np.clip(np.ceil(x[:, 1::2]) - first_col, 0, width)
+    painted = np.isfinite(x[:, 1::2])
+    row_index = np.broadcast_to(np.arange(len(x))[:, None], span_start.shape)
+    steps = np.zeros((len(x), width + 1), dtype=np.int32)
+    np.add.at(steps, (row_index[painted], span_start[painted].astype(np.int64)), 1)
+    np.add.at(steps, (row_index[painted], span_end[painted].astype(np.int64)), -1)
+    mask = np.cumsum(steps, axis=1)[:, :-1] > 0
+    if not mask.any():
+        return None
+    return mask, first_row, first_col
+
+
+def ring_area(ring):
+    """Unsigned area enclosed by one ring."""
+    y, x = ring[:, 0], ring[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def inside_ring(point, ring):
+    """Whether the point lies inside the ring (even-odd crossing count)."""
+    r, c = point
+    r0, c0 = ring[:, 0], ring[:, 1]
+    r1, c1 = np.roll(r0, -1), np.roll(c0, -1)
+    crossing = (r0 <= r) != (r1 <= r)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = c0 + (r - r0) / (r1 - r0) * (c1 - c0)
+    return bool(np.count_nonzero(crossing & (x > c)) % 2)
+
+
+def polygon_area(rings):
+    """Area enclosed by the rings, in the units of their coordinates squared.
+
+    Uses the even-odd rule, like ``polygon_mask``: a ring inside an odd number
+    of the others is a hole and is taken off, whichever way it is drawn.
+    """
+    total = 0.0
+    for i, ring in enumerate(rings):
+        depth = sum(inside_ring(ring[0], other) for j, other in enumerate(rings) if j != i)
+        total += -ring_area(ring) if depth % 2 else ring_area(ring)
+    return abs(total)
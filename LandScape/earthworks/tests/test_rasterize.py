@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rasterize import polygon_area, polygon_mask
+
+
+def square(r0, c0, size, clockwise=False):
+    ring = np.array([(r0, c0), (r0, c0 + size), (r0 + size, c0 + size), (r0 + size, c0)], dtype=np.float64)
+    return ring[::-1] if clockwise else ring
+
+
+def test_hole_is_taken_off_whichever_way_it_is_drawn():
+    outer = square(0.5, 0.5, 10)
+    for hole in (square(3.5, 3.5, 4), square(3.5, 3.5, 4, clockwise=True)):
+        assert np.isclose(polygon_area([outer, hole]), 84)
+
+
+def test_area_agrees_with_the_mask():
+    rings = [square(0.5, 0.5, 10), square(3.5, 3.5, 4), square(4.5, 4.5, 2)]
+    mask, _, _ = polygon_mask(rings, (20, 20))
+    # One node per unit square, with an island inside the hole
+    assert np.isclose(polygon_area(rings), 88)
+    assert mask.sum() == 88
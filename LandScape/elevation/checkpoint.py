@@ -0,0 +1,99 @@
+"""Resumable elevation runs.
+
+Every batch fetched from the proxy is appended to a sidecar file next to the
+SVG as one JSON line holding the grid node indices and their elevations. The
+first line identifies the run by a hash of the geodata and grid parameters,
+so a re-run of the same grid only fetches the batches that are not in the
+file yet. The file is removed once a run has fetched every point.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+CHECKPOINT_SUFFIX = '.elevation-checkpoint.jsonl'
+
+
+def run_key(**params):
+    """Hash of the parameters that decide which point each grid node is."""
+    text = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def checkpoint_path(document_path, key):
+    """Sidecar next to the document, or a temp file for unsaved documents."""
+    if document_path:
+        return document_path + CHECKPOINT_SUFFIX
+    return os.path.join(tempfile.gettempdir(), f"landscape-{key[:16]}{CHECKPOINT_SUFFIX}")
+
+
+class FetchCheckpoint:
+    """Append-only record of the completed elevation batches of one run."""
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.values = {}
+        complete = self.load()
+        self.file = open(self.path, 'a' if self.values else 'w', encoding='utf-8')
+        if self.values:
+            # Drop a partial last line, so the next record starts on a line of its own
+            self.file.truncate(complete)
+        else:
+            self.write({'key': self.key})
+
+    @property
+    def resumed(self):
+        return len(self.values)
+
+    def load(self):
+        """Read the batches of an earlier interrupted run with the same key.
+
+        Returns the size in bytes of the complete lines read.
+        """
+        complete = 0
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.readline()
+                if json.loads(header).get('key') != self.key:
+                    return 0
+                complete = len(header)
+                for line in f:
+                    # A run killed halfway through writing leaves a partial last line
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self.values.update(zip(record['nodes'], record['z']))
+                    complete += len(line)
+        except (OSError, ValueError, AttributeError):
+            self.values = {}
+        return complete
+
+    def write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.file.flush()
+
+    def lookup(self, nodes):
+        """Elevations of the given node indices, NaN where no batch has them yet."""
+        return np.array([self.values.get(node, np.nan) for node in nodes.tolist()], dtype=np.float64)
+
+    def record(self, nodes, elevations):
+        """Store one completed batch."""
+        nodes = nodes.tolist()
+        elevations = [float(z) for z in elevations]
+        self.values.update(zip(nodes, elevations))
+        self.write({'nodes': nodes, 'z': elevations})
+
+    def close(self, complete=False):
+        """Close the file, removing it when the run needs no resuming."""
+        self.file.close()
+        if complete:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
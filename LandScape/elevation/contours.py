@@ -0,0 +1,292 @@
+"""Marching-squares contouring for the elevation extension.
+
+Every grid edge gets a global id ``(row * cols + col) * 2 + k`` where ``k`` is
+0 for the horizontal edge leaving node (row, col) to the right and 1 for the
+vertical edge leaving it downwards. Contour segments are stored as pairs of
+edge ids, so two segments that cross the same edge share an end point and can
+be stitched together without any geometric searching.
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+# Cell corners are numbered as bits: top-left 1, top-right 2,
+# bottom-right 4, bottom-left 8. A bit is set when the corner is at or
+# above the contour level. Saddles (5 and 10) are resolved separately.
+CASE_SEGMENTS = {
+    1: (('L', 'T'),),
+    2: (('T', 'R'),),
+    3: (('L', 'R'),),
+    4: (('R', 'B'),),
+    6: (('T', 'B'),),
+    7: (('L', 'B'),),
+    8: (('B', 'L'),),
+    9: (('T', 'B'),),
+    11: (('R', 'B'),),
+    12: (('L', 'R'),),
+    13: (('T', 'R'),),
+    14: (('L', 'T'),),
+}
+
+
+def contour_levels(z, gap):
+    """Return every multiple of ``gap`` between the raster minimum and maximum."""
+    if not np.isfinite(z).any():
+        return []
+    z_min = float(np.nanmin(z))
+    z_max = float(np.nanmax(z))
+    first = math.ceil(z_min / gap)
+    last = math.floor(z_max / gap)
+    return [k * gap for k in range(first, last + 1)]
+
+
+def level_segments(z, level, row_offset=0, col_offset=0, grid_cols=None):
+    """Return the contour segments of ``z`` at ``level`` as two edge-id arrays.
+
+    ``row_offset`` shifts the edge ids so that a horizontal stripe of a larger
+    raster produces the same ids as the full raster would. A tile also needs
+    its ``col_offset`` and the width of the full raster, ``grid_cols``.
+    """
+    rows, cols = z.shape
+    if grid_cols is None:
+        grid_cols = cols
+    if rows < 2 or cols < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    above = z >= level
+    tl = above[:-1, :-1]
+    tr = above[:-1, 1:]
+    br = above[1:, 1:]
+    bl = above[1:, :-1]
+    case = (tl * 1 + tr * 2 + br * 4 + bl * 8).astype(np.int8)
+
+    # Cells touching a missing sample cannot be contoured.
+    finite = np.isfinite(z)
+    valid = finite[:-1, :-1] & finite[:-1, 1:] & finite[1:, 1:] & finite[1:, :-1]
+    case[~valid] = 0
+
+    node = (np.arange(rows - 1, dtype=np.int64)[:, None] + row_offset) * grid_cols \
+        + np.arange(cols - 1, dtype=np.int64)[None, :] + col_offset
+    edges = {
+        'T': node * 2,
+        'B': (node + grid_cols) * 2,
+        'L': node * 2 + 1,
+        'R': (node + 1) * 2 + 1,
+    }
+
+    seg_a = []
+    seg_b = []
+    for case_id, pairs in CASE_SEGMENTS.items():
+        mask = case == case_id
+        if not mask.any():
+            continue
+        for a, b in pairs:
+            seg_a.append(edges[a][mask])
+            seg_b.append(edges[b][mask])
+
+    # Saddles: the average of the four corners decides which diagonal is
+    # connected across the cell.
+    for case_id in (5, 10):
+        mask = case == case_id
+        if not mask.any():
+            continue
+        center = (z[:-1, :-1][mask] + z[:-1, 1:][mask] + z[1:, 1:][mask] + z[1:, :-1][mask]) / 4.0
+        center_above = center >= level
+        if case_id == 5:
+            pairs_above = (('T', 'R'), ('B', 'L'))
+            pairs_below = (('L', 'T'), ('R', 'B'))
+        else:
+            pairs_above = (('L', 'T'), ('R', 'B'))
+            pairs_below = (('T', 'R'), ('B', 'L'))
+        for pairs, selector in ((pairs_above, center_above), (pairs_below, ~center_above)):
+            for a, b in pairs:
+                seg_a.append(edges[a][mask][selector])
+                seg_b.append(edges[b][mask][selector])
+
+    if not seg_a:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(seg_a), np.concatenate(seg_b)
+
+
+def edge_points(z, level, edge_ids, row_offset=0, col_offset=0, grid_cols=None):
+    """Interpolate the crossing point of ``level`` on each edge.
+
+    Returns an ``(n, 2)`` array of fractional (col, row) grid positions.
+    """
+    rows, cols = z.shape
+    if grid_cols is None:
+        grid_cols = cols
+    edge_ids = np.asarray(edge_ids, dtype=np.int64)
+    vertical = (edge_ids & 1).astype(bool)
+    node = edge_ids >> 1
+    r = node // grid_cols - row_offset
+    c = node % grid_cols - col_offset
+    r2 = r + vertical
+    c2 = c + ~vertical
+    z1 = z[r, c].astype(np.float64)
+    z2 = z[r2, c2].astype(np.float64)
+    t = (level - z1) / (z2 - z1)
+    points = np.empty((len(edge_ids), 2))
+    points[:, 0] = c + col_offset + np.where(vertical, 0.0, t)
+    points[:, 1] = r + row_offset + np.where(vertical, t, 0.0)
+    return points
+
+
+def stitch_segments(seg_a, seg_b):
+    """Chain segments that share an edge id into polylines.
+
+    Returns a list of edge-id lists. A closed ring repeats its first id at
+    the end. Runs in time linear in the number of segments.
+    """
+    seg_a = seg_a.tolist()
+    seg_b = seg_b.tolist()
+    ends = {}
+    for i, (a, b) in enumerate(zip(seg_a, seg_b)):
+        ends.setdefault(a, []).append(i)
+        ends.setdefault(b, []).append(i)
+
+    used = bytearray(len(seg_a))
+
+    def next_segment(edge):
+        for i in ends[edge]:
+            if not used[i]:
+                used[i] = 1
+                return seg_b[i] if seg_a[i] == edge else seg_a[i]
+        return None
+
+    lines = []
+    for start in range(len(seg_a)):
+        if used[start]:
+            continue
+        used[start] = 1
+        line = deque((seg_a[start], seg_b[start]))
+        while True:
+            edge = next_segment(line[-1])
+            if edge is None:
+                break
+            line.append(edge)
+        if line[0] != line[-1]:
+            while True:
+                edge = next_segment(line[0])
+                if edge is None:
+                    break
+                line.appendleft(edge)
+        lines.append(list(line))
+    return lines
+
+
+def contour_lines(z, level, x0, y0, dx, dy):
+    """Return the stitched contour polylines of ``z`` at ``level``.
+
+    Grid node (row, col) sits at document position ``(x0 + col * dx,
+    y0 + row * dy)``. Each polyline is an ``(n, 2)`` array; closed rings end
+    on their first point.
+    """
+    seg_a, seg_b = level_segments(z, level)
+    if len(seg_a) == 0:
+        return []
+    lines = stitch_segments(seg_a, seg_b)
+    ids = np.fromiter((e for line in lines for e in line), dtype=np.int64)
+    points = edge_points(z, level, ids)
+    points[:, 0] = x0 + points[:, 0] * dx
+    points[:, 1] = y0 + points[:, 1] * dy
+    bounds = np.cumsum([len(line) for line in lines])[:-1]
+    return np.split(points, bounds)
+
+
+def join_pieces(pieces):
+    """Join polyline pieces that end on the same edge id.
+
+    ``pieces`` is a list of ``(first_edge, last_edge, points)`` tuples. Returns
+    the joined pieces in the same form; a closed ring has equal end ids.
+    """
+    ends = {}
+    for i, (first, last, _) in enumerate(pieces):
+        ends.setdefault(first, []).append(i)
+        ends.setdefault(last, []).append(i)
+
+    used = bytearray(len(pieces))
+
+    def take(edge):
+        for i in ends[edge]:
+            if not used[i]:
+                used[i] = 1
+                first, last, points = pieces[i]
+                # Orient the piece so that it starts on the shared edge
+                return (last, points[1:]) if first == edge else (first, points[-2::-1])
+        return None
+
+    joined = []
+    for start in range(len(pieces)):
+        if used[start]:
+            continue
+        used[start] = 1
+        first, last, points = pieces[start]
+        tail = [points]
+        while first != last:
+            step = take(last)
+            if step is None:
+                break
+            last, points = step
+            tail.append(points)
+        head = []
+        while first != last:
+            step = take(first)
+            if step is None:
+                break
+            first, points = step
+            head.append(points[::-1])
+        joined.append((first, last, np.concatenate(head[::-1] + tail)))
+    return joined
+
+
+class StripeContourer:
+    """Contour a raster one horizontal stripe at a time.
+
+    Consecutive stripes share one row of grid nodes. Lines that end on the
+    shared row are held back and joined to the next stripe's lines, so the
+    result is the same as contouring the whole raster at once while only one
+    stripe has to be in memory.
+    """
+
+    def __init__(self, cols, gap, x0, y0, dx, dy):
+        self.cols = cols
+        self.gap = gap
+        self.x0, self.y0, self.dx, self.dy = x0, y0, dx, dy
+        self.pending = {}
+
+    def add_stripe(self, z, row_offset, last=False):
+        """Contour one stripe; returns ``{level: [polyline, ...]}`` of the finished lines."""
+        finished = {}
+        levels = set(contour_levels(z, self.gap)) | set(self.pending)
+        seam_row = row_offset + z.shape[0] - 1
+        for level in levels:
+            pieces = self.pending.pop(level, [])
+            seg_a, seg_b = level_segments(z, level, row_offset)
+            if len(seg_a):
+                for line in stitch_segments(seg_a, seg_b):
+                    points = edge_points(z, level, line, row_offset)
+                    pieces.append((line[0], line[-1], points))
+            if not pieces:
+                continue
+
+            open_lines = []
+            for first_edge, last_edge, points in join_pieces(pieces):
+                if not last and first_edge != last_edge and \
+                        (self.on_row(first_edge, seam_row) or self.on_row(last_edge, seam_row)):
+                    open_lines.append((first_edge, last_edge, points))
+                else:
+                    finished.setdefault(level, []).append(self.to_document(points))
+            if open_lines:
+                self.pending[level] = open_lines
+        return finished
+
+    def on_row(self, edge, row):
+        """True for a horizontal edge lying on grid row ``row``."""
+        return not edge & 1 and (edge >> 1) // self.cols == row
+
+    def to_document(self, points):
+        return np.column_stack((self.x0 + points[:, 0] * self.dx, self.y0 + points[:, 1] * self.dy))
@@ -0,0 +1,186 @@
+"""Local elevation rasters (DEM files) for the elevation extension.
+
+Supported inputs:
+
+* GeoTIFF (``.tif``/``.tiff``) - one band, georeferenced in lon/lat degrees
+  through the ModelTiepoint and ModelPixelScale tags.
+* ESRI ASCII grid (``.asc``) - ``xllcorner``/``yllcorner`` (or the
+  ``center`` variants) and ``cellsize`` in lon/lat degrees.
+* NumPy array (``.npy``) - opened memory mapped. Georeferencing is read
+  from an optional ``<file>.json`` sidecar with ``west``, ``north``,
+  ``cellsize_x``, ``cellsize_y`` and ``nodata``.
+
+A raster without georeferencing is stretched over the whole document page.
+"""
+import json
+import os
+
+import numpy as np
+
+# GeoTIFF tags
+MODEL_PIXEL_SCALE_TAG = 33550
+MODEL_TIEPOINT_TAG = 33922
+GDAL_NODATA_TAG = 42113
+
+
+class DemRaster:
+    """A 2-D elevation array plus its lon/lat georeferencing.
+
+    ``west``/``north`` are the outer corner of the top-left pixel and
+    ``cellsize_x``/``cellsize_y`` the pixel size in degrees. All four are
+    None for a raster that covers the document page.
+    """
+
+    def __init__(self, data, west=None, north=None, cellsize_x=None, cellsize_y=None, nodata=None):
+        self.data = data
+        self.west = west
+        self.north = north
+        self.cellsize_x = cellsize_x
+        self.cellsize_y = cellsize_y
+        self.nodata = nodata
+
+    @property
+    def georeferenced(self):
+        return self.west is not None
+
+    def check_geographic(self):
+        """Raise ValueError when the georeferencing is clearly not lon/lat degrees."""
+        if not self.georeferenced:
+            return
+        rows, cols = self.data.shape
+        east = self.west + cols * self.cellsize_x
+        south = self.north - rows * self.cellsize_y
+        if max(abs(self.west), abs(east)) > 180 or max(abs(self.north), abs(south)) > 90:
+            raise ValueError("The DEM uses projected coordinates. Reproject it to WGS84 lon/lat, "
+                             "or remove its georeferencing to stretch it over the page.")
+
+
+def load_dem(path):
+    """Open a DEM file, choosing the reader by extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.tif', '.tiff'):
+        dem = read_geotiff(path)
+    elif ext == '.asc':
+        dem = read_ascii_grid(path)
+    elif ext == '.npy':
+        dem = read_npy(path)
+    else:
+        raise ValueError(f"Unsupported DEM format '{ext}' (use .tif, .asc or .npy)")
+    dem.check_geographic()
+    return dem
+
+
+def read_geotiff(path):
+    from PIL import Image
+
+    with Image.open(path) as image:
+        tags = image.tag_v2
+        data = np.asarray(image, dtype=np.float32)
+        scale = tags.get(MODEL_PIXEL_SCALE_TAG)
+        tiepoint = tags.get(MODEL_TIEPOINT_TAG)
+        nodata = tags.get(GDAL_NODATA_TAG)
+
+    if data.ndim != 2:
+        raise ValueError("Only single band GeoTIFF files are supported")
+    dem = DemRaster(data, nodata=float(str(nodata).strip('\x00 ')) if nodata else None)
+    if scale and tiepoint:
+        # Tiepoint maps raster position (i, j) onto model position (x, y)
+        i, j, _, x, y, _ = tiepoint[:6]
+        dem.cellsize_x = float(scale[0])
+        dem.cellsize_y = float(scale[1])
+        dem.west = x - i * dem.cellsize_x
+        dem.north = y + j * dem.cellsize_y
+    return dem
+
+
+def read_ascii_grid(path):
+    header = {}
+    with open(path) as f:
+        while True:
+            position = f.tell()
+            line = f.readline()
+            parts = line.split()
+            if len(parts) != 2 or not parts[0][0].isalpha():
+                f.seek(position)
+                break
+            header[parts[0].lower()] = float(parts[1])
+        values = np.array(f.read().split(), dtype=np.float32)
+
+    rows = int(header['nrows'])
+    cols = int(header['ncols'])
+    cellsize_x = header.get('dx', header.get('cellsize'))
+    cellsize_y = header.get('dy', header.get('cellsize'))
+    west = header['xllcorner'] if 'xllcorner' in header else header['xllcenter'] - cellsize_x / 2
+    south = header['yllcorner'] if 'yllcorner' in header else header['yllcenter'] - cellsize_y / 2
+    return DemRaster(values[:rows * cols].reshape(rows, cols), west=west, north=south + rows * cellsize_y,
+                     cellsize_x=cellsize_x, cellsize_y=cellsize_y, nodata=header.get('nodata_value'))
+
+
+def read_npy(path):
+    data = np.load(path, mmap_mode='r')
+    if data.ndim != 2:
+        raise ValueError("The .npy DEM must hold a 2-D array")
+    dem = DemRaster(data)
+    sidecar = path + '.json'
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            meta = json.load(f)
+        dem.west = meta['west']
+        dem.north = meta['north']
+        dem.cellsize_x = meta['cellsize_x']
+        dem.cellsize_y = meta.get('cellsize_y', meta['cellsize_x'])
+        dem.nodata = meta.get('nodata')
+    return dem
+
+
+def sample_bilinear(data, rows, cols, nodata=None):
+    """Bilinearly sample ``data`` at fractional pixel-centre positions.
+
+    Positions more than half a pixel outside the raster, and cells touching
+    a nodata value, give NaN. Only the window covering the requested positions is read, so memory
+    mapped rasters stay mostly on disk.
+    """
+    rows = np.asarray(rows, dtype=np.float64)
+    cols = np.asarray(cols, dtype=np.float64)
+    result = np.full(rows.shape, np.nan)
+    n_rows, n_cols = data.shape
+    inside = (rows >= -0.5) & (rows <= n_rows - 0.5) & (cols >= -0.5) & (cols <= n_cols - 0.5)
+    if not inside.any():
+        return result
+
+    r = np.clip(rows[inside], 0, n_rows - 1)
+    c = np.clip(cols[inside], 0, n_cols - 1)
+    r0 = np.minimum(np.floor(r).astype(np.int64), n_rows - 2) if n_rows > 1 else np.zeros(r.shape, np.int64)
+    c0 = np.minimum(np.floor(c).astype(np.int64), n_cols - 2) if n_cols > 1 else np.zeros(c.shape, np.int64)
+    top, left = int(r0.min()), int(c0.min())
+    bottom, right = min(int(r0.max()) + 2, n_rows), min(int(c0.max()) + 2, n_cols)
+    window = np.array(data[top:bottom, left:right], dtype=np.float64)
+    if nodata is not None:
+        window[window == nodata] = np.nan
+
+    r0 -= top
+    c0 -= left
+    r1 = np.minimum(r0 + 1, window.shape[0] - 1)
+    c1 = np.minimum(c0 + 1, window.shape[1] - 1)
+    fr = r - (r0 + top)
+    fc = c - (c0 + left)
+    upper = window[r0, c0] * (1 - fc) + window[r0, c1] * fc
+    lower = window[r1, c0] * (1 - fc) + window[r1, c1] * fc
+    result[inside] = upper * (1 - fr) + lower * fr
+    return result
+
+
+def sample_dem(dem, lat, lon, page_fraction_x, page_fraction_y):
+    """Sample a DEM at the given grid nodes.
+
+    Georeferenced rasters are sampled at ``lat``/``lon``; others at the
+    nodes' position as a fraction (0-1) of the page width and height.
+    """
+    if dem.georeferenced:
+        cols = (np.asarray(lon) - dem.west) / dem.cellsize_x - 0.5
+        rows = (dem.north - np.asarray(lat)) / dem.cellsize_y - 0.5
+    else:
+        n_rows, n_cols = dem.data.shape
+        cols = np.asarray(page_fraction_x) * (n_cols - 1)
+        rows = np.asarray(page_fraction_y) * (n_rows - 1)
+    return sample_bilinear(dem.data, rows, cols, dem.nodata)
@@ -1,13 +1,33 @@
 #!/usr/bin/env python3
 import os
 import inkex
-import requests
 import math
 from lxml import etree
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from checkpoint import FetchCheckpoint, checkpoint_path, run_key
+from dem import load_dem, sample_dem
+from contours import StripeContourer, contour_levels, contour_lines
+from path_data import polyline_path_data, smooth_path_data
+from relief import SLOPE_COLORS, ReliefBuilder, png_data_uri
+from simplify import simplify_lines
+from spatial_index import GridIndex
+from stage_timings import StageTimings
+from tiles import SeamJoiner, contour_tile, tile_starts, tile_stop
+from elevation_cache import ElevationCache
+from elevation_grid import GridEncoder, write_grid
+from proxy_fetch import ProxyElevationFetcher
+from sampling import adaptive_sample, sparse_sample
 
 INKSCAPE_NS = 'http://www.inkscape.org/namespaces/inkscape'
 
+# A cached sample serves a grid node within this share of the node spacing of it, and at most CACHE_TOLERANCE_M
+CACHE_TOLERANCE_SHARE = 0.1
+CACHE_TOLERANCE_M = 0.5
+
 # API Proxy URL - set LANDSCAPE_API_PROXY env var, or use default
 PROXY_URL = os.environ.get('LANDSCAPE_API_PROXY', 'https://landscape.idea-o-mator.com/api/proxy.php')
 
@@ -19,13 +39,43 @@ class ElevationMapExtension(inkex.Effect):
     def add_arguments(self, pars):
         pars.add_argument("--num_points", type=int, default=350, help="Number of points along one side of the grid")
         pars.add_argument("--threshold", type=int, default=2, help="accuracy of path seperation")
-        pars.add_argument("--max_distance", type=int, default=10, help="distance between paths")
         pars.add_argument("--contour_gaps", type=int, default=1, help="gaps between contour lines - default is 1m")
+        pars.add_argument("--dem_source", default="", help="local DEM file (.tif, .asc or .npy) to sample instead of the proxy")
+        pars.add_argument("--fetch_workers", type=int, default=4, help="number of elevation batches fetched at the same time")
+        pars.add_argument("--fetch_timeout", type=int, default=30, help="timeout of a single elevation batch request, in seconds")
+        pars.add_argument("--fetch_retries", type=int, default=3, help="retries of a failed elevation batch (timeouts, 429 and 5xx replies)")
+        pars.add_argument("--batch_points", type=int, default=512, help="most locations per elevation request (batches are also kept within the proxy's length limit)")
+        pars.add_argument("--location_format", default="plain", help="plain (lat,lon pairs) or polyline (encoded polyline, about 1 m precision)")
+        pars.add_argument("--sampling", default="uniform", help="uniform (every grid point), adaptive (refine where contours need it) or sparse (spline between every Nth point)")
+        pars.add_argument("--coarse_step", type=int, default=8, help="adaptive sampling: spacing of the first coarse grid, in grid points")
+        pars.add_argument("--point_budget", type=int, default=0, help="adaptive sampling: maximum number of sampled points (0 = no limit)")
+        pars.add_argument("--sparse_step", type=int, default=4, help="sparse sampling: fetch every Nth grid point along each axis")
+        pars.add_argument("--holdout_points", type=int, default=100, help="sparse sampling: extra points fetched to estimate the interpolation error")
+        pars.add_argument("--streaming", type=inkex.Boolean, default=False, help="fetch and contour the grid in row stripes")
+        pars.add_argument("--stripe_rows", type=int, default=32, help="streaming: grid rows per stripe")
+        pars.add_argument("--tiled", type=inkex.Boolean, default=False, help="fetch and contour the grid in square tiles")
+        pars.add_argument("--tile_size", type=int, default=256, help="tiled: grid cells along a tile side")
+        pars.add_argument("--tile_workers", type=int, default=1, help="tiled: processes contouring tiles at the same time (1 = no process pool)")
+        pars.add_argument("--simplify", default="douglas-peucker", help="contour simplification: none, douglas-peucker or visvalingam")
+        pars.add_argument("--simplify_tolerance", type=float, default=0.1, help="simplification tolerance in document units")
+        pars.add_argument("--precision", type=int, default=2, help="decimals kept in contour path coordinates")
+        pars.add_argument("--relative_paths", type=inkex.Boolean, default=True, help="write contour paths with relative commands")
+        pars.add_argument("--use_cache", type=inkex.Boolean, default=True, help="reuse elevation samples cached on disk by earlier runs")
+        pars.add_argument("--cache_size", type=int, default=200, help="maximum size of the elevation cache, in MB")
+        pars.add_argument("--checkpoint", type=inkex.Boolean, default=True, help="record fetched batches next to the SVG so an interrupted run can resume")
+        pars.add_argument("--hillshade", type=inkex.Boolean, default=True, help="add a shaded relief image under the contours")
+        pars.add_argument("--slope_classes", type=inkex.Boolean, default=False, help="add a slope class image under the contours")
+        pars.add_argument("--store_grid", type=inkex.Boolean, default=True, help="keep the elevation grid in the document metadata for the water and earthworks extensions")
+        pars.add_argument("--contour_method", default="marching", help="marching (marching squares) or nearest (legacy point chaining)")
 
     # Initialize variables for minimum and maximum elevation
     min_elevation = float('inf')
     max_elevation = float('-inf')
-    
+
+    # Stage timings, only recorded when LANDSCAPE_TIMINGS_FILE is set (benchmarks/)
+    timings = StageTimings()
+    fetcher = None
+
     def effect(self):
         scale = None
         threshold = self.options.threshold
@@ -59,91 +109,492 @@ class ElevationMapExtension(inkex.Effect):
         spacing_mm_x = doc_width / (num_points - 1)
         spacing_mm_y = doc_height / (num_points - 1)
 
-        # Initialize empty list for storing elevation data and batch requests
-        elevation_data = []
-        grid_points = []
-        elevation_groups = {}
+        # Grid node (row, col) sits at x = col * spacing_x, y = row * spacing_y;
+        # row 0 is the top (north) edge of the document
+        xs = np.arange(num_points) * spacing_mm_x
+        ys = np.arange(num_points) * spacing_mm_y
+
+        # Latitude only depends on the row and longitude only on the column
+        self.grid_lats = center_lat + ((doc_height / 2 - ys) / scale) / meters_per_degree
+        self.grid_lons = center_lon + ((xs - doc_width / 2) / scale) / (meters_per_degree * math.cos(math.radians(center_lat)))
+        self.fraction_x = xs / doc_width
+        self.fraction_y = ys / doc_height
+        self.cache_tolerance = min(CACHE_TOLERANCE_M, CACHE_TOLERANCE_SHARE * min(spacing_mm_x, spacing_mm_y) / scale)
+
+        # Identifies the grid for resuming an interrupted run
+        self.run_key = run_key(latitude=center_lat, longitude=center_lon, scale=scale,
+                               width=doc_width, height=doc_height, num_points=num_points)
+
+        self.dem = None
+        if self.options.dem_source:
+            # Sample a local DEM file: no network calls at all
+            try:
+                self.dem = load_dem(self.options.dem_source)
+            except (OSError, ValueError, KeyError) as e:
+                inkex.errormsg(f"Could not read DEM file '{self.options.dem_source}': {str(e)}")
+                return
+
+        self.nodes_before = 0
+        self.nodes_after = 0
+        relief = self.create_relief(spacing_mm_x / scale, spacing_mm_y / scale)
+        grid_encoder = GridEncoder() if self.options.store_grid else None
+        row_sinks = [sink for sink in (relief, grid_encoder) if sink is not None]
+
+        if (self.options.tiled or self.options.streaming) and self.options.contour_method != "nearest":
+            stage, contour = ("tiled", self.tile_contours) if self.options.tiled else ("streaming", self.stream_contours)
+            if self.options.sampling != "uniform":
+                inkex.errormsg(f"'{self.options.sampling}' sampling is not used in {stage} mode: "
+                               "every grid point is fetched.")
+            with self.timings.stage(stage, self.requests_made):
+                self.open_sources()
+                try:
+                    contour(elevation_layer, spacing_mm_x, spacing_mm_y, row_sinks)
+                finally:
+                    self.close_sources()
+            self.report_simplification()
+            if self.min_elevation != float('inf'):
+                if relief is not None:
+                    self.draw_relief(Calculated_elevation_map_layer, elevation_layer, relief, spacing_mm_x, spacing_mm_y)
+                if grid_encoder is not None:
+                    write_grid(svg_root, grid_encoder, 0.0, 0.0, spacing_mm_x, spacing_mm_y)
+            return
 
-        # Generate grid points
-        for i in range(num_points):
-            for j in range(num_points):
-                # Calculate grid coordinates
-                x = i * spacing_mm_x
-                y = doc_height - (j * spacing_mm_y)  # This flips the y-coordinate
- 
-                # Calculate latitude and longitude for each point
-                lat = center_lat + ((doc_height / 2 - y) / scale) / meters_per_degree
-                lon = center_lon + ((x - doc_width / 2) / scale) / (meters_per_degree * math.cos(math.radians(center_lat)))
-
-                # Add grid coordinates with corresponding lat-lon to the list
-                grid_points.append((x, y, lat, lon))
-
-        # Fetch elevation data via proxy
-        grid_point_index = 0
-        
+        with self.timings.stage("sampling", self.requests_made):
+            self.open_sources()
+            try:
+                if self.options.sampling == "adaptive":
+                    elevations = self.sample_adaptive((num_points, num_points))
+                elif self.options.sampling == "sparse":
+                    elevations = self.sample_sparse((num_points, num_points))
+                else:
+                    rows, cols = np.indices((num_points, num_points))
+                    elevations = self.sample_nodes(rows, cols)
+            finally:
+                self.close_sources()
+
+        missing = int(np.isnan(elevations).sum())
+        if missing == elevations.size:
+            inkex.errormsg("No elevation data could be retrieved for this site.")
+            return
+        if missing and self.dem is not None:
+            inkex.errormsg(f"{missing} of {elevations.size} grid points lie outside the DEM or on nodata cells.")
+
+        self.min_elevation = float(np.nanmin(elevations))
+        self.max_elevation = float(np.nanmax(elevations))
+
+        with self.timings.stage("contouring"):
+            if self.options.contour_method == "nearest":
+                # The only way into the legacy contouring
+                self.draw_legacy_contours(elevation_layer, elevations, xs, ys, threshold)
+            else:
+                self.draw_contours(elevation_layer, elevations, spacing_mm_x, spacing_mm_y)
+        self.report_simplification()
+
+        if relief is not None:
+            with self.timings.stage("relief"):
+                relief.add_rows(elevations)
+                self.draw_relief(Calculated_elevation_map_layer, elevation_layer, relief, spacing_mm_x, spacing_mm_y)
+        if grid_encoder is not None:
+            grid_encoder.add_rows(elevations)
+            write_grid(svg_root, grid_encoder, 0.0, 0.0, spacing_mm_x, spacing_mm_y)
+
+    def save(self, stream):
+        with self.timings.stage("writing"):
+            super().save(stream)
+        self.timings.save()
+
+    def requests_made(self):
+        return self.fetcher.requests_made if self.fetcher is not None else 0
+
+    def open_sources(self):
+        """Open the elevation cache and proxy session shared by every sampling call of a run."""
+        self.cache = None
+        self.fetcher = None
+        self.checkpoint = None
+        self.fetched_points = 0
+        self.failed_points = 0
+        if self.dem is not None:
+            return
+        if self.options.use_cache:
+            self.cache = ElevationCache(max_bytes=self.options.cache_size * 1024 * 1024)
         if PROXY_URL:
-            # Use proxy - batch locations
-            locations = [f"{lat},{lon}" for _, _, lat, lon in grid_points]
-            batch_size = 100
-            for batch_start in range(0, len(locations), batch_size):
-                batch_locs = locations[batch_start:batch_start + batch_size]
-                batch_elevation_data = self.fetch_elevation_batch_proxy(batch_locs)
-                for elevation, lat, lon in batch_elevation_data:
-                    # Get the corresponding grid point
-                    x, y, lat, lon = grid_points[grid_point_index]
-                    grid_point_index += 1
-                    
-                    # Calculate the fractional part of the elevation
-                    fractional_part = elevation - int(elevation)
-                    
-                    # Check if the fractional part is within 0.15 of being a whole number
-                    if fractional_part > 0.05 and fractional_part < 0.95:
-                        continue  # Skip this point
-            
-                    rounded_elevation = self.round_elevation(elevation)
-                    contour_gaps = self.options.contour_gaps
-                    
-                    if rounded_elevation % contour_gaps != 0:
-                        continue # Skip contour 
-                        
-                    # Store the data with grid coordinates
-                    point_data = {
-                        'elevation': rounded_elevation,
-                        'latitude': lat,
-                        'longitude': lon,
-                        'x': x,
-                        'y': y
-                    }
-
-                    # Add the point to the appropriate elevation group 
-                    if rounded_elevation not in elevation_groups:
-                        elevation_groups[rounded_elevation] = []
-                    elevation_groups[rounded_elevation].append(point_data)
-
-                # Update min and max elevations
-                self.min_elevation = min(self.min_elevation, rounded_elevation)
-                self.max_elevation = max(self.max_elevation, rounded_elevation)
-        
-        sublayers = []  # List to store sublayers
+            self.fetcher = self.create_fetcher()
+            if self.options.checkpoint:
+                self.open_checkpoint()
+
+    def open_checkpoint(self):
+        path = checkpoint_path(self.document_path(), self.run_key)
+        try:
+            self.checkpoint = FetchCheckpoint(path, self.run_key)
+        except OSError as e:
+            inkex.errormsg(f"Could not write the checkpoint file '{path}', the run cannot be resumed: {str(e)}")
+            return
+        if self.checkpoint.resumed:
+            inkex.utils.debug(f"Resuming an interrupted run: {self.checkpoint.resumed} points read from {path}")
+
+    def close_sources(self):
+        if self.checkpoint is not None:
+            self.checkpoint.close(complete=not self.failed_points)
+            if self.failed_points:
+                inkex.errormsg(f"Completed batches were saved to {self.checkpoint.path}; "
+                               "run the extension again to fetch only the missing points.")
+        if self.cache is not None:
+            total = self.cache.hits + self.cache.misses
+            inkex.utils.debug(f"Elevation cache: {self.cache.hits} of {total} points cached "
+                              f"(hit rate {self.cache.hit_rate:.0%}), {self.fetched_points} fetched from the proxy")
+            self.cache.close()
+        if self.fetcher is not None:
+            self.fetcher.close()
+
+    def sample_nodes(self, rows, cols):
+        """Return the elevations of grid nodes (rows, cols) as float32, from the DEM or the proxy."""
+        rows, cols = np.broadcast_arrays(rows, cols)
+        lat = self.grid_lats[rows]
+        lon = self.grid_lons[cols]
+        if self.dem is not None:
+            return sample_dem(self.dem, lat, lon, self.fraction_x[cols], self.fraction_y[rows]).astype(np.float32)
+        return self.fetch_elevations(lat, lon, rows * len(self.grid_lons) + cols)
+
+    def sample_adaptive(self, shape):
+        """Sample a coarse grid first and refine only where contours need it."""
+        size = shape[0] * shape[1]
+        budget = self.options.point_budget or size
+        elevations, sampled, rounds = adaptive_sample(
+            shape, self.sample_nodes, self.options.coarse_step, budget, self.options.contour_gaps)
+        inkex.utils.debug(f"Adaptive sampling: {sampled} of {size} grid points sampled "
+                          f"in {rounds} rounds, the rest interpolated")
+        return elevations
+
+    def sample_sparse(self, shape):
+        """Sample every sparse_step-th point and spline-interpolate the rest."""
+        size = shape[0] * shape[1]
+        elevations, sampled, errors = sparse_sample(
+            shape, self.sample_nodes, self.options.sparse_step, self.options.holdout_points)
+        inkex.utils.debug(f"Sparse sampling: {sampled} of {size} grid points sampled, the rest interpolated")
+        if errors is not None:
+            rmse, max_error, count = errors
+            inkex.utils.debug(f"Interpolation error on {count} held-out points: "
+                              f"RMS {rmse:.2f} m, max {max_error:.2f} m")
+            if max_error > self.options.contour_gaps:
+                inkex.errormsg(f"The interpolation is off by up to {max_error:.1f} m, more than the contour gap. "
+                               "Lower 'sparse: fetch every...points' for this site.")
+        return elevations
+
+    def fetch_elevations(self, lat, lon, nodes):
+        """Fetch the elevation of the given points and return them as a float32 array.
+
+        ``nodes`` are the grid node indices of the points. Samples found in the
+        on-disk cache or in the checkpoint of an interrupted run are not
+        requested again.
+        """
+        elevations = np.full(np.shape(lat), np.nan, dtype=np.float32)
+        flat = elevations.reshape(-1)
+        nodes = np.ravel(nodes)
+
+        lats = np.ravel(lat)
+        lons = np.ravel(lon)
+
+        if self.cache is not None:
+            flat[:] = self.cache.lookup(lats, lons, tolerance=self.cache_tolerance)
+        missing = np.flatnonzero(np.isnan(flat))
+        if missing.size and self.checkpoint is not None:
+            flat[missing] = self.checkpoint.lookup(nodes[missing])
+            missing = np.flatnonzero(np.isnan(flat))
+
+        if missing.size and self.fetcher is not None:
+            on_batch = None
+            if self.checkpoint is not None:
+                def on_batch(start, stop, values):
+                    self.checkpoint.record(nodes[missing[start:stop]], values)
+            values, failed = self.fetcher.fetch(lats[missing], lons[missing], on_batch=on_batch)
+            self.fetched_points += missing.size
+            self.failed_points += sum(stop - start for start, stop, _ in failed)
+
+            # Results are written back by position, so a dropped batch leaves a hole instead of shifting later points
+            flat[missing] = values
+            if self.cache is not None:
+                self.cache.store(lats[missing], lons[missing], values)
+            self.report_failed_batches(failed, missing, flat.size)
+        return elevations
+
+    def create_fetcher(self):
+        return ProxyElevationFetcher(
+            PROXY_URL,
+            workers=self.options.fetch_workers,
+            timeout=self.options.fetch_timeout,
+            retries=self.options.fetch_retries,
+            max_points=self.options.batch_points,
+            location_format=self.options.location_format
+        )
+
+    def report_failed_batches(self, failed, point_indices, total_points):
+        """List the dropped batches by the grid points they covered."""
+        if not failed:
+            return
+        missing = sum(stop - start for start, stop, _ in failed)
+        inkex.errormsg(f"{len(failed)} elevation batches failed; {missing} of {total_points} grid points have no elevation:")
+        for start, stop, message in failed:
+            inkex.errormsg(f"  points {point_indices[start]}-{point_indices[stop - 1]}: {message}")
+
+    # Legacy contouring (contour_method=nearest), kept for comparison with marching squares.
+    # draw_legacy_contours is its only entry point; the methods below it serve nothing else.
+    def draw_legacy_contours(self, elevation_layer, elevations, xs, ys, threshold):
+        """Chain the near-integer samples of each level into paths (contour_method=nearest)."""
+        elevation_groups = self.group_elevations(elevations, xs, ys)
+        level_paths = {}
 
-        # Create SVG layers and draw circles and lines
         for rounded_elevation, points in elevation_groups.items():
-            # Create a sublayer for each elevation group
-            layer_label = f'{rounded_elevation}m'
-            sublayer = self.create_sublayer(elevation_layer, layer_label)
-
-            # Now, for each point in points, create paths and add them to the sublayer
-            for point in points:
-                # Assume create_path returns an SVG path element for the given point
-                path_element = self.create_path_element([point], "black")
-                sublayer.append(path_element)  # Add the path to the sublayer, not the main layer
-            
-            self.create_paths_for_group(sublayer, points,threshold)
-            self.consolidate_paths(sublayer)
-            sublayers.append((rounded_elevation, sublayer))
-        
-        for _, sublayer in sorted(sublayers, key=lambda x: x[0], reverse=True):
-            elevation_layer.append(sublayer)
+            # One consolidated path per elevation group
+            lines = self.simplify(self.create_paths_for_group(points, threshold))
+            sublayer = self.create_sublayer(elevation_layer, f'{rounded_elevation}m')
+            path = etree.SubElement(sublayer, inkex.addNS('path', 'svg'))
+            path.set('d', smooth_path_data(lines, self.options.precision))
+            path.set('style', "stroke:white;fill:none;stroke-width:0.5")
+            level_paths[rounded_elevation] = path
+
+        self.sort_level_sublayers(elevation_layer, level_paths)
+
+    def group_elevations(self, elevations, xs, ys):
+        """Legacy grouping: keep samples within 0.05 of a whole meter on a contour_gaps level.
+
+        Returns a dict mapping each rounded elevation to an (n, 2) array of x, y positions.
+        """
+        fractional_part = elevations - np.trunc(elevations)
+        keep = np.isfinite(elevations) & ~((fractional_part > 0.05) & (fractional_part < 0.95))
+        rounded = np.round(elevations)
+        keep &= np.fmod(rounded, self.options.contour_gaps) == 0
+
+        rows, cols = np.nonzero(keep)
+        points = np.column_stack((xs[cols], ys[rows]))
+        levels = rounded[rows, cols].astype(int)
+
+        elevation_groups = {}
+        for level in np.unique(levels).tolist():
+            elevation_groups[level] = points[levels == level]
+        return elevation_groups
+
+    def calculate_average_distance(self, points):
+        if len(points) < 2:
+            return 0
+        steps = np.diff(points, axis=0)
+        return float(np.hypot(steps[:, 0], steps[:, 1]).mean())
+
+    def create_paths_for_group(self, points, threshold_multiplier):
+        """Chain the points of one elevation group into polylines (arrays of x, y)."""
+        # Calculate the threshold based on average distance
+        average_distance = self.calculate_average_distance(points)
+        threshold = threshold_multiplier * average_distance
+
+        paths = []
+        index = GridIndex(points)
+
+        for start_index in range(len(points)):
+            if index.removed[start_index]:
+                continue
+
+            path = self.create_path_from_point(points, start_index, index, threshold)
+            if len(path):
+                paths.append(path)
+        return paths
+
+    def create_path_from_point(self, points, start_index, index, threshold):
+        path = [start_index]
+        index.remove(start_index)
+        current_index = start_index
+
+        while True:
+            next_index = self.find_next_closest_point(points[current_index], index, threshold)
+            if next_index is None:
+                break
+            path.append(next_index)
+            index.remove(next_index)
+            current_index = next_index
+
+        return points[path]
+
+    def find_next_closest_point(self, current_point, index, threshold):
+        """Closest unused point within ``threshold`` of ``current_point``, from the grid index."""
+        return index.nearest(float(current_point[0]), float(current_point[1]), threshold)
+
+    def draw_contours(self, elevation_layer, elevations, spacing_x, spacing_y):
+        """Contour the full elevation raster with marching squares, one sublayer per level."""
+        levels = contour_levels(elevations, self.options.contour_gaps)
+        level_paths = {}
+        for level in levels:
+            lines = contour_lines(elevations, level, 0.0, 0.0, spacing_x, spacing_y)
+            self.add_contour_lines(elevation_layer, level_paths, level, lines)
+        self.sort_level_sublayers(elevation_layer, level_paths)
+
+    def stream_contours(self, elevation_layer, spacing_x, spacing_y, row_sinks=()):
+        """Sample and contour the grid stripe by stripe, appending finished lines as they come.
+
+        Only the current stripe and the lines still open at its lower edge are kept in memory.
+        Each new row is also passed to the ``add_rows`` of every row sink (relief, grid store).
+        """
+        n_rows = len(self.grid_lats)
+        n_cols = len(self.grid_lons)
+        stripe_rows = max(1, self.options.stripe_rows)
+        contourer = StripeContourer(n_cols, self.options.contour_gaps, 0.0, 0.0, spacing_x, spacing_y)
+        level_paths = {}
+        previous_row = None
+
+        start = 0
+        while start < n_rows - 1:
+            stop = min(start + stripe_rows, n_rows - 1)
+            # The first row of a stripe is the last row of the previous one
+            rows = np.arange(start if previous_row is None else start + 1, stop + 1)
+            values = self.sample_nodes(rows[:, None], np.arange(n_cols)[None, :])
+            stripe = values if previous_row is None else np.vstack((previous_row, values))
+            for sink in row_sinks:
+                sink.add_rows(values)
+
+            if np.isfinite(stripe).any():
+                self.min_elevation = min(self.min_elevation, float(np.nanmin(stripe)))
+                self.max_elevation = max(self.max_elevation, float(np.nanmax(stripe)))
+
+            finished = contourer.add_stripe(stripe, start, last=stop == n_rows - 1)
+            for level, lines in finished.items():
+                self.add_contour_lines(elevation_layer, level_paths, level, lines)
+
+            previous_row = stripe[-1:]
+            start = stop
+
+        if not level_paths and self.min_elevation == float('inf'):
+            inkex.errormsg("No elevation data could be retrieved for this site.")
+        self.sort_level_sublayers(elevation_layer, level_paths)
+
+    def tile_contours(self, elevation_layer, spacing_x, spacing_y, row_sinks=()):
+        """Sample and contour the grid tile by tile, row of tiles after row of tiles.
+
+        The next tile is fetched while the earlier ones are contoured, in a
+        process pool when ``tile_workers`` > 1. Lines crossing a tile seam are
+        joined once the tiles on both sides are done. Row sinks get each row
+        of tiles as one band, so only that band of elevations is kept.
+        """
+        n_rows = len(self.grid_lats)
+        n_cols = len(self.grid_lons)
+        size = max(2, self.options.tile_size)
+        joiner = SeamJoiner((n_rows, n_cols), size)
+        settings = ((n_rows, n_cols), self.options.contour_gaps, spacing_x, spacing_y, self.options.simplify,
+                    self.options.simplify_tolerance, self.options.precision, self.options.relative_paths)
+        workers = max(1, self.options.tile_workers)
+        pool = ProcessPoolExecutor(workers) if workers > 1 else None
+        in_flight = deque()
+        level_paths = {}
+
+        def collect():
+            finished, seams, nodes_before, nodes_after = in_flight.popleft().result()
+            self.nodes_before += nodes_before
+            self.nodes_after += nodes_after
+            for level, d in finished.items():
+                self.append_path_data(elevation_layer, level_paths, level, d)
+            for level, lines in joiner.add_tile(seams).items():
+                self.add_contour_lines(elevation_layer, level_paths, level, lines)
+
+        try:
+            for row0 in tile_starts(n_rows, size):
+                rows = np.arange(row0, tile_stop(row0, n_rows, size) + 1)
+                band = np.full((len(rows), n_cols), np.nan) if row_sinks else None
+                for col0 in tile_starts(n_cols, size):
+                    cols = np.arange(col0, tile_stop(col0, n_cols, size) + 1)
+                    values = self.sample_nodes(rows[:, None], cols[None, :])
+                    if np.isfinite(values).any():
+                        self.min_elevation = min(self.min_elevation, float(np.nanmin(values)))
+                        self.max_elevation = max(self.max_elevation, float(np.nanmax(values)))
+                    if band is not None:
+                        band[:, cols] = values
+
+                    if pool is None:
+                        in_flight.append(_Done(contour_tile(values, row0, col0, *settings)))
+                    else:
+                        in_flight.append(pool.submit(contour_tile, values, row0, col0, *settings))
+                    while len(in_flight) > 2 * workers - 1:
+                        collect()
+                if band is not None:
+                    # The first row of a band is the last row of the previous one
+                    for sink in row_sinks:
+                        sink.add_rows(band if row0 == 0 else band[1:])
+            while in_flight:
+                collect()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        for level, lines in joiner.flush().items():
+            self.add_contour_lines(elevation_layer, level_paths, level, lines)
+        if not level_paths and self.min_elevation == float('inf'):
+            inkex.errormsg("No elevation data could be retrieved for this site.")
+        self.sort_level_sublayers(elevation_layer, level_paths)
+
+    def create_relief(self, spacing_x_m, spacing_y_m):
+        if not (self.options.hillshade or self.options.slope_classes):
+            return None
+        return ReliefBuilder(spacing_x_m, spacing_y_m, shade=self.options.hillshade, slope=self.options.slope_classes)
+
+    def draw_relief(self, parent_layer, elevation_layer, relief, spacing_x, spacing_y):
+        """Embed the hillshade and slope class images in sublayers below the contours."""
+        shade, slope = relief.finish()
+        images = []
+        if shade is not None:
+            images.append(("hillshade", shade, png_data_uri(shade, transparent=0), "opacity:0.6;mix-blend-mode:multiply"))
+        if slope is not None:
+            images.append(("slope classes", slope, png_data_uri(slope, palette=list(SLOPE_COLORS) + [(0, 0, 0, 0)]),
+                           "image-rendering:optimizeSpeed"))
+
+        for label, pixels, href, style in images:
+            sublayer = self.create_sublayer(parent_layer, label)
+            parent_layer.insert(parent_layer.index(elevation_layer), sublayer)
+            rows, cols = pixels.shape
+            # Each pixel is centred on its grid node
+            image = etree.SubElement(sublayer, inkex.addNS('image', 'svg'))
+            image.set('x', str(-spacing_x / 2))
+            image.set('y', str(-spacing_y / 2))
+            image.set('width', str(cols * spacing_x))
+            image.set('height', str(rows * spacing_y))
+            image.set('preserveAspectRatio', 'none')
+            image.set('style', style)
+            image.set(inkex.addNS('href', 'xlink'), href)
+
+    def add_contour_lines(self, elevation_layer, level_paths, level, lines):
+        """Simplify polylines and append them to the path of their level."""
+        if not lines:
+            return
+        self.append_path_data(elevation_layer, level_paths, level, self.polyline_path_data(self.simplify(lines)))
+
+    def append_path_data(self, elevation_layer, level_paths, level, d):
+        """Append path data to the single path of a level, creating its sublayer when needed."""
+        if not d:
+            return
+        path = level_paths.get(level)
+        if path is None:
+            sublayer = self.create_sublayer(elevation_layer, f'{level:g}m')
+            path = etree.SubElement(sublayer, inkex.addNS('path', 'svg'))
+            path.set('style', "stroke:white;fill:none;stroke-width:0.5")
+            level_paths[level] = path
+        else:
+            d = path.get('d') + " " + d
+        path.set('d', d)
+
+    def sort_level_sublayers(self, elevation_layer, level_paths):
+        """Order the level sublayers highest first, matching the layer order of the legacy mode."""
+        for level in sorted(level_paths, reverse=True):
+            elevation_layer.append(level_paths[level].getparent())
+
+    def simplify(self, lines):
+        """Simplify contour polylines before they are written, counting nodes on the way."""
+        simplified = simplify_lines(lines, self.options.simplify, self.options.simplify_tolerance)
+        self.nodes_before += sum(len(line) for line in lines)
+        self.nodes_after += sum(len(line) for line in simplified)
+        return simplified
+
+    def report_simplification(self):
+        if self.options.simplify != "none" and self.nodes_before:
+            inkex.utils.debug(f"Contour simplification ({self.options.simplify}): {self.nodes_before} nodes "
+                              f"reduced to {self.nodes_after} ({self.nodes_after / self.nodes_before:.0%})")
+
+    def polyline_path_data(self, lines):
+        """Build a compact 'd' attribute holding every polyline as its own subpath."""
+        return polyline_path_data(lines, self.options.precision, self.options.relative_paths)
 
     # Method to find a layer by label
     def find_layer(self, svg_root, label):
@@ -152,48 +603,6 @@ class ElevationMapExtension(inkex.Effect):
                 return layer
         return None
       
-    def draw_circle(self, parent, x, y, lat, lon, elevation):
-        # Create a new circle element with calculated color and opacity
-        circle = etree.SubElement(parent, inkex.addNS('circle', 'svg'))
-        circle.set('style', f'stroke:none;fill:black;fill-opacity:1')
-        circle.set('r', str(self.svg.unittouu('1mm')))
-        circle.set('cx', str(x))
-        circle.set('cy', str(y))
-
-        # Add a title element to the circle to store the coordinates
-        title = etree.SubElement(circle, 'title')
-        title.text = f"Lat: {lat}, Lon: {lon}"
-        return circle
-
-    def fetch_elevation_batch(self, request):
-        try:
-            response = requests.get(request)
-            data = response.json()
-            return [(result['elevation'], result['location']['lat'], result['location']['lng']) for result in data['results']]
-        except requests.exceptions.RequestException as e:
-            inkex.utils.errormsg(str(e))
-            return []
-    
-    def fetch_elevation_batch_proxy(self, locations):
-        """Fetch elevation data via API proxy"""
-        try:
-            response = requests.post(
-                PROXY_URL,
-                json={'endpoint': 'elevation', 'params': {'locations': '|'.join(locations)}},
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
-            data = response.json()
-            if 'results' in data:
-                return [(result['elevation'], result['location']['lat'], result['location']['lng']) for result in data['results']]
-            return []
-        except Exception as e:
-            inkex.utils.errormsg(f"Proxy error: {str(e)}")
-            return []
-    
-    def round_elevation(self, elevation):
-        return round(elevation)
-    
     def get_scale_factor(self):
         svg_root = self.document.getroot()
         # Define the namespace map
@@ -213,135 +622,6 @@ class ElevationMapExtension(inkex.Effect):
             inkex.errormsg("Scale factor not found or has no value.")
             return None
             
-    def distance_between_points(self, p1, p2):
-        return math.sqrt((p1['x'] - p2['x'])**2 + (p1['y'] - p2['y'])**2)
-    
-    def find_closest_point(current_point, points):
-        closest_point = None
-        closest_distance = float('inf')
-        for point in points:
-            if point is current_point:
-                continue  # Skip the current point
-            dist = distance_between_points(current_point, point)
-            if dist < closest_distance:
-                closest_distance = dist
-                closest_point = point
-        return closest_point, closest_distance
-
-    def create_paths(self, points):
-        max_distance = self.options.max_distance  # Define max_distance based on your threshold logic
-        paths = []
-        while points:
-            path = [points.pop(0)]  # Start a new path with the first point
-            while True:
-                # Find the next closest point
-                closest_point, _ = self.find_closest_point(path[-1], points)
-                if not closest_point or self.distance_between_points(path[-1], closest_point) > max_distance:
-                    break  # If no close enough point is found, break the loop
-                path.append(closest_point)  # Add the closest point to the path
-                points.remove(closest_point)  # Remove the closest point from the list
-            paths.append(path)  # Add the completed path to the list of paths
-        return paths
-    
-    def add_paths_to_svg(svg_root, svg_paths, color):
-        for path_data in svg_paths:
-            path_element = etree.Element(inkex.addNS('path', 'svg'))
-            path_element.set('d', path_data)
-            path_element.set('style', f'stroke:{color};fill:none;')
-            svg_root.append(path_element)
-    
-    def calculate_average_distance(self, points):
-        total_distance = 0
-        count = 0
-        for i in range(len(points) - 1):
-            p1 = points[i]
-            p2 = points[i + 1]
-            distance = math.sqrt((p2['x'] - p1['x'])**2 + (p2['y'] - p1['y'])**2)
-            total_distance += distance
-            count += 1
-        return total_distance / count if count else 0
-
-    def create_paths_for_group(self, layer, points, threshold_multiplier):
-        # Calculate the threshold based on average distance
-        average_distance = self.calculate_average_distance(points)
-        threshold = threshold_multiplier * average_distance
-        
-        paths = []
-        used_points = set()
-        
-        for point in points:
-            if (point['x'], point['y']) in used_points:
-                continue
-
-            path = self.create_path_from_point(points, point, used_points, threshold)
-            if path:
-                path_element = self.create_path_element(path, "black")
-                layer.append(path_element)
-                paths.append({'d': path_element.get('d'), 'elevation': path[0]['elevation']})
-
-        
-    
-    def remove_circles_from_layer(self, layer):
-        # Find all circle elements in the layer and remove them
-        circles = layer.findall('.//{http://www.w3.org/2000/svg}circle')
-        for circle in circles:
-            layer.remove(circle)
-
-    def create_path_from_point(self, points, start_point, used_points, threshold):
-        path = [start_point]
-        used_points.add((start_point['x'], start_point['y']))
-        current_point = start_point
-
-        while True:
-            next_point = self.find_next_closest_point(current_point, points, used_points)
-            if not next_point or self.distance_between_points(current_point, next_point) > threshold:
-                break
-            path.append(next_point)
-            used_points.add((next_point['x'], next_point['y']))
-            current_point = next_point
-
-        return path
-
-    def find_next_closest_point(self, current_point, points, used_points):
-        closest_point = None
-        closest_distance = float('inf')
-        for point in points:
-            if (point['x'], point['y']) in used_points:
-                continue
-            distance = self.distance_between_points(point, current_point)
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_point = point
-        return closest_point
-
-    def create_path_element(self, points, color):
-        if not points:
-            return None
-        
-        # Start the path with the first point
-        d = f"M {points[0]['x']},{points[0]['y']} "
-
-        # Create the rest of the path using Bezier curves
-        for i in range(1, len(points) - 1):
-            # Calculate midpoints
-            mid_x1 = (points[i-1]['x'] + points[i]['x']) / 2
-            mid_y1 = (points[i-1]['y'] + points[i]['y']) / 2
-            mid_x2 = (points[i]['x'] + points[i+1]['x']) / 2
-            mid_y2 = (points[i]['y'] + points[i+1]['y']) / 2
-
-            # Use the midpoints as control points
-            d += f"Q {points[i]['x']},{points[i]['y']} {mid_x2},{mid_y2} "
-
-        # Add the last point with a quadratic Bezier curve to make the end smooth
-        d += f"Q {points[-1]['x']},{points[-1]['y']} {points[-1]['x']},{points[-1]['y']}"
-
-        # Create the path element
-        path = etree.Element(inkex.addNS('path', 'svg'), {
-            'd': d,
-            'style': f'stroke:{color};fill:none;stroke-width:1;stroke-linecap:round;stroke-linejoin:round;'
-        })
-        return path
-
     def create_parent_layer(self, svg_root, layer_name="elevation"):
         # Check if the parent layer already exists
         parent_layer = self.find_layer(svg_root, layer_name)
@@ -359,19 +639,15 @@ class ElevationMapExtension(inkex.Effect):
         sublayer.set(inkex.addNS('groupmode', 'inkscape'), 'layer')
         return sublayer
     
-    def consolidate_paths(self, sublayer):
-        # Get all path elements
-        paths = sublayer.findall('.//{http://www.w3.org/2000/svg}path')
-        # Initialize an empty string for the 'd' attribute
-        consolidated_d = ""
-        # Loop through all paths and concatenate their 'd' attributes
-        for path in paths:
-            consolidated_d += path.get('d') + " "
-            sublayer.remove(path)  # Remove the individual path
-        # Create a new path element with the consolidated 'd' attribute
-        new_path = etree.SubElement(sublayer, inkex.addNS('path', 'svg'))
-        new_path.set('d', consolidated_d.strip())
-        new_path.set('style', "stroke:white;fill:none;stroke-width:0.5")  # Set the style as needed
-    
+class _Done:
+    """A finished result with the interface of a Future, for tiles contoured in this process."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
 if __name__ == '__main__':
     ElevationMapExtension().run()
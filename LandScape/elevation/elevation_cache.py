@@ -0,0 +1,190 @@
+"""Persistent on-disk cache of elevation samples keyed by quantized lat/lon.
+
+Samples are kept at the position they were fetched at, rounded to about
+1 cm, whatever site or grid they came from. A point is served from the
+cache when a sample lies within the lookup tolerance of it, so a later run
+reuses the samples its own grid nodes land on or next to. Every sample is
+also filed under a bucket of about 1 m, so the samples near a point are
+found in its bucket and the eight around it.
+"""
+import math
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# Samples are stored at their lat/lon rounded to this many degrees (about 1 cm)
+QUANTUM_DEGREES = 1e-7
+# Lookup buckets, in quanta (1e-5 degrees, about 1.1 m north-south)
+BUCKET_QUANTA = 100
+# Meters per degree of latitude
+METERS_PER_DEGREE = 111139
+
+# Bumped whenever the meaning of the stored keys changes
+SCHEMA_VERSION = 3
+
+
+def default_cache_path():
+    """Per-user cache location; LANDSCAPE_CACHE_DIR overrides it."""
+    cache_dir = os.environ.get('LANDSCAPE_CACHE_DIR')
+    if not cache_dir:
+        if os.name == 'nt':
+            base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+            cache_dir = os.path.join(base, 'LandScape')
+        else:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'landscape')
+    return os.path.join(cache_dir, 'elevation_cache.sqlite')
+
+
+def quantize(lat, lon, quantum=QUANTUM_DEGREES):
+    """Return the integer cache keys of the given coordinates."""
+    qlat = np.rint(np.asarray(lat, dtype=np.float64) / quantum).astype(np.int64)
+    qlon = np.rint(np.asarray(lon, dtype=np.float64) / quantum).astype(np.int64)
+    return qlat, qlon
+
+
+def buckets(qlat, qlon):
+    """Lookup buckets of quantized coordinates."""
+    return np.floor_divide(qlat, BUCKET_QUANTA), np.floor_divide(qlon, BUCKET_QUANTA)
+
+
+class ElevationCache:
+    """SQLite store of elevation samples with least-recently-used eviction.
+
+    ``max_bytes`` bounds the database size; when it is exceeded the oldest
+    samples are dropped until the cache is back under 80% of the limit.
+    """
+
+    def __init__(self, path=None, max_bytes=200 * 1024 * 1024, quantum=QUANTUM_DEGREES):
+        self.path = path or default_cache_path()
+        self.max_bytes = max_bytes
+        self.quantum = quantum
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # Samples keyed with another quantum would be read at the wrong place
+            self.db.execute("DROP TABLE IF EXISTS samples")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            " qlat INTEGER NOT NULL, qlon INTEGER NOT NULL,"
+            " blat INTEGER NOT NULL, blon INTEGER NOT NULL,"
+            " elevation REAL NOT NULL, used INTEGER NOT NULL,"
+            " PRIMARY KEY (qlat, qlon)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS samples_bucket ON samples (blat, blon)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS samples_used ON samples (used)")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def lookup(self, lat, lon, tolerance=0.0):
+        """Return cached elevations for the given points, NaN where missing.
+
+        A point takes a sample at its own position (to the quantum), else the
+        nearest sample within ``tolerance`` meters of it; the tolerance is
+        capped at the bucket size.
+        """
+        lat = np.asarray(lat, dtype=np.float64).ravel()
+        qlat, qlon = quantize(lat, np.ravel(lon), self.quantum)
+        values = np.full(qlat.shape, np.nan)
+        if not qlat.size:
+            return values
+
+        rows = self.select("SELECT w.idx, s.qlat, s.qlon, s.elevation FROM temp.wanted w"
+                           " JOIN samples s ON s.qlat = w.a AND s.qlon = w.b",
+                           np.arange(qlat.size), qlat, qlon)
+        used = [rows[:, 1:3]]
+        values[rows[:, 0].astype(np.int64)] = rows[:, 3]
+
+        remaining = np.flatnonzero(np.isnan(values))
+        reach = min(tolerance / (METERS_PER_DEGREE * self.quantum), BUCKET_QUANTA * math.cos(math.radians(lat.max())))
+        if remaining.size and reach >= 1:
+            blat, blon = buckets(qlat[remaining], qlon[remaining])
+            rows = self.select("SELECT w.idx, s.qlat, s.qlon, s.elevation FROM temp.wanted w"
+                               " JOIN samples s ON s.blat IN (w.a - 1, w.a, w.a + 1)"
+                               " AND s.blon IN (w.b - 1, w.b, w.b + 1)",
+                               remaining, blat, blon)
+            idx = rows[:, 0].astype(np.int64)
+            # Distances in quanta of latitude, longitude shrunk with the parallel
+            distance = np.hypot(rows[:, 1] - qlat[idx], (rows[:, 2] - qlon[idx]) * np.cos(np.radians(lat[idx])))
+            near = np.flatnonzero(distance <= reach)
+            # The nearest sample of each point
+            near = near[np.lexsort((distance[near], idx[near]))]
+            near = near[np.diff(idx[near], prepend=-1) != 0]
+            values[idx[near]] = rows[near, 3]
+            used.append(rows[near, 1:3])
+
+        used = np.vstack(used).astype(np.int64)
+        if used.size:
+            self.select("UPDATE samples SET used = ? WHERE (qlat, qlon) IN (SELECT a, b FROM temp.wanted)",
+                        np.arange(len(used)), used[:, 0], used[:, 1], parameters=(int(time.time()),))
+            self.db.commit()
+
+        hits = int(np.count_nonzero(np.isfinite(values)))
+        self.hits += hits
+        self.misses += qlat.size - hits
+        return values
+
+    def select(self, query, idx, a, b, parameters=()):
+        """Run a query against the temporary table ``wanted (idx, a, b)`` filled with the given columns.
+
+        Returns the result rows as a float array (empty, with four columns, when there are none).
+        """
+        db = self.db
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (idx INTEGER PRIMARY KEY, a INTEGER, b INTEGER)")
+        db.execute("DELETE FROM temp.wanted")
+        db.executemany("INSERT INTO temp.wanted VALUES (?, ?, ?)", zip(idx.tolist(), a.tolist(), b.tolist()))
+        rows = db.execute(query, parameters).fetchall()
+        return np.array(rows, dtype=np.float64).reshape(-1, 4)
+
+    def store(self, lat, lon, elevations):
+        """Add samples to the cache; NaN elevations are skipped."""
+        qlat, qlon = quantize(lat, lon, self.quantum)
+        qlat, qlon = qlat.ravel(), qlon.ravel()
+        blat, blon = buckets(qlat, qlon)
+        elevations = np.asarray(elevations, dtype=np.float64).ravel()
+        keep = np.isfinite(elevations)
+        now = int(time.time())
+        self.db.executemany(
+            "INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?)",
+            ((a, b, c, d, e, now) for a, b, c, d, e in zip(qlat[keep].tolist(), qlon[keep].tolist(),
+                                                           blat[keep].tolist(), blon[keep].tolist(),
+                                                           elevations[keep].tolist()))
+        )
+        self.db.commit()
+        self.evict()
+
+    def size_bytes(self):
+        page_size = self.db.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self.db.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self.db.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def evict(self):
+        """Drop the least recently used samples once the size limit is exceeded."""
+        size = self.size_bytes()
+        if size <= self.max_bytes:
+            return
+        count = self.db.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+        target = 0.8 * self.max_bytes
+        drop = int(count * (size - target) / size) + 1
+        self.db.execute(
+            "DELETE FROM samples WHERE (qlat, qlon) IN"
+            " (SELECT qlat, qlon FROM samples ORDER BY used LIMIT ?)",
+            (drop,)
+        )
+        self.db.commit()
+        self.db.executescript("PRAGMA incremental_vacuum;")
@@ -0,0 +1,127 @@
+"""The sampled elevation grid, kept in the document metadata.
+
+The elevation extension stores its grid as ``svg:metadata/inkscape:elevationgrid``
+so the water, earthworks and shadow extensions can use the terrain without
+sampling it again. The element holds the grid geometry as attributes and the
+elevations as text: centimetres as little-endian int32, each row stored as
+differences along the row, zlib compressed and base64 encoded. Missing
+samples are stored as the smallest int32.
+
+Other extensions import this module by adding the elevation folder to
+``sys.path``.
+"""
+import base64
+import zlib
+
+import inkex
+import numpy as np
+from lxml import etree
+
+GRID_TAG = 'elevationgrid'
+GRID_ENCODING = 'int32-cm-rowdelta-zlib-base64'
+NODATA = np.iinfo(np.int32).min
+
+
+class ElevationGrid:
+    """Elevations on a regular grid: node (row, col) sits at (x0 + col * dx, y0 + row * dy).
+
+    Positions are in document units; ``scale`` is document units per meter.
+    """
+
+    def __init__(self, z, x0, y0, dx, dy, scale):
+        self.z = z
+        self.x0, self.y0, self.dx, self.dy = x0, y0, dx, dy
+        self.scale = scale
+
+    @property
+    def shape(self):
+        return self.z.shape
+
+    @property
+    def spacing_m(self):
+        """Node spacing in meters, (x, y)."""
+        return self.dx / self.scale, self.dy / self.scale
+
+    def to_document(self, rows, cols):
+        return self.x0 + np.asarray(cols) * self.dx, self.y0 + np.asarray(rows) * self.dy
+
+    def to_grid(self, x, y):
+        """Fractional (row, col) of document positions."""
+        return (np.asarray(y, dtype=np.float64) - self.y0) / self.dy, (np.asarray(x, dtype=np.float64) - self.x0) / self.dx
+
+    def nearest_node(self, x, y):
+        rows, cols = self.to_grid(x, y)
+        n_rows, n_cols = self.shape
+        return (np.clip(np.rint(rows), 0, n_rows - 1).astype(np.int64),
+                np.clip(np.rint(cols), 0, n_cols - 1).astype(np.int64))
+
+    def sample(self, x, y):
+        """Bilinear elevation at document positions, NaN outside the grid."""
+        rows, cols = self.to_grid(x, y)
+        n_rows, n_cols = self.shape
+        inside = (rows >= 0) & (rows <= n_rows - 1) & (cols >= 0) & (cols <= n_cols - 1)
+        r0 = np.clip(np.floor(rows), 0, max(n_rows - 2, 0)).astype(np.int64)
+        c0 = np.clip(np.floor(cols), 0, max(n_cols - 2, 0)).astype(np.int64)
+        r1 = np.minimum(r0 + 1, n_rows - 1)
+        c1 = np.minimum(c0 + 1, n_cols - 1)
+        fr = np.clip(rows - r0, 0, 1)
+        fc = np.clip(cols - c0, 0, 1)
+        z = self.z
+        upper = z[r0, c0] * (1 - fc) + z[r0, c1] * fc
+        lower = z[r1, c0] * (1 - fc) + z[r1, c1] * fc
+        return np.where(inside, upper * (1 - fr) + lower * fr, np.nan)
+
+
+class GridEncoder:
+    """Encode grid rows as they arrive, so streaming runs never hold the whole grid."""
+
+    def __init__(self):
+        self.compressor = zlib.compressobj(9)
+        self.parts = []
+        self.rows = 0
+        self.cols = None
+
+    def add_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        centimetres = np.where(np.isfinite(rows), np.rint(rows * 100), NODATA).astype(np.int64)
+        # Differences wrap around in int32 and the cumulative sum unwraps them exactly
+        deltas = np.diff(centimetres, axis=1, prepend=0).astype(np.int32)
+        self.parts.append(self.compressor.compress(deltas.astype('<i4').tobytes()))
+        self.rows += rows.shape[0]
+        self.cols = rows.shape[1]
+
+    def text(self):
+        self.parts.append(self.compressor.flush())
+        return base64.b64encode(b''.join(self.parts)).decode('ascii')
+
+
+def write_grid(svg_root, encoder, x0, y0, dx, dy):
+    """Store the encoded grid in the document metadata, replacing an older one."""
+    metadata = svg_root.find('svg:metadata', inkex.NSS)
+    if metadata is None:
+        metadata = etree.SubElement(svg_root, inkex.addNS('metadata', 'svg'))
+    for old in metadata.findall(f'inkscape:{GRID_TAG}', inkex.NSS):
+        metadata.remove(old)
+    element = etree.SubElement(metadata, inkex.addNS(GRID_TAG, 'inkscape'))
+    for name, value in (('rows', encoder.rows), ('cols', encoder.cols),
+                        ('x0', x0), ('y0', y0), ('dx', dx), ('dy', dy)):
+        element.set(name, str(value))
+    element.set('encoding', GRID_ENCODING)
+    element.text = encoder.text()
+    return element
+
+
+def read_grid(svg_root, scale):
+    """The grid stored by the elevation extension, or None when there is none."""
+    element = svg_root.find(f'svg:metadata/inkscape:{GRID_TAG}', inkex.NSS)
+    if element is None or not element.text:
+        return None
+    if element.get('encoding') != GRID_ENCODING:
+        raise ValueError(f"Unknown elevation grid encoding '{element.get('encoding')}'")
+    rows = int(element.get('rows'))
+    cols = int(element.get('cols'))
+    deltas = np.frombuffer(zlib.decompress(base64.b64decode(element.text)), dtype='<i4').reshape(rows, cols)
+    centimetres = np.cumsum(deltas, axis=1, dtype=np.int32)
+    z = np.where(centimetres == NODATA, np.nan, centimetres / 100.0)
+    return ElevationGrid(z, float(element.get('x0')), float(element.get('y0')),
+                         float(element.get('dx')), float(element.get('dy')), scale)
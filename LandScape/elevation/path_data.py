@@ -0,0 +1,61 @@
+"""Compact SVG path data for contour polylines."""
+import numpy as np
+
+
+def format_numbers(values, precision):
+    """Format numbers with at most ``precision`` decimals and no trailing zeros."""
+    text = [f"{v:.{precision}f}" for v in values]
+    if precision > 0:
+        text = [t.rstrip('0').rstrip('.') for t in text]
+    return ['0' if t == '-0' else t for t in text]
+
+
+def polyline_path_data(lines, precision=2, relative=True):
+    """Build one 'd' string holding every polyline as its own subpath.
+
+    Coordinates are rounded to ``precision`` decimals first; relative steps
+    are taken between the rounded points so they never drift. Steps that
+    round to zero length are dropped and closed rings end with 'z'.
+    """
+    scale = 10 ** precision
+    parts = []
+    for line in lines:
+        points = np.rint(np.asarray(line) * scale).astype(np.int64)
+        closed = len(points) > 2 and (points[0] == points[-1]).all()
+        steps = np.diff(points, axis=0)
+        moving = np.flatnonzero(steps.any(axis=1))
+        if closed:
+            moving = moving[:-1]
+        if relative:
+            values = np.vstack((points[:1], steps[moving]))
+        else:
+            values = np.vstack((points[:1], points[moving + 1]))
+        if len(values) < 2:
+            continue
+        text = format_numbers((values.ravel() / scale).tolist(), precision)
+        pairs = [f"{x},{y}" for x, y in zip(text[::2], text[1::2])]
+        command = 'l' if relative else 'L'
+        parts.append(f"M {pairs[0]} {command} {' '.join(pairs[1:])}{' z' if closed else ''}")
+    return " ".join(parts)
+
+
+def smooth_path_data(lines, precision=2):
+    """Quadratic Bezier path through each polyline, used by the legacy chaining.
+
+    Every inner point becomes a control point and the curve runs through
+    the midpoints between consecutive points.
+    """
+    parts = []
+    for line in lines:
+        points = np.asarray(line, dtype=np.float64)
+        if len(points) == 0:
+            continue
+        # Control points, each followed by the midpoint to the next point;
+        # the last point closes the curve on itself
+        controls = np.vstack((points[1:-1], points[-1:]))
+        ends = np.vstack(((points[1:-1] + points[2:]) / 2, points[-1:]))
+        text = format_numbers(np.hstack((controls, ends)).ravel().tolist(), precision)
+        curves = [f"Q {a},{b} {c},{d}" for a, b, c, d in zip(text[::4], text[1::4], text[2::4], text[3::4])]
+        start = format_numbers(points[0].tolist(), precision)
+        parts.append(f"M {start[0]},{start[1]} " + " ".join(curves))
+    return " ".join(parts)
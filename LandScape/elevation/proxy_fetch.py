@@ -0,0 +1,260 @@
+"""Pooled, concurrent elevation fetching through the LandScape API proxy.
+
+Batches are planned as they are sent: each one takes as many locations as fit
+both the per-request location limit and the length limit of the locations
+string, which the proxy passes on in a GET URL. Locations are written either
+as plain "lat,lon" pairs without trailing zeros, or as one encoded polyline
+("enc:...", about 1 m precision) that takes a few characters per point.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: throttling and transient server errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Replies to a request that is too big; the batch is split in two
+TOO_LARGE_STATUS = {413, 414}
+
+# Google Elevation API limit of locations per request
+MAX_BATCH_POINTS = 512
+# Locations string length, leaving room in the 16 kB URL the proxy builds
+MAX_BATCH_CHARS = 8000
+
+POLYLINE_PREFIX = 'enc:'
+
+
+class BatchFetchError(Exception):
+    """A batch could not be fetched, even after retrying."""
+
+
+class BatchTooLarge(BatchFetchError):
+    """The proxy rejected a batch for its size."""
+
+
+def format_locations(lats, lons):
+    """Plain "lat,lon" strings with seven decimals at most and no trailing zeros."""
+    def number(value):
+        text = f"{value:.7f}".rstrip('0').rstrip('.')
+        return '0' if text == '-0' else text
+    return [f"{number(lat)},{number(lon)}" for lat, lon in zip(lats, lons)]
+
+
+def polyline_deltas(lats, lons):
+    """Encoded-polyline integer steps: every point relative to the one before."""
+    points = np.column_stack((np.rint(np.asarray(lats) * 1e5), np.rint(np.asarray(lons) * 1e5))).astype(np.int64)
+    return np.diff(points, axis=0, prepend=0)
+
+
+def encoded_lengths(values):
+    """Characters the polyline encoding uses for each signed integer."""
+    values = np.asarray(values, dtype=np.int64)
+    zigzag = np.where(values < 0, ~(values << 1), values << 1)
+    return 1 + sum((zigzag >= 32 ** k).astype(np.int64) for k in range(1, 7))
+
+
+def encode_polyline(lats, lons):
+    """Google encoded polyline of the points (1e-5 degree precision)."""
+    chars = []
+    for value in polyline_deltas(lats, lons).ravel().tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return ''.join(chars)
+
+
+class ProxyElevationFetcher:
+    """Fetch elevations in batches over one pooled HTTP session.
+
+    Batches run on up to ``workers`` threads. Each batch is retried with
+    exponential backoff on timeouts, connection errors, 429 and 5xx replies.
+    A 429 reply also halves the number of requests in flight, which then
+    grows back by one for every run of successful requests. A batch rejected
+    for its size is split in two and later batches are planned smaller.
+    """
+
+    def __init__(self, proxy_url, workers=4, timeout=30, retries=3, backoff=0.5,
+                 max_points=MAX_BATCH_POINTS, max_chars=MAX_BATCH_CHARS, location_format='plain'):
+        self.proxy_url = proxy_url
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_points = max(1, min(max_points, MAX_BATCH_POINTS))
+        self.max_chars = max_chars
+        self.location_format = location_format
+        self.requests_made = 0
+        self._lock = threading.Lock()
+
+        # Requests allowed in flight; lowered while the proxy throttles
+        self.concurrency = self.workers
+        self.in_flight = 0
+        self.successes = 0
+        self._slots = threading.Condition()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    def close(self):
+        self.session.close()
+
+    def location_param(self, lats, lons):
+        if self.location_format == 'polyline':
+            return POLYLINE_PREFIX + encode_polyline(lats, lons)
+        return '|'.join(format_locations(lats, lons))
+
+    def location_costs(self, lats, lons):
+        """Characters each point adds to the locations string: ``(as first point, after another)``."""
+        if self.location_format == 'polyline':
+            deltas = polyline_deltas(lats, lons)
+            # A batch's first point is encoded whole, the others as steps
+            first = len(POLYLINE_PREFIX) + encoded_lengths(deltas.cumsum(axis=0)).sum(axis=1)
+            return first, encoded_lengths(deltas).sum(axis=1)
+        first = np.array([len(text) for text in format_locations(lats, lons)], dtype=np.int64)
+        return first, first + 1
+
+    def next_batch(self, start, first, costs):
+        """End of the batch starting at ``start`` that fits the current limits."""
+        stop = start + 1
+        chars = first[start]
+        limit = min(len(costs), start + self.max_points)
+        while stop < limit and chars + costs[stop] <= self.max_chars:
+            chars += costs[stop]
+            stop += 1
+        return stop
+
+    def shrink(self, size):
+        """Plan smaller batches after the proxy rejected one of ``size`` locations."""
+        with self._lock:
+            self.max_points = max(1, min(self.max_points, size // 2))
+
+    def acquire_slot(self):
+        with self._slots:
+            while self.in_flight >= self.concurrency:
+                self._slots.wait()
+            self.in_flight += 1
+
+    def release_slot(self, throttled):
+        with self._slots:
+            self.in_flight -= 1
+            if throttled:
+                self.concurrency = max(1, self.concurrency // 2)
+                self.successes = 0
+            elif self.concurrency < self.workers:
+                self.successes += 1
+                if self.successes >= self.concurrency:
+                    self.concurrency += 1
+                    self.successes = 0
+            self._slots.notify_all()
+
+    def fetch_batch(self, lats, lons):
+        """Return the elevations for one batch of points, in order."""
+        params = {'locations': self.location_param(lats, lons)}
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            throttled = False
+            self.acquire_slot()
+            try:
+                with self._lock:
+                    self.requests_made += 1
+                response = self.session.post(
+                    self.proxy_url,
+                    json={'endpoint': 'elevation', 'params': params},
+                    timeout=self.timeout
+                )
+                if response.status_code in TOO_LARGE_STATUS:
+                    raise BatchTooLarge(f"HTTP {response.status_code} for {len(lats)} locations")
+                if response.status_code in RETRY_STATUS:
+                    error = f"HTTP {response.status_code}"
+                    retry_after = response.headers.get('Retry-After')
+                    throttled = response.status_code == 429
+                else:
+                    response.raise_for_status()
+                    data = response.json()
+                    results = data.get('results')
+                    if results is None:
+                        raise BatchFetchError(f"proxy returned no results ({data.get('status', 'unknown status')})")
+                    if len(results) != len(lats):
+                        raise BatchFetchError(f"expected {len(lats)} results, got {len(results)}")
+                    return [result['elevation'] for result in results]
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                error = str(e)
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                raise BatchFetchError(str(e))
+            finally:
+                self.release_slot(throttled)
+
+            if attempt < self.retries:
+                time.sleep(self.retry_delay(attempt, retry_after))
+        raise BatchFetchError(f"gave up after {self.retries + 1} attempts: {error}")
+
+    def retry_delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+
+    def fetch(self, lats, lons, on_batch=None):
+        """Fetch the elevation of every point and return ``(elevations, failed)``.
+
+        ``elevations`` is a float array in the order of the points with NaN
+        for every point of a batch that failed. ``failed`` lists
+        ``(start, stop, message)`` for each dropped batch. ``on_batch(start,
+        stop, values)`` is called on the calling thread as each batch completes.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        elevations = np.full(len(lats), np.nan)
+        failed = []
+        first, costs = self.location_costs(lats, lons)
+        cursor = 0
+        # Halves of batches that were rejected for their size go first
+        split = deque()
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                while len(running) < self.workers and (split or cursor < len(lats)):
+                    if split:
+                        start, stop = split.popleft()
+                    else:
+                        start, stop = cursor, self.next_batch(cursor, first, costs)
+                        cursor = stop
+                    future = pool.submit(self.fetch_batch, lats[start:stop], lons[start:stop])
+                    running[future] = (start, stop)
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, stop = running.pop(future)
+                    try:
+                        elevations[start:stop] = future.result()
+                    except BatchTooLarge as e:
+                        if stop - start > 1:
+                            self.shrink(stop - start)
+                            middle = (start + stop) // 2
+                            split.extend(((start, middle), (middle, stop)))
+                        else:
+                            failed.append((start, stop, str(e)))
+                        continue
+                    except BatchFetchError as e:
+                        failed.append((start, stop, str(e)))
+                        continue
+                    if on_batch is not None:
+                        on_batch(start, stop, elevations[start:stop])
+
+        failed.sort()
+        return elevations, failed
@@ -0,0 +1,137 @@
+"""Shaded relief and slope classes from the elevation grid.
+
+Both come from one Horn (3x3) gradient of the grid and are written as small
+embedded PNG images: an 8-bit grey hillshade and a palette image of slope
+classes. Rows can be fed a stripe at a time, so streaming runs get the same
+images without keeping the elevations in memory.
+"""
+import base64
+import math
+import struct
+import zlib
+
+import numpy as np
+
+# Upper bounds of the slope classes, in percent, and their colours (RGBA).
+# The last class takes everything steeper.
+SLOPE_BREAKS = (2, 5, 10, 15, 25)
+SLOPE_COLORS = (
+    (26, 152, 80, 150),    # < 2%: flat, ponding
+    (145, 207, 96, 150),   # 2-5%: gentle, easy keyline and swales
+    (217, 239, 139, 150),  # 5-10%
+    (254, 224, 139, 150),  # 10-15%: upper limit for swales
+    (252, 141, 89, 150),   # 15-25%: terraces
+    (215, 48, 39, 150),    # > 25%: steep, keep forested
+)
+NODATA_INDEX = len(SLOPE_COLORS)
+
+
+def horn_gradient(z, dx, dy):
+    """Elevation change per meter towards the east and the north.
+
+    ``z`` holds one halo row above and below the rows to compute; columns are
+    padded by repeating the edge. ``dx``/``dy`` are the grid spacing in meters.
+    """
+    p = np.pad(z, ((0, 0), (1, 1)), mode='edge')
+    a, b, c = p[:-2, :-2], p[:-2, 1:-1], p[:-2, 2:]
+    d, f = p[1:-1, :-2], p[1:-1, 2:]
+    g, h, i = p[2:, :-2], p[2:, 1:-1], p[2:, 2:]
+    east = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * dx)
+    # Rows run from north to south
+    north = ((a + 2 * b + c) - (g + 2 * h + i)) / (8 * dy)
+    return east, north
+
+
+def hillshade(east, north, azimuth=315.0, altitude=45.0):
+    """Grey levels 1-255 of the lit surface, 0 where there is no data."""
+    azimuth = math.radians(azimuth)
+    altitude = math.radians(altitude)
+    light = (math.sin(azimuth) * math.cos(altitude), math.cos(azimuth) * math.cos(altitude), math.sin(altitude))
+    shade = (light[2] - east * light[0] - north * light[1]) / np.sqrt(1 + east ** 2 + north ** 2)
+    grey = np.clip(np.rint(1 + 254 * np.clip(shade, 0, 1)), 1, 255)
+    return np.where(np.isfinite(shade), grey, 0).astype(np.uint8)
+
+
+def slope_classes(east, north):
+    """Slope class index of every node (see SLOPE_BREAKS)."""
+    percent = 100 * np.hypot(east, north)
+    classes = np.searchsorted(np.asarray(SLOPE_BREAKS, dtype=np.float64), percent, side='right')
+    return np.where(np.isfinite(percent), classes, NODATA_INDEX).astype(np.uint8)
+
+
+def png_data_uri(pixels, palette=None, transparent=None):
+    """Encode an 8-bit image as a ``data:image/png;base64`` URI.
+
+    ``pixels`` is a 2-D uint8 array: grey levels, or palette indices when
+    ``palette`` (a list of RGBA tuples) is given. ``transparent`` is the grey
+    level drawn fully transparent. Rows use the PNG 'up' filter, which packs
+    smooth rasters well.
+    """
+    height, width = pixels.shape
+    filtered = np.empty((height, width + 1), dtype=np.uint8)
+    filtered[:, 0] = 2
+    filtered[:, 1:] = pixels
+    filtered[1:, 1:] -= pixels[:-1]
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    color_type = 3 if palette is not None else 0
+    parts = [chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))]
+    if palette is not None:
+        parts.append(chunk(b'PLTE', bytes(v for color in palette for v in color[:3])))
+        parts.append(chunk(b'tRNS', bytes(color[3] for color in palette)))
+    elif transparent is not None:
+        parts.append(chunk(b'tRNS', struct.pack('>H', transparent)))
+    parts.append(chunk(b'IDAT', zlib.compress(filtered.tobytes(), 9)))
+    parts.append(chunk(b'IEND', b''))
+    png = b'\x89PNG\r\n\x1a\n' + b''.join(parts)
+    return "data:image/png;base64," + base64.b64encode(png).decode('ascii')
+
+
+class ReliefBuilder:
+    """Compute hillshade and slope class rows from elevation rows fed in order.
+
+    ``add_rows`` takes the next rows of the grid (float, NaN for no data);
+    ``finish`` returns the ``(hillshade, slope_classes)`` images, None for the
+    ones not asked for. The two last rows are held back until their
+    southern neighbours arrive.
+    """
+
+    def __init__(self, dx, dy, shade=True, slope=True, azimuth=315.0, altitude=45.0):
+        self.dx, self.dy = dx, dy
+        self.shade = shade
+        self.slope = slope
+        self.azimuth, self.altitude = azimuth, altitude
+        self.buffer = None
+        self.shade_rows = []
+        self.slope_rows = []
+
+    def add_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        if self.buffer is None:
+            # The first row is its own northern neighbour
+            self.buffer = np.vstack((rows[:1], rows))
+        else:
+            self.buffer = np.vstack((self.buffer, rows))
+        self.flush()
+
+    def flush(self):
+        if len(self.buffer) < 3:
+            return
+        east, north = horn_gradient(self.buffer, self.dx, self.dy)
+        if self.shade:
+            self.shade_rows.append(hillshade(east, north, self.azimuth, self.altitude))
+        if self.slope:
+            self.slope_rows.append(slope_classes(east, north))
+        self.buffer = self.buffer[-2:]
+
+    def finish(self):
+        if self.buffer is not None:
+            # The last row is its own southern neighbour
+            self.buffer = np.vstack((self.buffer, self.buffer[-1:]))
+            self.flush()
+            self.buffer = None
+        shade = np.vstack(self.shade_rows) if self.shade_rows else None
+        slope = np.vstack(self.slope_rows) if self.slope_rows else None
+        return shade, slope
@@ -0,0 +1,253 @@
+"""Reduced sampling of the elevation grid.
+
+Adaptive sampling samples a coarse grid first. Each round then splits the
+grid cells that a contour level passes through into four, sampling the new
+cell corners, until no cell needs more detail or the point budget is used
+up. Grid points that were never sampled are filled by bilinear
+interpolation inside their cell.
+
+Sparse sampling samples every ``step``-th node only and fills the rest with
+a tensor product natural cubic spline. The spline is not local, so a knot
+whose sample failed is first filled from its neighbours; otherwise a single
+gap would bend the surface along its whole row and column.
+"""
+import numpy as np
+
+
+def grid_knots(n, step):
+    """Every ``step``-th index of an axis of length ``n``, always including the last one."""
+    knots = np.arange(0, n, step)
+    if knots[-1] != n - 1:
+        knots = np.append(knots, n - 1)
+    return knots
+
+
+def adaptive_sample(shape, sample, coarse_step, budget, gap):
+    """Sample a raster of ``shape`` adaptively.
+
+    ``sample(rows, cols)`` returns the elevations at the given grid indices.
+    ``budget`` caps the number of sampled points (the coarse grid is always
+    sampled in full) and ``gap`` is the contour interval that decides which
+    cells are refined.
+
+    Returns ``(elevations, sampled_points, rounds)``.
+    """
+    n_rows, n_cols = shape
+    elevations = np.full(shape, np.nan, dtype=np.float32)
+    known = np.zeros(shape, dtype=bool)
+
+    row_knots = grid_knots(n_rows, max(1, coarse_step))
+    col_knots = grid_knots(n_cols, max(1, coarse_step))
+    rows, cols = (a.ravel() for a in np.meshgrid(row_knots, col_knots, indexing='ij'))
+    elevations[rows, cols] = sample(rows, cols)
+    known[rows, cols] = True
+    sampled = rows.size
+    rounds = 1
+
+    # Cells are kept as parallel arrays of their corner indices
+    r0, c0 = (a.ravel() for a in np.meshgrid(row_knots[:-1], col_knots[:-1], indexing='ij'))
+    r1, c1 = (a.ravel() for a in np.meshgrid(row_knots[1:], col_knots[1:], indexing='ij'))
+
+    while sampled < budget:
+        corners = np.stack((elevations[r0, c0], elevations[r0, c1], elevations[r1, c1], elevations[r1, c0]), axis=1)
+        finite = np.isfinite(corners).all(axis=1)
+        low = np.where(finite, corners.min(axis=1), 0)
+        high = np.where(finite, corners.max(axis=1), 0)
+        splittable = (r1 - r0 > 1) | (c1 - c0 > 1)
+        # A contour level lies between the lowest and the highest corner
+        crossing = np.floor(low / gap) != np.floor(high / gap)
+        candidates = np.flatnonzero(splittable & finite & crossing)
+        if not candidates.size:
+            break
+
+        # Steepest cells first, so a tight budget is spent where the contours are densest
+        candidates = candidates[np.argsort(-(high - low)[candidates], kind='stable')]
+        rm = (r0[candidates] + r1[candidates]) // 2
+        cm = (c0[candidates] + c1[candidates]) // 2
+        new_rows = np.stack((r0[candidates], rm, rm, rm, r1[candidates]), axis=1)
+        new_cols = np.stack((cm, c0[candidates], cm, c1[candidates], cm), axis=1)
+
+        # Count each new point once, against the first cell that needs it
+        node_ids = (new_rows * n_cols + new_cols).ravel()
+        first = np.zeros(node_ids.size, dtype=bool)
+        first[np.unique(node_ids, return_index=True)[1]] = True
+        new = (first & ~known.ravel()[node_ids]).reshape(-1, 5)
+        accepted = np.cumsum(new.sum(axis=1)) <= budget - sampled
+        if not accepted.any():
+            break
+
+        fetch = new[accepted]
+        fetch_rows = new_rows[accepted][fetch]
+        fetch_cols = new_cols[accepted][fetch]
+        if fetch_rows.size:
+            elevations[fetch_rows, fetch_cols] = sample(fetch_rows, fetch_cols)
+            known[fetch_rows, fetch_cols] = True
+            sampled += fetch_rows.size
+        rounds += 1
+
+        # Replace every accepted cell by its (up to) four children
+        split = candidates[accepted]
+        rm = rm[accepted]
+        cm = cm[accepted]
+        keep = np.ones(r0.size, dtype=bool)
+        keep[split] = False
+        children = (
+            (r0[split], rm, c0[split], cm),
+            (r0[split], rm, cm, c1[split]),
+            (rm, r1[split], c0[split], cm),
+            (rm, r1[split], cm, c1[split]),
+        )
+        parts = [(r0[keep], r1[keep], c0[keep], c1[keep])]
+        for cr0, cr1, cc0, cc1 in children:
+            valid = (cr1 > cr0) & (cc1 > cc0)
+            parts.append((cr0[valid], cr1[valid], cc0[valid], cc1[valid]))
+        r0, r1, c0, c1 = (np.concatenate(p) for p in zip(*parts))
+
+    fill_cells(elevations, known, r0, r1, c0, c1)
+    return elevations, sampled, rounds
+
+
+def fill_cells(elevations, known, r0, r1, c0, c1):
+    """Bilinearly interpolate every unsampled point from the corners of its cell."""
+    heights = r1 - r0
+    widths = c1 - c0
+    for height, width in set(zip(heights.tolist(), widths.tolist())):
+        cells = np.flatnonzero((heights == height) & (widths == width))
+        fr = np.arange(height + 1) / height
+        fc = np.arange(width + 1) / width
+        rows = r0[cells, None, None] + np.arange(height + 1)[None, :, None]
+        cols = c0[cells, None, None] + np.arange(width + 1)[None, None, :]
+        z00 = elevations[r0[cells], c0[cells]][:, None, None]
+        z01 = elevations[r0[cells], c1[cells]][:, None, None]
+        z10 = elevations[r1[cells], c0[cells]][:, None, None]
+        z11 = elevations[r1[cells], c1[cells]][:, None, None]
+        top = z00 * (1 - fc[None, None, :]) + z01 * fc[None, None, :]
+        bottom = z10 * (1 - fc[None, None, :]) + z11 * fc[None, None, :]
+        values = top * (1 - fr[None, :, None]) + bottom * fr[None, :, None]
+        rows, cols = np.broadcast_arrays(rows, cols)
+        fill = ~known[rows, cols]
+        elevations[rows[fill], cols[fill]] = values[fill]
+
+
+def spline_matrix(knots, n):
+    """Natural cubic spline through ``knots`` as a linear map.
+
+    Returns an ``(n, len(knots))`` matrix ``W`` such that ``W @ y`` is the
+    spline through the values ``y`` at the knot indices, evaluated at every
+    index ``0..n-1``.
+    """
+    x = knots.astype(np.float64)
+    k = len(x)
+    identity = np.eye(k)
+    # Second derivatives at the knots, zero at both ends (natural spline)
+    second = np.zeros((k, k))
+    if k > 2:
+        h = np.diff(x)
+        system = np.zeros((k - 2, k - 2))
+        i = np.arange(k - 2)
+        system[i, i] = (h[:-1] + h[1:]) / 3
+        system[i[1:], i[:-1]] = h[1:-1] / 6
+        system[i[:-1], i[1:]] = h[1:-1] / 6
+        slopes = np.diff(identity, axis=0) / h[:, None]
+        second[1:-1] = np.linalg.solve(system, slopes[1:] - slopes[:-1])
+
+    t = np.arange(n, dtype=np.float64)
+    interval = np.clip(np.searchsorted(x, t, side='right') - 1, 0, k - 2)
+    h = x[interval + 1] - x[interval]
+    a = ((x[interval + 1] - t) / h)[:, None]
+    b = 1 - a
+    return (a * identity[interval] + b * identity[interval + 1]
+            + ((a ** 3 - a) * second[interval] + (b ** 3 - b) * second[interval + 1]) * (h ** 2)[:, None] / 6)
+
+
+def fill_missing_knots(values, tolerance=1e-4, max_rounds=10000):
+    """Fill the NaN knots of a coarse grid from the knots around them.
+
+    Each missing knot becomes the mean of its (up to four) neighbours, the
+    discrete Laplace equation with the sampled knots held fixed, solved by
+    repeated averaging from a start interpolated along the rows and the
+    columns. On a plane, a knot with sampled knots all around is filled
+    exactly. Returns a copy; all NaN stays NaN.
+    """
+    values = np.array(values, dtype=np.float64)
+    missing = np.isnan(values)
+    if not missing.any() or missing.all():
+        return values
+
+    def along_rows(grid, holes):
+        filled = np.full(grid.shape, np.nan)
+        index = np.arange(grid.shape[1])
+        for r in range(grid.shape[0]):
+            known = ~holes[r]
+            if known.any():
+                filled[r] = np.interp(index, index[known], grid[r, known])
+        return filled
+
+    start = np.nanmean(np.stack((along_rows(values, missing), along_rows(values.T, missing.T).T)), axis=0)
+    values[missing] = start[missing]
+    for _ in range(max_rounds):
+        padded = np.pad(values, 1, constant_values=np.nan)
+        neighbours = np.stack((padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]))
+        mean = np.nanmean(neighbours, axis=0)
+        change = np.abs(mean[missing] - values[missing]).max()
+        values[missing] = mean[missing]
+        if change < tolerance:
+            break
+    return values
+
+
+def linear_support(knots, n):
+    """``(n, len(knots))`` matrix marking the two knots each index lies between."""
+    interval = np.clip(np.searchsorted(knots, np.arange(n), side='right') - 1, 0, len(knots) - 2)
+    support = np.zeros((n, len(knots)))
+    support[np.arange(n), interval] = 1
+    support[np.arange(n), interval + 1] = 1
+    return support
+
+
+def sparse_sample(shape, sample, step, holdout=0, seed=0):
+    """Sample every ``step``-th node and spline-interpolate the full raster.
+
+    ``sample(rows, cols)`` returns the elevations at the given grid indices.
+    ``holdout`` extra nodes between the knots are sampled to measure the
+    interpolation error; they are compared with, not written into, the
+    result.
+
+    Returns ``(elevations, sampled_points, errors)`` where ``errors`` is
+    ``(rmse, max_error, count)`` or None without a holdout.
+    """
+    n_rows, n_cols = shape
+    row_knots = grid_knots(n_rows, max(1, step))
+    col_knots = grid_knots(n_cols, max(1, step))
+    if len(row_knots) < 2 or len(col_knots) < 2:
+        rows, cols = np.indices(shape)
+        return sample(rows, cols), n_rows * n_cols, None
+
+    coarse = sample(row_knots[:, None], col_knots[None, :]).astype(np.float64)
+    missing = np.isnan(coarse)
+    w_rows = spline_matrix(row_knots, n_rows)
+    w_cols = spline_matrix(col_knots, n_cols)
+    if missing.all():
+        return np.full(shape, np.nan, dtype=np.float32), coarse.size, None
+    elevations = (w_rows @ fill_missing_knots(coarse) @ w_cols.T).astype(np.float32)
+    if missing.any():
+        # Leave a hole wherever a missing knot would take part in the interpolation
+        touched = linear_support(row_knots, n_rows) @ missing @ linear_support(col_knots, n_cols).T
+        elevations[touched > 0] = np.nan
+    elevations[row_knots[:, None], col_knots[None, :]] = coarse
+
+    errors = None
+    if holdout > 0:
+        on_knot = np.zeros(shape, dtype=bool)
+        on_knot[row_knots[:, None], col_knots[None, :]] = True
+        candidates = np.flatnonzero(~on_knot)
+        if candidates.size:
+            rng = np.random.default_rng(seed)
+            picked = np.sort(rng.choice(candidates, min(holdout, candidates.size), replace=False))
+            rows, cols = np.divmod(picked, n_cols)
+            diff = sample(rows, cols).astype(np.float64) - elevations[rows, cols]
+            diff = diff[np.isfinite(diff)]
+            if diff.size:
+                errors = (float(np.sqrt(np.mean(diff ** 2))), float(np.abs(diff).max()), int(diff.size))
+            return elevations, coarse.size + picked.size, errors
+    return elevations, coarse.size, errors
@@ -0,0 +1,94 @@
+"""Polyline simplification for contour lines.
+
+Both methods keep the first and last point of each polyline, so closed
+rings stay closed and lines joined across stripes keep their end points.
+"""
+import heapq
+
+import numpy as np
+
+
+def segment_distances(points, start, end):
+    """Distance of every point to the segment from ``start`` to ``end``."""
+    direction = end - start
+    length_sq = float(direction @ direction)
+    offsets = points - start
+    if length_sq == 0:
+        return np.hypot(offsets[:, 0], offsets[:, 1])
+    t = np.clip(offsets @ direction / length_sq, 0.0, 1.0)
+    nearest = start + t[:, None] * direction
+    return np.hypot(points[:, 0] - nearest[:, 0], points[:, 1] - nearest[:, 1])
+
+
+def douglas_peucker(points, tolerance):
+    """Drop every point that lies within ``tolerance`` of the simplified line."""
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = segment_distances(points[first + 1:last], points[first], points[last])
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep]
+
+
+def visvalingam(points, tolerance):
+    """Repeatedly drop the point forming the smallest triangle, while its area is below ``tolerance``²."""
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return points
+    threshold = tolerance * tolerance
+    xs = points[:, 0].tolist()
+    ys = points[:, 1].tolist()
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    removed = bytearray(n)
+
+    def area(i):
+        a, b = prev[i], nxt[i]
+        return abs((xs[a] - xs[i]) * (ys[b] - ys[i]) - (xs[b] - xs[i]) * (ys[a] - ys[i])) / 2
+
+    heap = [(area(i), i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+    current = {i: a for a, i in heap}
+    while heap:
+        a, i = heapq.heappop(heap)
+        if removed[i] or current[i] != a:
+            continue
+        if a >= threshold:
+            break
+        removed[i] = 1
+        before, after = prev[i], nxt[i]
+        nxt[before] = after
+        prev[after] = before
+        for j in (before, after):
+            if 0 < j < n - 1:
+                current[j] = area(j)
+                heapq.heappush(heap, (current[j], j))
+    return points[~np.frombuffer(bytes(removed), dtype=bool)]
+
+
+SIMPLIFIERS = {
+    'douglas-peucker': douglas_peucker,
+    'visvalingam': visvalingam,
+}
+
+
+def simplify_lines(lines, method, tolerance):
+    """Simplify every polyline with ``method`` ('none' returns them unchanged)."""
+    simplifier = SIMPLIFIERS.get(method)
+    if simplifier is None or tolerance <= 0:
+        return lines
+    return [simplifier(line, tolerance) for line in lines]
@@ -0,0 +1,97 @@
+"""Uniform grid hash for nearest-point queries over a shrinking point set.
+
+Used by the legacy point chaining: every step looks for the closest point
+that has not been used yet. Points are bucketed in square cells sized for a
+few points each; a query searches rings of cells around the query point,
+nearest first, and stops as soon as no farther ring can hold a closer point.
+"""
+import math
+
+import numpy as np
+
+
+class GridIndex:
+    def __init__(self, points, cell_size=None):
+        self.points = np.asarray(points, dtype=np.float64)
+        n = len(self.points)
+        if cell_size is None:
+            cell_size = self.default_cell_size(self.points)
+        self.cell_size = cell_size
+        self.removed = bytearray(n)
+        self.remaining = n
+        self.xs = self.points[:, 0].tolist() if n else []
+        self.ys = self.points[:, 1].tolist() if n else []
+
+        self.cells = {}
+        if n:
+            keys = np.floor(self.points / cell_size).astype(np.int64)
+            self.min_key = keys.min(axis=0).tolist()
+            self.max_key = keys.max(axis=0).tolist()
+            for index, key in enumerate(map(tuple, keys.tolist())):
+                self.cells.setdefault(key, []).append(index)
+
+    @staticmethod
+    def default_cell_size(points):
+        """About four points per cell for evenly spread points."""
+        if len(points) < 2:
+            return 1.0
+        width, height = np.ptp(points, axis=0).tolist()
+        area = max(width, 1e-9) * max(height, 1e-9)
+        size = math.sqrt(4 * area / len(points))
+        return size if size > 0 else 1.0
+
+    def remove(self, index):
+        if not self.removed[index]:
+            self.removed[index] = 1
+            self.remaining -= 1
+
+    def cell(self, key):
+        """Unremoved points of a cell; removed ones are dropped from it on the way."""
+        indices = self.cells.get(key)
+        if not indices:
+            return ()
+        if any(self.removed[i] for i in indices):
+            indices = [i for i in indices if not self.removed[i]]
+            self.cells[key] = indices
+        return indices
+
+    def nearest(self, x, y, max_distance=math.inf):
+        """Index of the closest unremoved point within ``max_distance``, or None.
+
+        Ties go to the lowest index, as with a full scan.
+        """
+        if not self.remaining:
+            return None
+        cx = math.floor(x / self.cell_size)
+        cy = math.floor(y / self.cell_size)
+        # No cell outside this many rings holds any point
+        last_ring = max(cx - self.min_key[0], self.max_key[0] - cx, cy - self.min_key[1], self.max_key[1] - cy, 0)
+
+        best = None
+        best_distance = math.inf
+        for ring in range(last_ring + 1):
+            for key in self.ring_keys(cx, cy, ring):
+                for i in self.cell(key):
+                    distance = math.hypot(self.xs[i] - x, self.ys[i] - y)
+                    if distance < best_distance or (distance == best_distance and i < best):
+                        best = i
+                        best_distance = distance
+            # Every point in the next ring is at least this far away
+            reach = ring * self.cell_size
+            if best_distance < reach or reach > max_distance:
+                break
+        if best is None or best_distance > max_distance:
+            return None
+        return best
+
+    @staticmethod
+    def ring_keys(cx, cy, ring):
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
@@ -0,0 +1,55 @@
+"""Per-stage timings of an elevation run, for the benchmark suite.
+
+Nothing is measured unless the LANDSCAPE_TIMINGS_FILE environment variable
+names a file; the stages are then written to it as JSON when the run ends.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TIMINGS_ENV = 'LANDSCAPE_TIMINGS_FILE'
+
+
+def peak_rss_kb():
+    """Peak resident memory of this process so far, in KiB (None where unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if os.uname().sysname == 'Darwin' else peak
+
+
+class StageTimings:
+    def __init__(self, path=None):
+        self.path = path if path is not None else os.environ.get(TIMINGS_ENV)
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, requests=None):
+        """Time the enclosed block. ``requests()`` returns the proxy requests made so far."""
+        if not self.path:
+            yield
+            return
+        start = time.perf_counter()
+        requests_before = requests() if requests else 0
+        try:
+            yield
+        finally:
+            self.stages.append({
+                'stage': name,
+                'seconds': time.perf_counter() - start,
+                'peak_rss_kb': peak_rss_kb(),
+                'requests': (requests() if requests else 0) - requests_before,
+            })
+
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'stages': self.stages}, f, indent=1)
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from checkpoint import FetchCheckpoint
+
+
+def test_resume_after_a_partial_line(tmp_path):
+    path = str(tmp_path / 'site.svg.elevation-checkpoint.jsonl')
+    first = FetchCheckpoint(path, 'run')
+    first.record(np.array([0, 1]), [10.0, 11.0])
+    first.close()
+    # Killed halfway through writing the next batch
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"nodes":[2,3],"z":[12.')
+
+    second = FetchCheckpoint(path, 'run')
+    assert second.resumed == 2
+    second.record(np.array([4, 5]), [14.0, 15.0])
+    second.close()
+
+    third = FetchCheckpoint(path, 'run')
+    assert third.resumed == 4
+    assert np.array_equal(third.lookup(np.array([0, 4, 5, 2])), [10.0, 14.0, 15.0, np.nan], equal_nan=True)
+    third.close(complete=True)
+    assert not os.path.exists(path)
+
+
+def test_another_run_starts_afresh(tmp_path):
+    path = str(tmp_path / 'site.svg.elevation-checkpoint.jsonl')
+    first = FetchCheckpoint(path, 'run')
+    first.record(np.array([0]), [10.0])
+    first.close()
+    second = FetchCheckpoint(path, 'other run')
+    assert second.resumed == 0
+    second.close()
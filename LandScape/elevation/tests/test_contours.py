@@ -0,0 +1,82 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from contours import StripeContourer, contour_levels, contour_lines
+from tiles import SeamJoiner, contour_tile, tile_starts, tile_stop
+
+GAP = 5.0
+
+
+def hills(rows, cols):
+    r, c = np.indices((rows, cols), dtype=np.float64)
+    return 40 * np.sin(r / 7.0) * np.cos(c / 5.0) + 0.3 * r
+
+
+def length(lines):
+    return sum(float(np.hypot(*np.diff(line, axis=0).T).sum()) for line in lines)
+
+
+def whole_grid(z):
+    return {level: contour_lines(z, level, 0.0, 0.0, 1.0, 1.0) for level in contour_levels(z, GAP)}
+
+
+def path_lines(d):
+    """Polylines of absolute path data written by ``polyline_path_data``."""
+    lines = []
+    for part in d.split('M')[1:]:
+        closed = part.strip().endswith('z')
+        pairs = part.replace('L', ' ').replace('z', ' ').split()
+        line = np.array([[float(v) for v in pair.split(',')] for pair in pairs])
+        lines.append(np.vstack((line, line[:1])) if closed else line)
+    return lines
+
+
+def test_saddle_follows_the_cell_centre():
+    # Corners above the level at top-left and bottom-right: the centre decides which pair is joined
+    high = contour_lines(np.array([[1.0, 0.0], [0.0, 1.0]]), 0.4, 0, 0, 1, 1)
+    low = contour_lines(np.array([[0.6, 0.0], [0.0, 0.6]]), 0.4, 0, 0, 1, 1)
+    assert len(high) == len(low) == 2
+    # Above the centre the lines cut off the low corners (top-right, bottom-left)
+    assert sorted(tuple(np.round(line.mean(axis=0), 3)) for line in high) == [(0.2, 0.8), (0.8, 0.2)]
+    assert sorted(tuple(np.round(line.mean(axis=0), 3)) for line in low) == [(0.167, 0.167), (0.833, 0.833)]
+
+
+def test_stripes_match_the_whole_grid():
+    z = hills(61, 47)
+    whole = whole_grid(z)
+    contourer = StripeContourer(z.shape[1], GAP, 0.0, 0.0, 1.0, 1.0)
+    striped = {}
+    starts = list(range(0, z.shape[0] - 1, 8))
+    for row0 in starts:
+        row1 = min(row0 + 8, z.shape[0] - 1)
+        for level, lines in contourer.add_stripe(z[row0:row1 + 1], row0, last=row0 == starts[-1]).items():
+            striped.setdefault(level, []).extend(lines)
+    assert set(striped) == set(whole)
+    for level in whole:
+        assert len(striped[level]) == len(whole[level])
+        assert np.isclose(length(striped[level]), length(whole[level]))
+
+
+def test_tiles_match_the_whole_grid():
+    z = hills(61, 47)
+    whole = whole_grid(z)
+    size = 10
+    joiner = SeamJoiner(z.shape, size)
+    tiled = {}
+    for row0 in tile_starts(z.shape[0], size):
+        for col0 in tile_starts(z.shape[1], size):
+            tile = z[row0:tile_stop(row0, z.shape[0], size) + 1, col0:tile_stop(col0, z.shape[1], size) + 1]
+            finished, seams, _, _ = contour_tile(tile, row0, col0, z.shape, GAP, 1.0, 1.0, 'none', 0, 6, False)
+            for level, d in finished.items():
+                tiled.setdefault(level, []).extend(path_lines(d))
+            for level, lines in joiner.add_tile(seams).items():
+                tiled.setdefault(level, []).extend(lines)
+    assert not joiner.flush()
+    assert set(tiled) == set(whole)
+    for level in whole:
+        assert len(tiled[level]) == len(whole[level])
+        assert np.isclose(length(tiled[level]), length(whole[level]))
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from elevation_cache import METERS_PER_DEGREE, ElevationCache
+
+
+def grid(n, lat=32.1, lon=34.9, spacing=3.0):
+    """Lat/lon of an n x n grid of nodes ``spacing`` meters apart."""
+    rows, cols = np.indices((n, n))
+    return (lat + rows * spacing / METERS_PER_DEGREE,
+            lon + cols * spacing / (METERS_PER_DEGREE * np.cos(np.radians(lat))))
+
+
+def test_same_grid_hits(tmp_path):
+    cache = ElevationCache(path=str(tmp_path / 'cache.sqlite'))
+    lat, lon = grid(20)
+    z = np.random.default_rng(0).random(lat.shape) * 100
+    cache.store(lat, lon, z)
+    assert np.array_equal(cache.lookup(lat, lon), z.ravel())
+    assert cache.hits == 400 and cache.misses == 0
+    cache.close()
+
+
+def test_nearby_samples_within_tolerance(tmp_path):
+    cache = ElevationCache(path=str(tmp_path / 'cache.sqlite'))
+    lat, lon = grid(20)
+    z = np.random.default_rng(1).random(lat.shape) * 100
+    cache.store(lat, lon, z)
+    shifted = lat + 0.2 / METERS_PER_DEGREE
+    assert np.array_equal(cache.lookup(shifted, lon, tolerance=0.3), z.ravel())
+    assert np.isnan(cache.lookup(shifted, lon, tolerance=0.1)).all()
+    assert np.isnan(cache.lookup(shifted, lon)).all()
+    cache.close()
+
+
+def test_finer_grid_hits_the_shared_nodes(tmp_path):
+    cache = ElevationCache(path=str(tmp_path / 'cache.sqlite'))
+    lat, lon = grid(11, spacing=6.0)
+    cache.store(lat, lon, np.ones(lat.shape))
+    fine_lat, fine_lon = grid(21, spacing=3.0)
+    values = cache.lookup(fine_lat, fine_lon, tolerance=0.3).reshape(21, 21)
+    assert np.isfinite(values[::2, ::2]).all()
+    assert np.isfinite(values).sum() == 11 * 11
+    cache.close()
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sampling import fill_missing_knots, sparse_sample
+
+
+def plane(rows, cols):
+    rows, cols = np.broadcast_arrays(rows, cols)
+    return 500 + 0.3 * rows - 0.2 * cols
+
+
+def failing(surface, *nodes):
+    """``surface`` with the samples at ``nodes`` lost, as a failed batch leaves them."""
+    def sample(rows, cols):
+        rows, cols = np.broadcast_arrays(rows, cols)
+        values = np.array(surface(rows, cols), dtype=np.float64)
+        for row, col in nodes:
+            values[(rows == row) & (cols == col)] = np.nan
+        return values
+    return sample
+
+
+def test_sparse_sample_reproduces_a_plane():
+    elevations, sampled, _ = sparse_sample((200, 200), plane, 20)
+    rows, cols = np.indices((200, 200))
+    assert sampled == 11 * 11
+    assert np.abs(elevations - plane(rows, cols)).max() < 1e-3
+
+
+def test_one_missing_knot_stays_local():
+    elevations, _, _ = sparse_sample((200, 200), failing(plane, (100, 100)), 20)
+    rows, cols = np.indices((200, 200))
+    error = np.abs(elevations - plane(rows, cols))
+    # The knot's own cells are left empty, and nothing further away moves
+    assert np.isnan(elevations[100, 100])
+    assert np.isnan(error).sum() < 41 * 41
+    assert np.nanmax(error) < 1e-3
+    assert np.isfinite(elevations[100, 50]) and np.isfinite(elevations[130, 130])
+
+
+def test_fill_missing_knots_from_neighbours():
+    rows, cols = np.indices((6, 7))
+    values = plane(rows, cols).astype(np.float64)
+    holed = values.copy()
+    holed[2, 3] = holed[3, 3] = holed[3, 4] = np.nan
+    assert np.allclose(fill_missing_knots(holed), values, atol=1e-3)
+    assert np.isnan(fill_missing_knots(np.full((3, 3), np.nan))).all()
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from simplify import douglas_peucker, segment_distances, simplify_lines, visvalingam
+
+
+def wiggle():
+    x = np.linspace(0, 10, 101)
+    return np.column_stack((x, 0.01 * np.sin(7 * x)))
+
+
+def test_straight_wiggle_collapses():
+    assert np.array_equal(douglas_peucker(wiggle(), 0.1), wiggle()[[0, -1]])
+    # Visvalingam drops small triangles, so only the ends are sure to stay
+    line = visvalingam(wiggle(), 0.1)
+    assert len(line) < 10 and np.array_equal(line[[0, -1]], wiggle()[[0, -1]])
+
+
+def test_douglas_peucker_stays_within_tolerance():
+    x = np.linspace(0, 2 * np.pi, 200)
+    points = np.column_stack((x, np.sin(x)))
+    line = douglas_peucker(points, 0.05)
+    assert 3 <= len(line) < 30
+    assert max(min(segment_distances(points[i:i + 1], line[k], line[k + 1])[0] for k in range(len(line) - 1))
+               for i in range(len(points))) <= 0.05 + 1e-12
+
+
+def test_closed_rings_stay_closed():
+    angle = np.linspace(0, 2 * np.pi, 60)
+    ring = np.column_stack((np.cos(angle), np.sin(angle)))
+    ring[-1] = ring[0]
+    for method in ('douglas-peucker', 'visvalingam'):
+        line, = simplify_lines([ring], method, 0.05)
+        assert np.array_equal(line[0], line[-1]) and len(line) < len(ring)
+    assert simplify_lines([ring], 'none', 0.05)[0] is ring
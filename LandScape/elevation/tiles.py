@@ -0,0 +1,124 @@
+"""Tiled contouring for grids too large to hold at once.
+
+The grid is cut into square tiles of cells; neighbouring tiles overlap by
+one row or column of nodes, so each grid edge on a seam is the same edge
+(with the same global edge id) in both tiles. A tile is contoured on its
+own - in a worker process if asked - and its lines are sorted into:
+
+* finished lines, closed or ending on the outer edge of the grid, which the
+  worker already simplifies and turns into path data;
+* seam pieces, ending on an edge shared with another tile, which the
+  ``SeamJoiner`` holds until the tiles on the other side are done and then
+  joins on their shared edge ids.
+
+Only the tiles in flight and the pieces along the seams still open are in
+memory, whatever the size of the grid.
+"""
+import numpy as np
+
+from contours import contour_levels, edge_points, join_pieces, level_segments, stitch_segments
+from path_data import polyline_path_data
+from simplify import simplify_lines
+
+
+def tile_starts(n, size):
+    """First node of every tile along an axis of ``n`` nodes; a tile spans ``size`` cells."""
+    return list(range(0, max(n - 1, 1), size))
+
+
+def tile_stop(start, n, size):
+    """Last node of the tile starting at ``start`` (shared with the next tile)."""
+    return min(start + size, n - 1)
+
+
+def contour_tile(z, row0, col0, grid_shape, gap, dx, dy, simplify, tolerance, precision, relative):
+    """Contour one tile of nodes starting at grid node (row0, col0).
+
+    Returns ``(finished, seams, nodes_before, nodes_after)``: ``finished`` maps
+    each level to the path data of its finished lines, ``seams`` maps levels
+    to ``(first_edge, last_edge, points)`` pieces in document units. A
+    top-level function, so it can run in a process pool.
+    """
+    n_rows, n_cols = grid_shape
+    row1 = row0 + z.shape[0] - 1
+    col1 = col0 + z.shape[1] - 1
+
+    def on_seam(edge):
+        node = edge >> 1
+        if edge & 1:
+            col = node % n_cols
+            return (col == col0 and col0 > 0) or (col == col1 and col1 < n_cols - 1)
+        row = node // n_cols
+        return (row == row0 and row0 > 0) or (row == row1 and row1 < n_rows - 1)
+
+    finished = {}
+    seams = {}
+    nodes_before = nodes_after = 0
+    for level in contour_levels(z, gap):
+        seg_a, seg_b = level_segments(z, level, row0, col0, n_cols)
+        if not len(seg_a):
+            continue
+        lines = []
+        for line in stitch_segments(seg_a, seg_b):
+            points = edge_points(z, level, line, row0, col0, n_cols)
+            points = np.column_stack((points[:, 0] * dx, points[:, 1] * dy))
+            if line[0] != line[-1] and (on_seam(line[0]) or on_seam(line[-1])):
+                seams.setdefault(level, []).append((line[0], line[-1], points))
+            else:
+                lines.append(points)
+        if lines:
+            simplified = simplify_lines(lines, simplify, tolerance)
+            nodes_before += sum(len(line) for line in lines)
+            nodes_after += sum(len(line) for line in simplified)
+            finished[level] = polyline_path_data(simplified, precision, relative)
+    return finished, seams, nodes_before, nodes_after
+
+
+class SeamJoiner:
+    """Join seam pieces across tiles as the tiles are finished.
+
+    Tiles must be added in the order they were cut (row by row). A joined
+    piece is released once none of its ends touches a tile still to come.
+    """
+
+    def __init__(self, grid_shape, size):
+        self.n_rows, self.n_cols = grid_shape
+        self.size = size
+        self.tiles_per_row = len(tile_starts(self.n_cols, size))
+        self.done = 0
+        self.pending = {}
+
+    def tile_index(self, cell_row, cell_col):
+        return (cell_row // self.size) * self.tiles_per_row + cell_col // self.size
+
+    def waiting(self, edge):
+        """True while a tile on either side of the edge is still to come."""
+        node = edge >> 1
+        row, col = divmod(node, self.n_cols)
+        if edge & 1:
+            cells = ((row, col - 1), (row, col))
+        else:
+            cells = ((row - 1, col), (row, col))
+        return any(0 <= r < self.n_rows - 1 and 0 <= c < self.n_cols - 1 and self.tile_index(r, c) >= self.done
+                   for r, c in cells)
+
+    def add_tile(self, seams):
+        """Take the seam pieces of the next tile; returns ``{level: [polyline, ...]}`` of released lines."""
+        self.done += 1
+        released = {}
+        for level in set(self.pending) | set(seams):
+            open_pieces = []
+            for first, last, points in join_pieces(self.pending.pop(level, []) + seams.get(level, [])):
+                if first != last and (self.waiting(first) or self.waiting(last)):
+                    open_pieces.append((first, last, points))
+                else:
+                    released.setdefault(level, []).append(points)
+            if open_pieces:
+                self.pending[level] = open_pieces
+        return released
+
+    def flush(self):
+        """Release every piece still held (lines stopped at a seam by missing samples)."""
+        released = {level: [points for _, _, points in pieces] for level, pieces in self.pending.items()}
+        self.pending = {}
+        return released
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import math
+import os
+import sys
+
+import inkex
+import numpy as np
+from lxml import etree
+
+# The contouring and path helpers live with the elevation extension
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'elevation'))
+
+from contours import contour_levels
+from path_data import polyline_path_data
+from simplify import simplify_lines
+from survey import read_survey
+from tin import delaunay_triangles, long_edge_triangles, tin_contour_lines
+
+# Same conversion as the elevation extension, so both maps line up
+METERS_PER_DEGREE = 111139
+
+
+class MeasuredElevationExtension(inkex.EffectExtension):
+    def add_arguments(self, pars):
+        pars.add_argument("--survey_file", type=str, default="", help="CSV of surveyed points")
+        pars.add_argument("--coordinates", type=str, default="auto", help="auto, latlon, meters or document")
+        pars.add_argument("--x_origin", type=float, default=0.0, help="x of the site centre (m)")
+        pars.add_argument("--y_origin", type=float, default=0.0, help="y of the site centre (m)")
+        pars.add_argument("--contour_gaps", type=float, default=1.0, help="Contour line every...m")
+        pars.add_argument("--max_edge", type=float, default=0.0, help="Drop triangles with a longer edge (m, 0 = keep all)")
+        pars.add_argument("--simplify_tolerance", type=float, default=0.1, help="Simplify tolerance (mm)")
+        pars.add_argument("--show_points", type=inkex.Boolean, default=False, help="Draw the surveyed points")
+
+    def effect(self):
+        svg_root = self.document.getroot()
+        measured_layer = self.find_layer("Measured Elevation Map")
+        if measured_layer is None:
+            inkex.errormsg("Measured Elevation Map layer not found. Please run the BaseMap extension first.")
+            return
+        if not self.options.survey_file or not os.path.isfile(self.options.survey_file):
+            inkex.errormsg("Please choose the CSV file of the surveyed points.")
+            return
+        scale_factor = self.get_scale_factor()
+        if scale_factor is None:
+            return
+
+        try:
+            kind, first, second, z, skipped = read_survey(self.options.survey_file)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            inkex.errormsg(f"Could not read survey file '{self.options.survey_file}': {str(e)}")
+            return
+        if skipped:
+            inkex.utils.debug(f"{skipped} rows without three numbers were skipped.")
+
+        points = self.project(svg_root, kind, first, second, scale_factor)
+        if points is None:
+            return
+        # Repeated positions (the same point surveyed twice) would break the triangulation
+        points, unique = np.unique(points, axis=0, return_index=True)
+        z = z[unique]
+        if len(points) < 3:
+            inkex.errormsg("At least three distinct surveyed points are needed.")
+            return
+
+        triangles = delaunay_triangles(points)
+        if self.options.max_edge > 0 and len(triangles):
+            triangles = triangles[~long_edge_triangles(points, triangles, self.options.max_edge * scale_factor)]
+        if not len(triangles):
+            inkex.errormsg("The surveyed points could not be triangulated (are they all on one line?).")
+            return
+
+        layer = self.replace_sublayer(measured_layer, "measured")
+        levels = contour_levels(z, self.options.contour_gaps)
+        # The tolerance is given in mm of the page
+        tolerance = self.svg.unittouu(f"{self.options.simplify_tolerance}mm")
+        drawn = 0
+        for level in sorted(levels, reverse=True):
+            lines = tin_contour_lines(points, z, triangles, level)
+            if not lines:
+                continue
+            lines = simplify_lines(lines, "douglas-peucker", tolerance)
+            sublayer = self.create_sublayer(layer, f'{level:g}m')
+            path = etree.SubElement(sublayer, inkex.addNS('path', 'svg'))
+            path.set('d', polyline_path_data(lines))
+            path.set('style', "stroke:#ffd42a;fill:none;stroke-width:0.5")
+            drawn += 1
+        if self.options.show_points:
+            self.draw_points(layer, points, z)
+
+        inkex.utils.debug(f"Measured elevation: {len(points)} points, {len(triangles)} triangles, "
+                          f"{drawn} contour levels from {z.min():.1f}m to {z.max():.1f}m.")
+
+    def project(self, svg_root, kind, first, second, scale_factor):
+        """Document positions of the surveyed points, placed like the elevation extension's grid."""
+        coordinates = self.options.coordinates
+        if coordinates == "auto":
+            coordinates = "latlon" if kind == "latlon" else "meters"
+        if coordinates == "document":
+            return np.column_stack((first, second))
+
+        doc_width = self.svg.unittouu(svg_root.get('width'))
+        doc_height = self.svg.unittouu(svg_root.get('height'))
+        if coordinates == "meters":
+            east = first - self.options.x_origin
+            north = second - self.options.y_origin
+        else:
+            geo_data = svg_root.find('svg:metadata/inkscape:geodata', inkex.NSS)
+            if geo_data is None or 'latitude' not in geo_data.attrib:
+                inkex.errormsg("Location not found in metadata. Please run the BaseMap extension first.")
+                return None
+            center_lat = float(geo_data.get('latitude'))
+            center_lon = float(geo_data.get('longitude'))
+            east = (second - center_lon) * METERS_PER_DEGREE * math.cos(math.radians(center_lat))
+            north = (first - center_lat) * METERS_PER_DEGREE
+        return np.column_stack((doc_width / 2 + east * scale_factor, doc_height / 2 - north * scale_factor))
+
+    def draw_points(self, layer, points, z):
+        """Mark every surveyed point with a small dot that shows its elevation on hover."""
+        sublayer = self.create_sublayer(layer, "points")
+        radius = str(self.svg.unittouu('0.3mm'))
+        for (x, y), elevation in zip(points.tolist(), z.tolist()):
+            circle = etree.SubElement(sublayer, inkex.addNS('circle', 'svg'))
+            circle.set('style', "stroke:none;fill:#ffd42a")
+            circle.set('r', radius)
+            circle.set('cx', f"{x:.3f}")
+            circle.set('cy', f"{y:.3f}")
+            title = etree.SubElement(circle, 'title')
+            title.text = f"{elevation:g} m"
+
+    def replace_sublayer(self, parent_layer, label):
+        """A fresh sublayer for this run; the one drawn by an earlier run is removed."""
+        for old in parent_layer.findall('svg:g', inkex.NSS):
+            if old.get(inkex.addNS('label', 'inkscape')) == label:
+                parent_layer.remove(old)
+        return self.create_sublayer(parent_layer, label)
+
+    def create_sublayer(self, parent_layer, label):
+        sublayer = etree.SubElement(parent_layer, inkex.addNS('g', 'svg'))
+        sublayer.set(inkex.addNS('label', 'inkscape'), label)
+        sublayer.set(inkex.addNS('groupmode', 'inkscape'), 'layer')
+        return sublayer
+
+    def find_layer(self, label):
+        """Find a layer by its label."""
+        layers = self.document.getroot().xpath(
+            f"//svg:g[@inkscape:label='{label}']", namespaces=inkex.NSS
+        )
+        return layers[0] if layers else None
+
+    def get_scale_factor(self):
+        """Retrieve scale factor from metadata."""
+        scale_factor_element = self.document.getroot().xpath('//inkscape:scalefactor', namespaces=inkex.NSS)
+        if scale_factor_element:
+            try:
+                return float(scale_factor_element[0].text)
+            except ValueError:
+                inkex.errormsg("Invalid scale factor value in metadata.")
+        else:
+            inkex.errormsg("Scale factor not found in metadata.")
+        return None
+
+
+if __name__ == '__main__':
+    MeasuredElevationExtension().run()
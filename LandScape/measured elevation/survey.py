@@ -0,0 +1,75 @@
+"""Reading surveyed elevation points from CSV files.
+
+Columns are found by their header names (lat/lon/elevation or x/y/z and
+the usual variants); a file without a header is read as lat, lon,
+elevation. Commas, semicolons, tabs and spaces all work as separators.
+"""
+import csv
+
+import numpy as np
+
+COLUMN_NAMES = {
+    'lat': ('lat', 'latitude'),
+    'lon': ('lon', 'lng', 'long', 'longitude'),
+    'x': ('x', 'easting', 'east', 'e'),
+    'y': ('y', 'northing', 'north', 'n'),
+    'z': ('z', 'elevation', 'elev', 'alt', 'altitude', 'height', 'h'),
+}
+
+
+def is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+def read_survey(path):
+    """Read a survey CSV as ``(kind, first, second, z, skipped)``.
+
+    ``kind`` is 'latlon' (first and second are latitude and longitude) or
+    'xy' (x and y); ``skipped`` counts the rows that could not be read.
+    Raises ValueError when the columns cannot be found.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t ')
+        except csv.Error:
+            dialect = csv.excel
+        rows = [row for row in csv.reader(f, dialect) if any(cell.strip() for cell in row)]
+    if not rows:
+        raise ValueError("The file is empty.")
+
+    header = [cell.strip().lower() for cell in rows[0]]
+    if all(is_number(cell) for cell in header if cell):
+        kind, columns = 'latlon', (0, 1, 2)
+    else:
+        rows = rows[1:]
+        found = {key: next((header.index(name) for name in names if name in header), None)
+                 for key, names in COLUMN_NAMES.items()}
+        if found['z'] is None:
+            raise ValueError(f"No elevation column (one of {', '.join(COLUMN_NAMES['z'])}) in the header.")
+        if found['lat'] is not None and found['lon'] is not None:
+            kind, columns = 'latlon', (found['lat'], found['lon'], found['z'])
+        elif found['x'] is not None and found['y'] is not None:
+            kind, columns = 'xy', (found['x'], found['y'], found['z'])
+        else:
+            raise ValueError("No lat/lon or x/y columns in the header.")
+
+    values = []
+    skipped = 0
+    for row in rows:
+        try:
+            values.append([float(row[i]) for i in columns])
+        except (IndexError, ValueError):
+            skipped += 1
+    if not values:
+        raise ValueError("No rows with three numbers were found.")
+    values = np.array(values, dtype=np.float64)
+    finite = np.isfinite(values).all(axis=1)
+    skipped += int(np.count_nonzero(~finite))
+    values = values[finite]
+    return kind, values[:, 0], values[:, 1], values[:, 2], skipped
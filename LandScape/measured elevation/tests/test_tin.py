@@ -0,0 +1,101 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'elevation'))
+
+from survey import read_survey
+from tin import bowyer_watson, delaunay_triangles, tin_contour_lines
+
+SHAPES = [(100.0, 100.0), (1000.0, 10.0)]
+
+
+def scattered(n, width, height, seed=0):
+    return np.random.default_rng(seed).random((n, 2)) * [width, height]
+
+
+def cross(o, a, b):
+    return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+
+
+def hull_area(points):
+    """Area of the convex hull (monotone chain)."""
+    chain = []
+    for ordered in (sorted(map(tuple, points)), sorted(map(tuple, points), reverse=True)):
+        half = []
+        for p in ordered:
+            while len(half) >= 2 and cross(np.array(half[-2]), np.array(half[-1]), np.array(p)) <= 0:
+                half.pop()
+            half.append(p)
+        chain += half[:-1]
+    x, y = np.array(chain).T
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+@pytest.mark.parametrize('width, height', SHAPES)
+def test_every_circumcircle_is_empty(width, height):
+    points = scattered(400, width, height)
+    triangles = bowyer_watson(points)
+    # In coordinates scaled to the unit square, where the triangulator works
+    unit = (points - points.min(axis=0)) / max(width, height)
+    a, b, c = (unit[triangles[:, k], None, :] - unit[None, :, :] for k in range(3))
+    lifted = [(v ** 2).sum(axis=2) for v in (a, b, c)]
+    det = (lifted[0] * (b[..., 0] * c[..., 1] - c[..., 0] * b[..., 1])
+           - lifted[1] * (a[..., 0] * c[..., 1] - c[..., 0] * a[..., 1])
+           + lifted[2] * (a[..., 0] * b[..., 1] - b[..., 0] * a[..., 1]))
+    assert (cross(*(unit[triangles[:, k]] for k in range(3))) > 0).all()
+    assert det.max() <= 1e-12
+
+
+@pytest.mark.parametrize('width, height', SHAPES)
+def test_triangles_cover_the_convex_hull(width, height):
+    points = scattered(3000, width, height)
+    triangles = bowyer_watson(points)
+    area = 0.5 * cross(*(points[triangles[:, k]] for k in range(3))).sum()
+    assert area == pytest.approx(hull_area(points), rel=1e-9)
+
+
+def test_regular_grid_and_collinear_points():
+    rows, cols = np.indices((20, 30))
+    grid = np.column_stack((cols.ravel(), rows.ravel())).astype(np.float64)
+    assert len(bowyer_watson(grid)) == 2 * 19 * 29
+    assert len(bowyer_watson(np.array([(0.0, 0.0), (1.0, 0.0), (2.0, 0.0)]))) == 0
+
+
+def test_contours_of_a_plane_are_straight():
+    points = scattered(500, 100, 100, seed=1)
+    z = 0.5 * points[:, 0] + 0.2 * points[:, 1]
+    triangles = delaunay_triangles(points)
+    for level in (10.0, 25.5, 40.0):
+        lines = tin_contour_lines(points, z, triangles, level)
+        assert len(lines) == 1
+        line = lines[0]
+        assert np.allclose(0.5 * line[:, 0] + 0.2 * line[:, 1], level)
+        # From one side of the survey to the other
+        assert np.ptp(line[:, 0]) > 10
+
+
+def test_read_latlon_and_xy_surveys(tmp_path):
+    latlon = tmp_path / 'latlon.csv'
+    latlon.write_text("Latitude,Longitude,Elevation\n32.1,34.9,12.5\n32.2,35.0,13\nbad,row,here\n")
+    kind, lat, lon, z, skipped = read_survey(str(latlon))
+    assert kind == 'latlon' and skipped == 1
+    assert np.array_equal(lat, [32.1, 32.2]) and np.array_equal(lon, [34.9, 35.0]) and np.array_equal(z, [12.5, 13])
+
+    xy = tmp_path / 'xy.csv'
+    xy.write_text("z;easting;northing\n5;100;200\n6;101;201\n")
+    kind, x, y, z, skipped = read_survey(str(xy))
+    assert kind == 'xy' and skipped == 0
+    assert np.array_equal(x, [100, 101]) and np.array_equal(y, [200, 201]) and np.array_equal(z, [5, 6])
+
+    bare = tmp_path / 'bare.csv'
+    bare.write_text("32.1\t34.9\t12\n32.2\t35.0\t13\n")
+    assert read_survey(str(bare))[0] == 'latlon'
+
+    nameless = tmp_path / 'nameless.csv'
+    nameless.write_text("a,b,c\n1,2,3\n")
+    with pytest.raises(ValueError):
+        read_survey(str(nameless))
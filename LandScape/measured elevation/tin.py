@@ -0,0 +1,214 @@
+"""Triangulated irregular network (TIN) of surveyed points and its contours.
+
+The Delaunay triangulation comes from scipy when it is installed and from a
+Bowyer-Watson insertion otherwise. Contours are cut straight from the
+triangles: every triangle edge has an id built from its two vertex numbers,
+so the contour segments of neighbouring triangles meet on the same edge id
+and are stitched with the elevation extension's ``stitch_segments``.
+"""
+import math
+
+import numpy as np
+
+from contours import stitch_segments
+
+try:
+    from scipy.spatial import Delaunay
+except ImportError:
+    Delaunay = None
+
+
+def delaunay_triangles(points):
+    """Delaunay triangles of unique 2-D points as an (m, 3) array of point indices."""
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) < 3:
+        return np.empty((0, 3), dtype=np.int64)
+    if Delaunay is not None:
+        try:
+            return Delaunay(points).simplices.astype(np.int64)
+        except Exception:
+            # Qhull refuses degenerate input (all points on a line)
+            return np.empty((0, 3), dtype=np.int64)
+    return bowyer_watson(points)
+
+
+def bowyer_watson(points):
+    """Incremental Delaunay triangulation, for when scipy is not available.
+
+    Points are inserted in a snake order over a coarse grid, so the walk that
+    finds the triangle holding the next point starts next to it; each point
+    then re-triangulates the cavity of triangles whose circumcircle holds it.
+    Instead of a finite super-triangle, every hull edge has a ghost triangle
+    with a vertex at infinity, so no Delaunay triangle along the hull is lost.
+    About linear in the number of points for survey-like input.
+    """
+    n = len(points)
+    # The vertex at infinity that every hull edge's ghost triangle shares
+    GHOST = n
+    low = points.min(axis=0)
+    extent = max(float(np.ptp(points, axis=0).max()), 1e-12)
+    unit = (points - low) / extent
+
+    cells = max(1, int(math.sqrt(n / 4)))
+    cx = np.clip((unit[:, 0] * cells).astype(np.int64), 0, cells - 1)
+    cy = np.clip((unit[:, 1] * cells).astype(np.int64), 0, cells - 1)
+    order = np.argsort(cy * cells + np.where(cy % 2, cells - 1 - cx, cx), kind='stable').tolist()
+
+    xs = unit[:, 0].tolist()
+    ys = unit[:, 1].tolist()
+
+    def orient(a, b, x, y):
+        return (xs[b] - xs[a]) * (y - ys[a]) - (ys[b] - ys[a]) * (x - xs[a])
+
+    # A first triangle, then one ghost triangle (a, b, GHOST) outside each hull edge
+    first = order[0]
+    second = next((p for p in order if xs[p] != xs[first] or ys[p] != ys[first]), None)
+    if second is None:
+        return np.empty((0, 3), dtype=np.int64)
+    third = next((p for p in order if orient(first, second, xs[p], ys[p]) != 0), None)
+    if third is None:
+        # All points on one line
+        return np.empty((0, 3), dtype=np.int64)
+    if orient(first, second, xs[third], ys[third]) < 0:
+        second, third = third, second
+    order = [p for p in order if p not in (first, second, third)]
+    vertices = [first, second, third, third, second, GHOST, first, third, GHOST, second, first, GHOST]
+    neighbours = [1, 2, 3, 3, 2, 0, 1, 3, 0, 2, 1, 0]
+    alive = [True] * 4
+    stamp = [-1] * 4
+    last = 0
+
+    def in_circumcircle(t, x, y):
+        """Whether the point is strictly inside the circumcircle of triangle ``t``.
+
+        The circle of a ghost triangle is the open half-plane beyond its hull
+        edge, together with the open hull edge itself.
+        """
+        a, b, c = vertices[3 * t:3 * t + 3]
+        if GHOST in (a, b, c):
+            k = (a, b, c).index(GHOST)
+            a, b = vertices[3 * t + (k + 1) % 3], vertices[3 * t + (k + 2) % 3]
+            side = orient(a, b, x, y)
+            if side:
+                return side > 0
+            return (x - xs[a]) * (x - xs[b]) + (y - ys[a]) * (y - ys[b]) < 0
+        adx, ady = xs[a] - x, ys[a] - y
+        bdx, bdy = xs[b] - x, ys[b] - y
+        cdx, cdy = xs[c] - x, ys[c] - y
+        return ((adx * adx + ady * ady) * (bdx * cdy - cdx * bdy)
+                - (bdx * bdx + bdy * bdy) * (adx * cdy - cdx * ady)
+                + (cdx * cdx + cdy * cdy) * (adx * bdy - bdx * ady)) > 0
+
+    def locate(t, x, y):
+        for _ in range(len(alive)):
+            if GHOST in vertices[3 * t:3 * t + 3]:
+                if in_circumcircle(t, x, y):
+                    return t
+                # Back across the hull edge
+                t = neighbours[3 * t + vertices.index(GHOST, 3 * t, 3 * t + 3) - 3 * t]
+                continue
+            for i in range(3):
+                a = vertices[3 * t + (i + 1) % 3]
+                b = vertices[3 * t + (i + 2) % 3]
+                if orient(a, b, x, y) < 0:
+                    t = neighbours[3 * t + i]
+                    break
+            else:
+                return t
+        # Rounding sent the walk astray: fall back to checking every triangle
+        for t in range(len(alive)):
+            if not alive[t]:
+                continue
+            if GHOST in vertices[3 * t:3 * t + 3]:
+                if in_circumcircle(t, x, y):
+                    return t
+            elif all(orient(vertices[3 * t + (i + 1) % 3], vertices[3 * t + (i + 2) % 3], x, y) >= 0
+                     for i in range(3)):
+                return t
+        return None
+
+    for p in order:
+        x, y = xs[p], ys[p]
+        start = locate(last, x, y)
+        if start is None:
+            continue
+        # Cavity: the connected triangles whose circumcircle holds the point
+        stamp[start] = p
+        cavity = [start]
+        stack = [start]
+        while stack:
+            t = stack.pop()
+            for i in range(3):
+                nb = neighbours[3 * t + i]
+                if stamp[nb] != p and in_circumcircle(nb, x, y):
+                    stamp[nb] = p
+                    cavity.append(nb)
+                    stack.append(nb)
+
+        # Fan the cavity boundary around the new point
+        starting = {}
+        ending = {}
+        created = []
+        for t in cavity:
+            alive[t] = False
+            for i in range(3):
+                nb = neighbours[3 * t + i]
+                if stamp[nb] == p:
+                    continue
+                a = vertices[3 * t + (i + 1) % 3]
+                b = vertices[3 * t + (i + 2) % 3]
+                new = len(alive)
+                vertices.extend((a, b, p))
+                neighbours.extend((-1, -1, nb))
+                alive.append(True)
+                stamp.append(-1)
+                neighbours[neighbours.index(t, 3 * nb, 3 * nb + 3)] = new
+                starting[a] = new
+                ending[b] = new
+                created.append(new)
+        for new in created:
+            a, b = vertices[3 * new], vertices[3 * new + 1]
+            neighbours[3 * new] = starting[b]
+            neighbours[3 * new + 1] = ending[a]
+        last = created[-1]
+
+    triangles = np.array(vertices, dtype=np.int64).reshape(-1, 3)[np.array(alive, dtype=bool)]
+    return triangles[(triangles < n).all(axis=1)]
+
+
+def long_edge_triangles(points, triangles, max_edge):
+    """Mask of the triangles with an edge longer than ``max_edge``.
+
+    Drops the long thin triangles that bridge bays in the outline of a survey.
+    """
+    corners = points[triangles]
+    lengths = np.linalg.norm(corners - np.roll(corners, -1, axis=1), axis=2)
+    return lengths.max(axis=1) > max_edge
+
+
+def tin_contour_lines(points, z, triangles, level):
+    """Contour polylines of the TIN at ``level`` as (n, 2) arrays.
+
+    A vertex counts as above the level when it is at or above it, so a
+    contour never runs exactly through a vertex. Closed rings end on their
+    first point.
+    """
+    n = len(points)
+    above = z[triangles] >= level
+    crossing = above != np.roll(above, -1, axis=1)
+    cut = crossing.any(axis=1)
+    if not cut.any():
+        return []
+    first = triangles[cut]
+    second = np.roll(first, -1, axis=1)
+    edge_ids = np.minimum(first, second) * n + np.maximum(first, second)
+    # Every cut triangle crosses the level on exactly two of its edges
+    pairs = edge_ids[crossing[cut]].reshape(-1, 2)
+    lines = stitch_segments(pairs[:, 0], pairs[:, 1])
+
+    ids = np.fromiter((e for line in lines for e in line), dtype=np.int64)
+    a, b = np.divmod(ids, n)
+    t = (level - z[a]) / (z[b] - z[a])
+    line_points = points[a] + t[:, None] * (points[b] - points[a])
+    bounds = np.cumsum([len(line) for line in lines])[:-1]
+    return np.split(line_points, bounds)
@@ -0,0 +1,342 @@
+"""Plane geometry for the shadows of structures: outlines, overlaps and a box index.
+
+Polygons are lists of rings, each an (n, 2) array of document positions
+closed implicitly; several rings combine with the even-odd rule. The
+shadow outlines are exact: the footprint swept along the shadow, found as
+the union of the footprint and one parallelogram per edge facing the
+shadow. The union splits every edge where it meets another and keeps the
+pieces with the inside (a positive winding number) on one side only. Over
+uneven ground the sweep length changes along the outline, and each run of
+edges facing the shadow sweeps one strip instead.
+"""
+import numpy as np
+
+# Positions closer than this (document units) are the same point when chaining outlines
+SNAP = 1e-7
+
+
+def ring_bounds(rings):
+    """(x0, y0, x1, y1) of a polygon."""
+    points = np.vstack(rings)
+    return (*points.min(axis=0), *points.max(axis=0))
+
+
+def edges(rings):
+    """Start and end points of every edge of a polygon."""
+    return np.vstack(rings), np.vstack([np.roll(ring, -1, axis=0) for ring in rings])
+
+
+def points_inside(points, rings):
+    """Even-odd test of (n, 2) points against a polygon."""
+    points = np.asarray(points, dtype=np.float64)
+    starts, ends = edges(rings)
+    x, y = points[:, 0, None], points[:, 1, None]
+    x0, y0, x1, y1 = starts[None, :, 0], starts[None, :, 1], ends[None, :, 0], ends[None, :, 1]
+    straddles = (y0 > y) != (y1 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return (straddles & (x < crossing)).sum(axis=1) % 2 == 1
+
+
+def polygons_overlap(first, second):
+    """True when two polygons share some area (or touch)."""
+    a0, a1 = edges(first)
+    b0, b1 = edges(second)
+    # Any pair of edges crossing
+    da = a1 - a0
+    db = b1 - b0
+    qx = b0[None, :, 0] - a0[:, 0, None]
+    qy = b0[None, :, 1] - a0[:, 1, None]
+    denominator = da[:, 0, None] * db[None, :, 1] - da[:, 1, None] * db[None, :, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (qx * db[None, :, 1] - qy * db[None, :, 0]) / denominator
+        u = (qx * da[:, 1, None] - qy * da[:, 0, None]) / denominator
+    if np.any((denominator != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)):
+        return True
+    # Otherwise one lies wholly inside the other, or they are apart
+    return bool(points_inside(a0[:1], second)[0] or points_inside(b0[:1], first)[0])
+
+
+def signed_area(ring):
+    """Shoelace area, positive for counter-clockwise rings (in y-up axes)."""
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def turned_rings(rings):
+    """Which rings run the wrong way: outer rings go counter-clockwise and holes clockwise.
+
+    A ring inside an odd number of the others is a hole (even-odd rule).
+    """
+    turned = []
+    for i, ring in enumerate(rings):
+        depth = sum(bool(points_inside(ring[:1], [other])[0]) for j, other in enumerate(rings) if j != i)
+        clockwise = signed_area(ring) < 0
+        turned.append(clockwise != (depth % 2 == 1))
+    return turned
+
+
+def oriented(rings):
+    """The rings turned so that outer rings are counter-clockwise and holes clockwise."""
+    return [ring[::-1] if turn else ring for ring, turn in zip(rings, turned_rings(rings))]
+
+
+def winding_numbers(points, starts, ends):
+    """Winding number of the oriented edges around each point."""
+    x, y = points[:, 0, None], points[:, 1, None]
+    x0, y0, x1, y1 = starts[None, :, 0], starts[None, :, 1], ends[None, :, 0], ends[None, :, 1]
+    side = (x1 - x0) * (y - y0) - (x - x0) * (y1 - y0)
+    upward = (y0 <= y) & (y1 > y) & (side > 0)
+    downward = (y1 <= y) & (y0 > y) & (side < 0)
+    return upward.sum(axis=1) - downward.sum(axis=1)
+
+
+def overlapping_in_x(low, high):
+    """Pairs ``(i, j)`` of intervals ``[low, high]`` that overlap, each pair once.
+
+    The intervals are swept in order of their low ends, so only the pairs
+    that overlap are generated rather than all of them.
+    """
+    order = np.argsort(low, kind='stable')
+    low_sorted = low[order]
+    # Intervals after each one in the sweep that start before it ends
+    stop = np.searchsorted(low_sorted, high[order], side='right')
+    count = np.maximum(stop - np.arange(len(order)) - 1, 0)
+    first = np.repeat(np.arange(len(order)), count)
+    second = first + 1 + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    return order[first], order[second]
+
+
+def split_edges(starts, ends):
+    """Cut the edges wherever they cross or touch each other.
+
+    Returns the pieces as ``(piece_starts, piece_ends)``; a crossing point is
+    computed once and shared by both edges, so the pieces meet exactly.
+    """
+    n = len(starts)
+    d = ends - starts
+    length = np.hypot(d[:, 0], d[:, 1])
+    tolerance = 1e-9 * max(float(length.max()), 1.0)
+    low, high = np.minimum(starts, ends), np.maximum(starts, ends)
+    i, j = overlapping_in_x(low[:, 0], high[:, 0] + tolerance)
+    near = (low[i, 1] <= high[j, 1] + tolerance) & (low[j, 1] <= high[i, 1] + tolerance)
+    i, j = i[near], j[near]
+
+    di, dj = d[i], d[j]
+    q = starts[j] - starts[i]
+    denominator = di[:, 0] * dj[:, 1] - di[:, 1] * dj[:, 0]
+    along_i_cross = q[:, 0] * dj[:, 1] - q[:, 1] * dj[:, 0]
+    along_j_cross = q[:, 0] * di[:, 1] - q[:, 1] * di[:, 0]
+    crossing = np.abs(denominator) > tolerance * (length[i] + length[j])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(crossing, along_i_cross / denominator, np.nan)
+        u = np.where(crossing, along_j_cross / denominator, np.nan)
+    eps = 1e-12
+    hit = crossing & (t >= -eps) & (t <= 1 + eps) & (u >= -eps) & (u <= 1 + eps)
+    t, u, i_hit, j_hit = t[hit], u[hit], i[hit], j[hit]
+    point = starts[i_hit] + t[:, None] * d[i_hit]
+    # Crossings at an end of either edge sit exactly on that end
+    point = np.where((t <= eps)[:, None], starts[i_hit], np.where((t >= 1 - eps)[:, None], ends[i_hit], point))
+    point = np.where((u <= eps)[:, None], starts[j_hit], np.where((u >= 1 - eps)[:, None], ends[j_hit], point))
+
+    cut_edge = [i_hit, j_hit]
+    cut_param = [t, u]
+    cut_point = [point, point]
+    # Overlapping collinear edges: each is cut at the ends of the other
+    collinear = (~crossing & (np.abs(along_j_cross) <= tolerance * length[i])
+                 & (np.abs(along_i_cross) <= tolerance * length[j]))
+    for a, b in ((i[collinear], j[collinear]), (j[collinear], i[collinear])):
+        for ends_of_b in (starts[b], ends[b]):
+            offset = ends_of_b - starts[a]
+            param = (offset[:, 0] * d[a, 0] + offset[:, 1] * d[a, 1]) / np.maximum(length[a] ** 2, 1e-300)
+            inner = (param > eps) & (param < 1 - eps)
+            cut_edge.append(a[inner])
+            cut_param.append(param[inner])
+            cut_point.append(ends_of_b[inner])
+
+    edge = np.concatenate([np.arange(n), np.arange(n)] + cut_edge)
+    param = np.concatenate([np.zeros(n), np.ones(n)] + cut_param)
+    points = np.vstack([starts, ends] + cut_point)
+    order = np.lexsort((param, edge))
+    edge, points = edge[order], points[order]
+    same_edge = edge[1:] == edge[:-1]
+    piece_starts, piece_ends = points[:-1][same_edge], points[1:][same_edge]
+    moving = np.hypot(*(piece_ends - piece_starts).T) > tolerance
+    return piece_starts[moving], piece_ends[moving]
+
+
+def chain_rings(starts, ends):
+    """Join directed segments end to start into closed rings."""
+    keys = [tuple(key) for key in np.rint(starts / SNAP).astype(np.int64).tolist()]
+    end_keys = [tuple(key) for key in np.rint(ends / SNAP).astype(np.int64).tolist()]
+    leaving = {}
+    for index, key in enumerate(keys):
+        leaving.setdefault(key, []).append(index)
+    used = np.zeros(len(starts), dtype=bool)
+    rings = []
+    for first in range(len(starts)):
+        if used[first]:
+            continue
+        ring = [first]
+        used[first] = True
+        while end_keys[ring[-1]] != keys[first]:
+            following = [index for index in leaving.get(end_keys[ring[-1]], ()) if not used[index]]
+            if not following:
+                break
+            used[following[0]] = True
+            ring.append(following[0])
+        if end_keys[ring[-1]] == keys[first] and len(ring) >= 3:
+            rings.append(without_straight_corners(starts[ring]))
+    return rings
+
+
+def without_straight_corners(ring):
+    """Drop the vertices where a ring runs straight on (left where edges were cut)."""
+    before, after = np.roll(ring, 1, axis=0), np.roll(ring, -1, axis=0)
+    turn = (ring[:, 0] - before[:, 0]) * (after[:, 1] - ring[:, 1]) - (ring[:, 1] - before[:, 1]) * (after[:, 0] - ring[:, 0])
+    forward = ((ring - before) * (after - ring)).sum(axis=1) > 0
+    size = np.hypot(*(ring - before).T) * np.hypot(*(after - ring).T)
+    straight = forward & (np.abs(turn) <= 1e-12 * size)
+    return ring[~straight] if np.count_nonzero(~straight) >= 3 else ring
+
+
+def union(rings):
+    """Outline of the union of oriented rings (nonzero rule), as oriented rings."""
+    starts, ends = edges(rings)
+    moving = (starts != ends).any(axis=1)
+    starts, ends = split_edges(starts[moving], ends[moving])
+    if not len(starts):
+        return []
+    d = ends - starts
+    length = np.hypot(d[:, 0], d[:, 1])[:, None]
+    middle = (starts + ends) / 2
+    # A step off each piece, to its left and right
+    step = 1e-6 * max(float(np.ptp(np.vstack(rings), axis=0).max()), 1.0)
+    left_normal = np.column_stack((-d[:, 1], d[:, 0])) / length * step
+    original_starts, original_ends = edges(rings)
+    inside_left = winding_numbers(middle + left_normal, original_starts, original_ends) > 0
+    inside_right = winding_numbers(middle - left_normal, original_starts, original_ends) > 0
+    keep = inside_left != inside_right
+    # Pieces turned to keep the inside on their left, and repeated pieces dropped
+    starts, ends = np.where(inside_left[:, None], starts, ends)[keep], np.where(inside_left[:, None], ends, starts)[keep]
+    _, unique = np.unique(np.rint(np.hstack((starts, ends)) / SNAP).astype(np.int64), axis=0, return_index=True)
+    unique.sort()
+    return chain_rings(starts[unique], ends[unique])
+
+
+def swept_outline(rings, offset):
+    """Exact outline of a footprint swept along ``offset`` (the Minkowski sum with a segment)."""
+    rings = oriented(rings)
+    offset = np.asarray(offset, dtype=np.float64)
+    if not offset.any():
+        return rings
+    pieces = list(rings)
+    starts, ends = edges(rings)
+    d = ends - starts
+    # Edges with the outside towards the shadow sweep a parallelogram; the others stay under the footprint
+    facing = d[:, 1] * offset[0] - d[:, 0] * offset[1] > 0
+    for a, b in zip(starts[facing], ends[facing]):
+        pieces.append(np.array((a, a + offset, b + offset, b)))
+    return union(pieces)
+
+
+def densified(rings, spacing):
+    """The rings with points added so that no edge is longer than ``spacing``."""
+    result = []
+    for ring in rings:
+        d = np.roll(ring, -1, axis=0) - ring
+        parts = np.maximum(np.ceil(np.hypot(d[:, 0], d[:, 1]) / spacing), 1).astype(np.int64)
+        share = np.arange(parts.sum()) - np.repeat(np.cumsum(parts) - parts, parts)
+        result.append(np.repeat(ring, parts, axis=0) + np.repeat(d / parts[:, None], parts, axis=0) * share[:, None])
+    return result
+
+
+def swept_outline_by(rings, direction, lengths):
+    """Outline of a footprint swept along ``direction`` by lengths that vary along it.
+
+    ``lengths`` holds one array per ring, the length at each vertex; the sweep
+    runs straight between the ends of each edge, so the edges should be short
+    enough for the length to change little along them (see ``densified``).
+    Each run of edges facing the sweep sweeps a single strip.
+    """
+    turned = turned_rings(rings)
+    rings = [ring[::-1] if turn else ring for ring, turn in zip(rings, turned)]
+    lengths = [length[::-1] if turn else length for length, turn in zip(lengths, turned)]
+    direction = np.asarray(direction, dtype=np.float64)
+    pieces = list(rings)
+    for ring, length in zip(rings, lengths):
+        d = np.roll(ring, -1, axis=0) - ring
+        facing = d[:, 1] * direction[0] - d[:, 0] * direction[1] > 0
+        if not facing.any() or facing.all():
+            continue
+        # Walk the edges from one that does not face the sweep, so no run wraps around the end
+        order = np.roll(np.arange(len(ring)), -int(np.argmin(facing)))
+        far = ring + length[:, None] * direction
+        run = []
+        for i in np.append(order, order[0]):
+            if facing[i]:
+                run.append(i)
+                continue
+            if run:
+                near = ring[np.append(run, (run[-1] + 1) % len(ring))]
+                ends = far[np.append(run, (run[-1] + 1) % len(ring))]
+                pieces.append(without_straight_corners(np.vstack((near[:1], ends, near[:0:-1]))))
+                run = []
+    return union(pieces)
+
+
+def merged(polygons):
+    """Union the oriented polygons that overlap; the others are returned as they are."""
+    if len(polygons) < 2:
+        return list(polygons)
+    index = BoxIndex([ring_bounds(polygon) for polygon in polygons])
+    group = list(range(len(polygons)))
+
+    def root(k):
+        while group[k] != k:
+            group[k] = group[group[k]]
+            k = group[k]
+        return k
+
+    for i, polygon in enumerate(polygons):
+        for j in index.query(ring_bounds(polygon)):
+            if j > i and root(i) != root(j) and polygons_overlap(polygon, polygons[j]):
+                group[root(j)] = root(i)
+    members = {}
+    for i in range(len(polygons)):
+        members.setdefault(root(i), []).append(i)
+    return [polygons[ids[0]] if len(ids) == 1 else union([ring for k in ids for ring in polygons[k]])
+            for ids in members.values()]
+
+
+class BoxIndex:
+    """Find the boxes that may meet a query box, through a uniform grid of buckets.
+
+    ``boxes`` are (x0, y0, x1, y1); buckets are ``cell`` wide, by default the
+    mean box size, so each box sits in a handful of them.
+    """
+
+    def __init__(self, boxes, cell=None):
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if cell is None:
+            sizes = self.boxes[:, 2:] - self.boxes[:, :2]
+            cell = float(sizes.mean()) if len(sizes) else 1.0
+        self.cell = max(cell, 1e-9)
+        self.buckets = {}
+        for index, box in enumerate(self.boxes):
+            for key in self.keys(box):
+                self.buckets.setdefault(key, []).append(index)
+
+    def keys(self, box):
+        x0, y0, x1, y1 = (int(np.floor(v / self.cell)) for v in box)
+        return ((i, j) for i in range(x0, x1 + 1) for j in range(y0, y1 + 1))
+
+    def query(self, box):
+        """Indices of the boxes overlapping ``box``, in increasing order."""
+        x0, y0, x1, y1 = box
+        found = set()
+        for key in self.keys(box):
+            found.update(self.buckets.get(key, ()))
+        return [i for i in sorted(found)
+                if self.boxes[i, 0] <= x1 and self.boxes[i, 2] >= x0
+                and self.boxes[i, 1] <= y1 and self.boxes[i, 3] >= y0]
@@ -0,0 +1,187 @@
+"""Hours of shade around structures over a whole year.
+
+A structure is a vertical prism: its footprint raised to its height. A point
+on the ground is in its shadow when the ray from the point towards the sun
+meets the footprint within ``height / tan(altitude)`` - the shadow length.
+So for each sun direction only one number per cell is needed: the distance
+to the footprint along that direction, divided by the height. Taking the
+smallest over all structures, every sun position with that azimuth shades
+the cells where it is below ``1 / tan(altitude)``, and a cell shaded by two
+structures at once is counted once.
+
+The sun positions of the year are grouped into narrow azimuth bins. For a
+bin, each footprint is cut into thin slices along the sun direction and the
+places where its outline crosses each slice are listed once; the cells of
+the strip behind the footprint then look their distance up in their slice.
+Shadows are followed a set number of heights from their footprint, which
+leaves out only the longest shadows of a sun low on the horizon; bins and
+slices are narrow enough to move a shadow edge by less than half a cell that
+far out.
+
+Over uneven ground the height that counts is the top of the structure above
+each cell, and a cell the terrain hides from the sun (below its horizon in
+that direction) is in shade whatever the structures do.
+"""
+import math
+
+import numpy as np
+
+from geometry import points_inside
+
+
+def strip_cells(quads, origin, cell, shape):
+    """Cells whose centres lie inside convex quadrilaterals.
+
+    ``quads`` is a (Q, 4, 2) array of corners in order. Returns
+    ``(quad_index, flat_cell_index)`` for every covered cell.
+    """
+    x0, y0 = origin
+    n_rows, n_cols = shape
+    top = np.clip(np.ceil((quads[:, :, 1].min(axis=1) - y0) / cell - 0.5), 0, n_rows).astype(np.int64)
+    bottom = np.clip(np.floor((quads[:, :, 1].max(axis=1) - y0) / cell - 0.5), -1, n_rows - 1).astype(np.int64)
+    row_counts = np.maximum(bottom - top + 1, 0)
+    quad_of_row = np.repeat(np.arange(len(quads)), row_counts)
+    rows = top[quad_of_row] + np.arange(row_counts.sum()) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+    y = (y0 + (rows + 0.5) * cell)[:, None]
+
+    # Where each row crosses the sides of its quadrilateral
+    start = quads[quad_of_row]
+    end = np.roll(start, -1, axis=1)
+    straddles = (start[:, :, 1] > y) != (end[:, :, 1] > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = start[:, :, 0] + (y - start[:, :, 1]) * (end[:, :, 0] - start[:, :, 0]) / (end[:, :, 1] - start[:, :, 1])
+    left = np.where(straddles, x, np.inf).min(axis=1)
+    right = np.where(straddles, x, -np.inf).max(axis=1)
+    with np.errstate(invalid='ignore'):
+        first = np.clip(np.ceil((left - x0) / cell - 0.5), 0, n_cols)
+        last = np.clip(np.floor((right - x0) / cell - 0.5), -1, n_cols - 1)
+    first = np.nan_to_num(first, nan=n_cols, posinf=n_cols).astype(np.int64)
+    last = np.nan_to_num(last, nan=-1, neginf=-1).astype(np.int64)
+    col_counts = np.maximum(last - first + 1, 0)
+
+    run_starts = np.repeat(rows * n_cols + first, col_counts)
+    steps = np.arange(col_counts.sum()) - np.repeat(np.cumsum(col_counts) - col_counts, col_counts)
+    return np.repeat(quad_of_row, col_counts), run_starts + steps
+
+
+def shade_counts(origin, cell, shape, structures, altitude, azimuth, reach, ground=None, bases=None, horizon=None):
+    """Number of sun positions shading each cell, and the cells under a footprint.
+
+    The grid has ``shape`` (rows, columns) of square cells ``cell`` wide, its
+    top-left corner at ``origin``, in document units (y pointing south).
+    ``structures`` are ``(rings, height)`` pairs in the same units;
+    ``altitude``/``azimuth`` are arrays of degrees for the sun positions
+    above the horizon. Shadows are followed up to ``reach`` times the height
+    of their structure.
+
+    Over terrain, ``ground`` is the (rows, columns) elevation of the cells and
+    ``bases`` that of the ground under each structure, in document units too.
+    ``horizon`` is the terrain horizon (degrees) of the cells in ``n``
+    directions, an (n, rows, columns) array; direction ``i`` is the azimuth
+    ``i * 360 / n``.
+    """
+    x0, y0 = origin
+    n_rows, n_cols = shape
+    cotangents = 1 / np.tan(np.radians(altitude))
+    heights = np.array([height for _, height in structures], dtype=np.float64)
+    bin_width = min(math.radians(1.0), 0.5 * cell / max(reach * heights.max(), cell))
+    n_bins = int(math.ceil(2 * math.pi / bin_width))
+    bins = np.floor(np.radians(azimuth) / (2 * math.pi) * n_bins).astype(np.int64) % n_bins
+    order = np.lexsort((cotangents, bins))
+    bins, cotangents = bins[order], cotangents[order]
+    bin_starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    bin_stops = np.r_[bin_starts[1:], len(bins)]
+    if ground is not None:
+        ground = np.asarray(ground, dtype=np.float64).ravel()
+        tops = heights + np.asarray(bases, dtype=np.float64)
+
+    counts = np.zeros(n_rows * n_cols, dtype=np.int64)
+    horizon_cotangents = None
+    if horizon is not None:
+        # Each bin takes the horizon of its nearest direction, and so do the sun positions in it
+        n_directions = len(horizon)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            horizon_cotangents = np.where(horizon > 0, 1 / np.tan(np.radians(horizon)), np.inf).reshape(n_directions, -1)
+        bin_direction = np.rint((np.arange(n_bins) + 0.5) / n_bins * n_directions).astype(np.int64) % n_directions
+        for i in range(n_directions):
+            in_direction = np.sort(cotangents[bin_direction[bins] == i])
+            counts += len(in_direction) - np.searchsorted(in_direction, horizon_cotangents[i], side='left')
+
+    # Every structure's edges, padded to the same count (NaN edges cross no slice)
+    n_edges = max(sum(len(ring) for ring in rings) for rings, _ in structures)
+    edge_starts = np.full((len(structures), n_edges, 2), np.nan)
+    edge_ends = np.full((len(structures), n_edges, 2), np.nan)
+    inside = np.zeros(shape, dtype=bool)
+    for k, (rings, _) in enumerate(structures):
+        starts = np.vstack(rings)
+        edge_starts[k, :len(starts)] = starts
+        edge_ends[k, :len(starts)] = np.vstack([np.roll(ring, -1, axis=0) for ring in rings])
+        # Cells under the footprint
+        c0, r0 = np.maximum(np.floor((starts.min(axis=0) - origin) / cell), 0).astype(np.int64)
+        c1, r1 = np.minimum(np.ceil((starts.max(axis=0) - origin) / cell), (n_cols, n_rows)).astype(np.int64)
+        if c1 > c0 and r1 > r0:
+            rows, cols = np.mgrid[r0:r1, c0:c1]
+            centres = np.column_stack((x0 + (cols.ravel() + 0.5) * cell, y0 + (rows.ravel() + 0.5) * cell))
+            inside[rows, cols] |= points_inside(centres, rings).reshape(rows.shape)
+
+    slice_width = cell / 4
+    centre_x = np.tile(x0 + (np.arange(n_cols) + 0.5) * cell, n_rows)
+    centre_y = np.repeat(y0 + (np.arange(n_rows) + 0.5) * cell, n_cols)
+    ratio = np.full(n_rows * n_cols, np.inf)
+    touched = np.zeros(n_rows * n_cols, dtype=bool)
+    for first, stop in zip(bin_starts, bin_stops):
+        angle = (bins[first] + 0.5) * 2 * math.pi / n_bins
+        # Towards the sun in document axes (y down), and across it
+        u = np.array([math.sin(angle), -math.cos(angle)])
+        v = np.array([u[1], -u[0]])
+        along_starts, along_ends = edge_starts @ u, edge_ends @ u
+        across_starts, across_ends = edge_starts @ v, edge_ends @ v
+        low = np.nanmin(across_starts, axis=1)
+        high = np.nanmax(across_starts, axis=1)
+        front = np.nanmin(along_starts, axis=1)
+        back = np.nanmax(along_starts, axis=1)
+
+        # The strip each footprint can shade: as wide as the footprint, out to its longest shadow
+        tail = front - heights * min(cotangents[stop - 1], reach)
+        along = np.column_stack((back, back, tail, tail))
+        across = np.column_stack((low, high, high, low))
+        quads = along[:, :, None] * u + across[:, :, None] * v
+        structure, cells = strip_cells(quads, origin, cell, shape)
+        if not len(cells):
+            continue
+
+        # Slices of each footprint along the sun direction, and where its outline crosses them
+        n_slices = np.maximum(np.ceil((high - low) / slice_width).astype(np.int64), 1)
+        slice_offsets = np.cumsum(n_slices) - n_slices
+        owner = np.repeat(np.arange(len(structures)), n_slices)
+        middle = (low[owner] + (np.arange(n_slices.sum()) - slice_offsets[owner] + 0.5) * slice_width)[:, None]
+        cs, ce = across_starts[owner], across_ends[owner]
+        straddles = (cs > middle) != (ce > middle)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossings = along_starts[owner] + (middle - cs) * (along_ends[owner] - along_starts[owner]) / (ce - cs)
+        crossings = np.sort(np.where(straddles, crossings, np.inf), axis=1)
+        crossings = crossings[:, :max(1, int(straddles.sum(axis=1).max()))]
+
+        # Each cell's distance to the first crossing ahead of it, towards the sun
+        x, y = centre_x[cells], centre_y[cells]
+        slices = np.clip(((x * v[0] + y * v[1] - low[structure]) / slice_width).astype(np.int64),
+                         0, n_slices[structure] - 1)
+        ahead = crossings[slice_offsets[structure] + slices] - (x * u[0] + y * u[1])[:, None]
+        distance = np.where(ahead >= 0, ahead, np.inf).min(axis=1)
+
+        if ground is None:
+            np.minimum.at(ratio, cells, distance / heights[structure])
+        else:
+            above = tops[structure] - ground[cells]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                np.minimum.at(ratio, cells, np.where(above > 0, distance / above, np.inf))
+        touched[cells] = True
+        shaded = np.flatnonzero(touched)
+        # Sun positions the structures hide, less those the terrain hides already (counted above)
+        terrain = np.inf if horizon_cotangents is None else horizon_cotangents[bin_direction[bins[first]], shaded]
+        in_bin = cotangents[first:stop]
+        counts[shaded] += (np.searchsorted(in_bin, terrain, side='left')
+                           - np.searchsorted(in_bin, np.minimum(ratio[shaded], terrain), side='left'))
+        ratio[shaded] = np.inf
+        touched[shaded] = False
+    return counts.reshape(shape), inside
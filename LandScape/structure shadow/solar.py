@@ -0,0 +1,135 @@
+"""Sun position computed locally, after the NOAA solar calculator.
+
+The NOAA equations (from Meeus' Astronomical Algorithms) give the sun's
+declination and the equation of time from the Julian century, then the
+hour angle, the elevation corrected for atmospheric refraction and the
+azimuth. They agree with the full SPA to about 0.01 degree between 1901
+and 2099, far below anything a shadow drawing can show. Every function
+takes numpy arrays as well as numbers, so a whole year of timestamps is
+one call.
+
+Local clock times are turned into UTC with ``zoneinfo``: an IANA zone name
+("Asia/Jerusalem") follows daylight saving time, a fixed offset ("+02:00",
+"UTC-5") does not.
+"""
+import datetime
+import re
+
+import numpy as np
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:
+    ZoneInfo = None
+    ZoneInfoNotFoundError = KeyError
+
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+J2000_JULIAN_DAY = 2451545.0
+OFFSET_PATTERN = re.compile(r'^(?:UTC|GMT)?\s*([+-])(\d{1,2})(?::?(\d{2}))?$', re.IGNORECASE)
+
+
+def julian_century(timestamp):
+    """Julian centuries since J2000 of a unix timestamp (seconds, UTC)."""
+    julian_day = np.asarray(timestamp, dtype=np.float64) / 86400.0 + UNIX_EPOCH_JULIAN_DAY
+    return (julian_day - J2000_JULIAN_DAY) / 36525.0
+
+
+def sun_declination_and_equation_of_time(timestamp):
+    """Declination of the sun (degrees) and the equation of time (minutes)."""
+    jc = julian_century(timestamp)
+    mean_longitude = np.radians((280.46646 + jc * (36000.76983 + jc * 0.0003032)) % 360)
+    mean_anomaly = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    eccentricity = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    center = (np.sin(mean_anomaly) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+              + np.sin(2 * mean_anomaly) * (0.019993 - 0.000101 * jc)
+              + np.sin(3 * mean_anomaly) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * jc)
+    apparent_longitude = np.radians(np.degrees(mean_longitude) + center - 0.00569 - 0.00478 * np.sin(omega))
+    mean_obliquity = 23 + (26 + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60) / 60
+    obliquity = np.radians(mean_obliquity + 0.00256 * np.cos(omega))
+
+    declination = np.degrees(np.arcsin(np.sin(obliquity) * np.sin(apparent_longitude)))
+    y = np.tan(obliquity / 2) ** 2
+    equation_of_time = 4 * np.degrees(
+        y * np.sin(2 * mean_longitude)
+        - 2 * eccentricity * np.sin(mean_anomaly)
+        + 4 * eccentricity * y * np.sin(mean_anomaly) * np.cos(2 * mean_longitude)
+        - 0.5 * y * y * np.sin(4 * mean_longitude)
+        - 1.25 * eccentricity * eccentricity * np.sin(2 * mean_anomaly))
+    return declination, equation_of_time
+
+
+def refraction(elevation):
+    """Atmospheric refraction (degrees) lifting the sun seen at ``elevation`` degrees."""
+    elevation = np.asarray(elevation, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        tan_e = np.tan(np.radians(elevation))
+        arcseconds = np.select(
+            [elevation > 85, elevation > 5, elevation > -0.575],
+            [0.0,
+             58.1 / tan_e - 0.07 / tan_e ** 3 + 0.000086 / tan_e ** 5,
+             1735 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711)))],
+            -20.772 / tan_e)
+    return arcseconds / 3600.0
+
+
+def solar_position(latitude, longitude, timestamp, refract=True):
+    """Sun ``(altitude, azimuth)`` in degrees at a unix timestamp (seconds, UTC).
+
+    Azimuth runs clockwise from north; altitude includes refraction unless
+    ``refract`` is False. Arguments broadcast against each other.
+    """
+    timestamp = np.asarray(timestamp, dtype=np.float64)
+    declination, equation_of_time = sun_declination_and_equation_of_time(timestamp)
+    minutes_utc = (timestamp % 86400.0) / 60.0
+    true_solar_time = (minutes_utc + equation_of_time + 4 * np.asarray(longitude)) % 1440
+    hour_angle = np.radians(true_solar_time / 4 - 180)
+
+    lat = np.radians(latitude)
+    decl = np.radians(declination)
+    cos_zenith = np.clip(np.sin(lat) * np.sin(decl) + np.cos(lat) * np.cos(decl) * np.cos(hour_angle), -1, 1)
+    altitude = 90 - np.degrees(np.arccos(cos_zenith))
+    azimuth = (np.degrees(np.arctan2(np.sin(hour_angle),
+                                     np.cos(hour_angle) * np.sin(lat) - np.tan(decl) * np.cos(lat))) + 180) % 360
+    if refract:
+        altitude = altitude + refraction(altitude)
+    if altitude.ndim == 0:
+        return float(altitude), float(azimuth)
+    return altitude, azimuth
+
+
+def solar_noon(longitude, day):
+    """UTC datetime of the sun's highest point on a date at ``longitude``."""
+    midday = datetime.datetime(day.year, day.month, day.day, 12, tzinfo=datetime.timezone.utc)
+    # The equation of time barely changes within a day: one refinement is plenty
+    minutes = 720 - 4 * longitude - float(sun_declination_and_equation_of_time(midday.timestamp())[1])
+    estimate = midday + datetime.timedelta(minutes=minutes - 720)
+    minutes = 720 - 4 * longitude - float(sun_declination_and_equation_of_time(estimate.timestamp())[1])
+    return midday + datetime.timedelta(minutes=minutes - 720)
+
+
+def parse_timezone(text):
+    """tzinfo for an IANA zone name or a fixed UTC offset ("+02:00", "UTC-5").
+
+    Raises ValueError when the text is neither, or when the zone is not in
+    the time zone database.
+    """
+    text = text.strip()
+    match = OFFSET_PATTERN.match(text)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = datetime.timedelta(hours=int(hours), minutes=int(minutes or 0))
+        return datetime.timezone(-offset if sign == '-' else offset)
+    if text.upper() in ('UTC', 'GMT', 'Z'):
+        return datetime.timezone.utc
+    if ZoneInfo is None:
+        raise ValueError("this Python has no time zone database; use an offset like +02:00")
+    try:
+        return ZoneInfo(text)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown time zone '{text}' (install the 'tzdata' package, or use an offset like +02:00)")
+
+
+def longitude_timezone(longitude):
+    """The nautical time zone of a longitude: whole hours, no daylight saving."""
+    return datetime.timezone(datetime.timedelta(hours=round(longitude / 15.0)))
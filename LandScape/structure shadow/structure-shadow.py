@@ -1,11 +1,44 @@
 #!/usr/bin/env python3
 import os
+import sys
 import inkex
 from lxml import etree
 import math
 import datetime
-import urllib.request, json, ssl
+import re
+import urllib.request, json
+import numpy as np
 import requests
+from inkex import bezier
+
+try:
+    from timezonefinder import TimezoneFinder
+except ImportError:
+    TimezoneFinder = None
+
+# The PNG encoder and the elevation grid live with the elevation extension
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'elevation'))
+
+from elevation_grid import read_grid
+from geometry import BoxIndex, densified, merged, polygons_overlap, ring_bounds, swept_outline, swept_outline_by
+from path_data import polyline_path_data
+from relief import png_data_uri
+from shade import shade_counts
+from solar import longitude_timezone, parse_timezone, solar_noon, solar_position
+from terrain import horizon_angles, positions_below_horizon, shadow_lengths, terrain_shadow
+
+# Shade-hours colours (RGBA) from a little shade to the most; 0 hours stays transparent
+SHADE_LIGHT = (255, 237, 160, 110)
+SHADE_DARK = (37, 52, 148, 200)
+# Shadows are followed this many structure heights from the footprint (the sun down to ~9.5°)
+SHADE_REACH = 6
+# Directions of the terrain horizon around each grid node (every 5°)
+HORIZON_DIRECTIONS = 72
+# Ground the terrain itself hides from the sun (RGBA)
+TERRAIN_SHADOW = (0, 0, 0, 90)
+
+# A height in the structure's label, e.g. "Barn 6m" or "Water tank 3.5 m"
+HEIGHT_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*m\b')
 
 # API Proxy URL
 PROXY_URL = os.environ.get('LANDSCAPE_API_PROXY', 'https://landscape.idea-o-mator.com/api/proxy.php')
@@ -13,21 +46,22 @@ PROXY_URL = os.environ.get('LANDSCAPE_API_PROXY', 'https://landscape.idea-o-mato
 class StructureShadow(inkex.EffectExtension):
     def add_arguments(self, pars):
         pars.add_argument("--heightofstructure", type=float, default=0,
-                          help="Height of the structure (in meters).")
-        # We no longer use the date/time parameters from the UI,
-        # because the extension will compute seasonal shadows automatically.
-    
-    def effect(self):
-        # Retrieve structure height
-        structure_height = self.options.heightofstructure
-        if structure_height <= 0:
-            inkex.errormsg("Invalid height. Please enter a positive numeric value.")
-            return
+                          help="Height of the structures without their own (in meters).")
+        pars.add_argument("--timezone", type=str, default="auto",
+                          help="IANA time zone (Asia/Jerusalem) or UTC offset (+02:00) of the clock times; auto = from metadata")
+        pars.add_argument("--cross_check", type=inkex.Boolean, default=False,
+                          help="Compare the local sun position with the online time zone and sunrise-sunset services")
+        pars.add_argument("--mode", type=str, default="seasons",
+                          help="seasons: winter and summer shadows; shade_hours: heatmap of the hours of shade in a year")
+        pars.add_argument("--time_step", type=float, default=15.0, help="Sun positions every...minutes (shade hours)")
+        pars.add_argument("--cell_size", type=float, default=0.5, help="Heatmap cell size (m)")
+        pars.add_argument("--terrain", type=inkex.Boolean, default=False,
+                          help="Cast the shadows over the elevation grid kept by '3. Elevation' instead of flat ground")
 
-        # Get the selected polygon (the original structure)
-        polygon = next(iter(self.svg.selected.values()), None)
-        if polygon is None or polygon.tag != inkex.addNS('path', 'svg'):
-            inkex.errormsg("Please select a valid closed polygon.")
+    def effect(self):
+        # Get the selected polygons (the original structures) with their heights
+        structures = self.get_structures()
+        if not structures:
             return
 
         # Get location and scale factor from metadata
@@ -44,6 +78,22 @@ class StructureShadow(inkex.EffectExtension):
             inkex.errormsg("Scale factor not found in metadata.")
             return
 
+        grid = None
+        if self.options.terrain:
+            grid = read_grid(self.document.getroot(), scale_factor)
+            if grid is None:
+                inkex.errormsg("No elevation grid found in the document. Run '3. Elevation' with "
+                               "'keep the elevation grid in the document' ticked first.")
+                return
+
+        if self.options.mode == "shade_hours":
+            self.draw_shade_hours(structures, latitude, longitude, scale_factor, grid)
+            return
+
+        self.timezone = self.get_timezone(latitude, longitude)
+        if self.timezone is None:
+            return
+
         # Use current year to build seasonal dates.
         current_year = datetime.date.today().year
 
@@ -53,47 +103,91 @@ class StructureShadow(inkex.EffectExtension):
         if latitude >= 0:
             winter_date = f"{current_year}-12-21"
             summer_date = f"{current_year}-06-21"
-            winter_times = ["08:30", "12:00", "15:00"]
-            summer_times = ["07:00", "12:00", "18:00"]
         else:
             winter_date = f"{current_year}-06-21"
             summer_date = f"{current_year}-12-21"
-            winter_times = ["08:30", "12:00", "15:00"]
-            summer_times = ["07:00", "12:00", "18:00"]
+        winter_times = ["08:30", "12:00", "15:00"]
+        summer_times = ["07:00", "12:00", "18:00"]
 
         # Create separate layers for winter and summer shadows.
-        parent_layer = self.get_parent_layer(polygon)
+        parent_layer = self.get_parent_layer(structures[0][0])
         winter_layer = self.create_shadow_layer(parent_layer, "Winter Shadow")
         summer_layer = self.create_shadow_layer(parent_layer, "Summer Shadow")
 
-        # Process each time for the winter shadows.
-        for t in winter_times:
-            dt_str = f"{winter_date} {t}"
-            # Compute shadow using our new compute_shadow (which auto-gets the UTC offset)
-            shadow_length, sun_azimuth, shadow_datetime = self.compute_shadow(latitude, structure_height, longitude, dt_str)
-            if shadow_datetime is None:
+        # Footprints in a box index, to find the structures a shadow falls on
+        footprint_index = BoxIndex([ring_bounds(rings) for _, _, rings in structures])
+        bases = horizons = None
+        if grid is not None:
+            bases = [self.structure_base(rings, grid) for _, _, rings in structures]
+            horizons = horizon_angles(grid, HORIZON_DIRECTIONS)
+        for season, shadow_layer, date, times in (("Winter", winter_layer, winter_date, winter_times),
+                                                 ("Summer", summer_layer, summer_date, summer_times)):
+            for t in times:
+                # One sun position per time, shared by all the structures
+                shadow_ratio, sun_azimuth, shadow_datetime = self.compute_shadow(latitude, longitude, f"{date} {t}")
+                if shadow_datetime is None:
+                    continue
+                if grid is not None:
+                    self.draw_terrain_shadow(shadow_layer, grid, horizons, shadow_ratio, sun_azimuth, shadow_datetime)
+                outlines = self.draw_shadows(shadow_layer, structures, shadow_ratio * scale_factor, sun_azimuth,
+                                             shadow_datetime, grid, bases)
+                inkex.utils.debug(f"{season} shadow at {self.get_shadow_time(shadow_datetime)}: "
+                                  f"{shadow_ratio:.2f}m of shadow per meter of height, azimuth = {sun_azimuth:.1f}°")
+                self.report_shaded(structures, outlines, footprint_index)
+
+        inkex.utils.debug(f"Shadow processing completed for {len(structures)} structure(s). "
+                          f"The original structures remain unchanged.")
+
+    def get_structures(self):
+        """The selected closed paths as ``(element, height_m, rings)``.
+
+        The height comes from the element's ``data-height`` attribute, else from
+        a height in its label ("Barn 6m"), else from the extension's option.
+        """
+        structures = []
+        for element in self.svg.selected.values():
+            if not isinstance(element, inkex.PathElement):
                 continue
-            shadow_offset = shadow_length * scale_factor
-            orig_shadow, off_shadow = self.create_shadow_polygons(polygon, winter_layer, shadow_offset, sun_azimuth)
-            self.extrude_between_shadows(winter_layer, orig_shadow, off_shadow, shadow_datetime)
-            inkex.utils.debug(f"Winter shadow at {self.get_shadow_time(shadow_datetime)}: length = {shadow_length}, azimuth = {sun_azimuth}")
-
-        # Process each time for the summer shadows.
-        for t in summer_times:
-            dt_str = f"{summer_date} {t}"
-            shadow_length, sun_azimuth, shadow_datetime = self.compute_shadow(latitude, structure_height, longitude, dt_str)
-            if shadow_datetime is None:
+            rings = self.footprint_rings(element, self.svg.unittouu('0.1mm'))
+            if not rings:
                 continue
-            shadow_offset = shadow_length * scale_factor
-            orig_shadow, off_shadow = self.create_shadow_polygons(polygon, summer_layer, shadow_offset, sun_azimuth)
-            self.extrude_between_shadows(summer_layer, orig_shadow, off_shadow, shadow_datetime)
-            inkex.utils.debug(f"Summer shadow at {self.get_shadow_time(shadow_datetime)}: length = {shadow_length}, azimuth = {sun_azimuth}")
-
-        # --- Remove any empty "Combined Shadow" groups from the shadow layers ---
-        self.remove_empty_combined_layers(winter_layer)
-        self.remove_empty_combined_layers(summer_layer)
+            height = self.structure_height(element)
+            if height is None or height <= 0:
+                inkex.errormsg(f"'{self.structure_name(element)}' has no height: give it a 'data-height' attribute, "
+                               f"a height in its label (e.g. 'Barn 6m') or enter the height of structure.")
+                continue
+            structures.append((element, height, rings))
+        if not structures and not self.svg.selected:
+            inkex.errormsg("Please select a valid closed polygon.")
+        elif not structures:
+            inkex.errormsg("None of the selected objects is a closed polygon with a height.")
+        return structures
 
-        inkex.utils.debug("Shadow processing completed. The original structure remains unchanged.")
+    def structure_height(self, element):
+        data_height = element.get('data-height')
+        if data_height:
+            try:
+                return float(data_height.strip().rstrip('m').replace(',', '.'))
+            except ValueError:
+                inkex.errormsg(f"'{self.structure_name(element)}': invalid data-height '{data_height}'.")
+                return None
+        found = HEIGHT_PATTERN.findall(element.get(inkex.addNS('label', 'inkscape')) or '')
+        if found:
+            return float(found[-1].replace(',', '.'))
+        return self.options.heightofstructure
+
+    def structure_name(self, element):
+        return element.get(inkex.addNS('label', 'inkscape')) or element.get_id()
+
+    def structure_base(self, rings, grid):
+        """Ground elevation (m) the structure stands on: the mean along its outline,
+        else (off the grid) the elevation of the nearest grid node."""
+        points = np.vstack(densified(rings, min(abs(grid.dx), abs(grid.dy))))
+        ground = grid.sample(points[:, 0], points[:, 1])
+        if np.isfinite(ground).any():
+            return float(np.nanmean(ground))
+        nearest = float(grid.z[grid.nearest_node(*points.mean(axis=0))])
+        return nearest if math.isfinite(nearest) else float(np.nanmean(grid.z))
 
     def get_google_utc_offset(self, lat, lon, date_str):
         """
@@ -128,160 +222,289 @@ class StructureShadow(inkex.EffectExtension):
         inkex.utils.debug(f"Google API: offset for {lat},{lon} on {date_str} is {offset_hours} hours")
         return offset_hours
 
-    def compute_shadow(self, latitude, height, longitude, date_time_str):
+    def get_solar_noon_local(self, lat, lon, date_str, local_utc_offset):
+        """Solar noon from the sunrise-sunset service, in local time (used by the cross-check)."""
+        if PROXY_URL:
+            response = requests.post(
+                PROXY_URL,
+                json={
+                    'endpoint': 'sunrise-sunset',
+                    'params': {'lat': lat, 'lng': lon, 'date': date_str, 'formatted': '0'}
+                },
+                headers={'Content-Type': 'application/json'},
+                timeout=30
+            )
+            data = response.json()
+        else:
+            url = f"https://api.sunrise-sunset.org/json?lat={lat}&lng={lon}&date={date_str}&formatted=0"
+            response = urllib.request.urlopen(url)
+            data = json.load(response)
+        if data['status'] != 'OK':
+            raise Exception("API error: " + data.get('status', 'Unknown error'))
+        solar_noon_utc = datetime.datetime.fromisoformat(data['results']['solar_noon'])
+        tz_local = datetime.timezone(datetime.timedelta(hours=local_utc_offset))
+        return solar_noon_utc.astimezone(tz_local)
+
+    def compute_shadow(self, latitude, longitude, date_time_str):
         """
-        Compute the solar geometry (shadow length and sun azimuth) for a given
-        date and time (as a string "YYYY-MM-DD HH:MM").
-        Returns (shadow_length, sun_azimuth, shadow_datetime).
+        Compute the solar geometry for a given local date and time (as a string
+        "YYYY-MM-DD HH:MM"): the shadow length per meter of height and the sun azimuth.
+        Returns (shadow_ratio, sun_azimuth, shadow_datetime); shadow_datetime is
+        None when the time is invalid or the sun is below the horizon.
         """
         try:
             shadow_datetime = datetime.datetime.strptime(date_time_str, "%Y-%m-%d %H:%M")
         except ValueError:
             inkex.errormsg("Invalid date/time format in compute_shadow.")
             return 0, 0, None
+        shadow_datetime = shadow_datetime.replace(tzinfo=self.timezone)
+
+        sun_altitude, sun_azimuth = solar_position(latitude, longitude, shadow_datetime.timestamp())
+        inkex.utils.debug(f"Computed {date_time_str} (UTC{self.format_offset(shadow_datetime)}): "
+                          f"sun altitude = {sun_altitude:.2f}°")
+        if self.options.cross_check:
+            self.cross_check(latitude, longitude, shadow_datetime)
+        if sun_altitude <= 0:
+            inkex.utils.debug(f"The sun is below the horizon at {date_time_str}; no shadow drawn.")
+            return 0, sun_azimuth, None
+
+        shadow_ratio = 1 / max(math.tan(math.radians(sun_altitude)), 1e-6)
+        return shadow_ratio, sun_azimuth, shadow_datetime
+
+    def cross_check(self, latitude, longitude, shadow_datetime):
+        """Report how far the online services are from the local UTC offset and solar noon."""
+        date_str = shadow_datetime.strftime("%Y-%m-%d")
+        try:
+            web_offset = self.get_google_utc_offset(latitude, longitude, date_str)
+            web_noon = self.get_solar_noon_local(latitude, longitude, date_str, web_offset)
+        except Exception as e:
+            inkex.utils.debug(f"Cross-check skipped: {str(e)}")
+            return
+        local_offset = shadow_datetime.utcoffset().total_seconds() / 3600.0
+        local_noon = solar_noon(longitude, shadow_datetime.date())
+        noon_difference = (web_noon - local_noon).total_seconds()
+        inkex.utils.debug(f"Cross-check {date_str}: UTC offset {local_offset:+g}h here, {web_offset:+g}h online; "
+                          f"solar noon differs by {noon_difference:+.0f}s")
+        if abs(local_offset - web_offset) > 1e-6:
+            inkex.errormsg(f"The time zone gives UTC{local_offset:+g} on {date_str} but the online service says "
+                           f"UTC{web_offset:+g}. Check the 'time zone' setting.")
+
+    def get_timezone(self, latitude, longitude):
+        """Time zone of the clock times: the option, else the one saved in metadata, else the
+        site's zone from timezonefinder when it is installed, else whole hours from the longitude.
+
+        A zone given in the option or found by timezonefinder is saved in the geodata for the next runs.
+        """
+        geo_data = self.document.getroot().find('svg:metadata/inkscape:geodata', inkex.NSS)
+        text = self.options.timezone.strip()
+        if text and text.lower() != "auto":
+            source = "option"
+        else:
+            text = geo_data.get('timezone', '') if geo_data is not None else ''
+            source = "metadata"
+        if not text and TimezoneFinder is not None:
+            text = TimezoneFinder().timezone_at(lat=latitude, lng=longitude) or ''
+            source = "timezonefinder"
+        if not text:
+            timezone = longitude_timezone(longitude)
+            inkex.utils.debug(f"No time zone set: using UTC{self.format_offset(datetime.datetime.now(timezone))} "
+                              f"from the longitude, without daylight saving. Enter the site's time zone "
+                              f"(e.g. Europe/Lisbon) to use local clock time.")
+            return timezone
+        try:
+            timezone = parse_timezone(text)
+        except ValueError as e:
+            inkex.errormsg(f"Time zone: {str(e)}")
+            return None
+        if source != "metadata" and geo_data is not None:
+            geo_data.set('timezone', text)
+        return timezone
+
+    def format_offset(self, moment):
+        offset = moment.utcoffset().total_seconds() / 3600.0
+        return f"{offset:+g}"
+
+    def draw_shade_hours(self, structures, latitude, longitude, scale_factor, grid=None):
+        """Add a heatmap of the hours the structures shade each cell in a year to the 'Sun Path' layer.
+
+        Over the elevation ``grid`` the heatmap counts the terrain's shade as well, and a
+        second heatmap shows the hours the terrain shades the whole grid.
+        """
+        sun_path_layer = self.find_layer("Sun Path")
+        if sun_path_layer is None:
+            inkex.errormsg("No 'Sun Path' layer found in the document. Please run the Primary Data extension first.")
+            return
+        step_minutes = self.options.time_step
+        cell = self.options.cell_size * scale_factor
+        if step_minutes <= 0 or cell <= 0:
+            inkex.errormsg("The time step and the cell size must be positive.")
+            return
 
-        # Get the local UTC offset automatically using Google Time Zone API.
-        local_utc_offset = self.get_google_utc_offset(latitude, longitude, date_time_str.split()[0])
-        # Make the shadow_datetime offset-aware.
-        tz_local = datetime.timezone(datetime.timedelta(hours=local_utc_offset))
-        shadow_datetime = shadow_datetime.replace(tzinfo=tz_local)
-
-        n = shadow_datetime.timetuple().tm_yday
-        decl_deg = 23.45 * math.sin(math.radians(360 * (284 + n) / 365))
-        decl = math.radians(decl_deg)
-
-        # --- Solar Time Correction via Sunrise-Sunset API ---
-        def get_solar_noon_local(lat, lon, date_str, local_utc_offset):
-            if PROXY_URL:
-                response = requests.post(
-                    PROXY_URL,
-                    json={
-                        'endpoint': 'sunrise-sunset',
-                        'params': {'lat': lat, 'lng': lon, 'date': date_str, 'formatted': '0'}
-                    },
-                    headers={'Content-Type': 'application/json'},
-                    timeout=30
-                )
-                data = response.json()
-            else:
-                url = f"https://api.sunrise-sunset.org/json?lat={lat}&lng={lon}&date={date_str}&formatted=0"
-                response = urllib.request.urlopen(url)
-                data = json.load(response)
-            if data['status'] != 'OK':
-                raise Exception("API error: " + data.get('status', 'Unknown error'))
-            solar_noon_utc = datetime.datetime.fromisoformat(data['results']['solar_noon'])
-            solar_noon_local = solar_noon_utc + datetime.timedelta(hours=local_utc_offset)
-            tz_local = datetime.timezone(datetime.timedelta(hours=local_utc_offset))
-            solar_noon_local = solar_noon_local.replace(tzinfo=tz_local)
-            return solar_noon_local
-
-        solar_noon_local = get_solar_noon_local(latitude, longitude, date_time_str.split()[0], local_utc_offset)
-        noon = shadow_datetime.replace(hour=12, minute=0, second=0, microsecond=0)
-        offset_timedelta = noon - solar_noon_local
-        offset_hours = offset_timedelta.total_seconds() / 3600.0
-
-        solar_time = (shadow_datetime.hour + shadow_datetime.minute / 60.0) + offset_hours
-        hour_angle_deg = 15 * (solar_time - 12)
-        hour_angle = math.radians(hour_angle_deg)
-        lat_rad = math.radians(latitude)
-        sun_alt_rad = math.asin(
-            math.sin(lat_rad) * math.sin(decl) +
-            math.cos(lat_rad) * math.cos(decl) * math.cos(hour_angle)
+        # Every sun position of the year in one batch; the clock time zone does not matter here
+        year = datetime.date.today().year
+        start = datetime.datetime(year, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+        stop = datetime.datetime(year + 1, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+        timestamps = np.arange(start, stop, step_minutes * 60)
+        altitude, azimuth = solar_position(latitude, longitude, timestamps)
+        up = altitude > 0
+        altitude, azimuth = altitude[up], azimuth[up]
+
+        # Cells centred on a grid around the footprints, out to SHADE_REACH heights of the tallest
+        corners = np.vstack([np.vstack(rings) for _, _, rings in structures])
+        reach = SHADE_REACH * max(height for _, height, _ in structures) * scale_factor
+        x0, y0 = corners.min(axis=0) - reach
+        x1, y1 = corners.max(axis=0) + reach
+        n_cols = int(math.ceil((x1 - x0) / cell))
+        n_rows = int(math.ceil((y1 - y0) / cell))
+
+        footprints = [(rings, height * scale_factor) for _, height, rings in structures]
+        if grid is None:
+            counts, inside = shade_counts((x0, y0), cell, (n_rows, n_cols), footprints, altitude, azimuth, SHADE_REACH)
+        else:
+            horizons = horizon_angles(grid, HORIZON_DIRECTIONS)
+            bases = [self.structure_base(rings, grid) for _, _, rings in structures]
+            # Ground and horizon of every cell: off the grid, flat ground at the structures' mean base and an open sky
+            x = np.tile(x0 + (np.arange(n_cols) + 0.5) * cell, n_rows)
+            y = np.repeat(y0 + (np.arange(n_rows) + 0.5) * cell, n_cols)
+            ground = grid.sample(x, y)
+            off_grid = np.isnan(ground)
+            ground[off_grid] = np.mean(bases)
+            horizon = horizons[(slice(None),) + grid.nearest_node(x, y)]
+            horizon[:, off_grid] = 0
+            counts, inside = shade_counts((x0, y0), cell, (n_rows, n_cols), footprints, altitude, azimuth, SHADE_REACH,
+                                          ground=(ground * scale_factor).reshape(n_rows, n_cols),
+                                          bases=np.array(bases) * scale_factor,
+                                          horizon=horizon.reshape((-1, n_rows, n_cols)))
+
+            terrain_hours = positions_below_horizon(horizons, altitude, azimuth) * step_minutes / 60.0
+            n_grid_rows, n_grid_cols = grid.shape
+            # Each pixel is centred on its grid node
+            most = self.draw_hours_image(sun_path_layer, "terrain shade hours", terrain_hours,
+                                         grid.x0 - grid.dx / 2, grid.y0 - grid.dy / 2,
+                                         n_grid_cols * grid.dx, n_grid_rows * grid.dy)
+            inkex.utils.debug(f"Terrain shade hours: {n_grid_rows}x{n_grid_cols} grid nodes; the terrain shades "
+                              f"the darkest for {most:.0f} hours a year.")
+
+        hours = np.where(inside, 0, counts) * step_minutes / 60.0
+        most = self.draw_hours_image(sun_path_layer, "shade hours", hours, x0, y0, n_cols * cell, n_rows * cell)
+        inkex.utils.debug(f"Shade hours: {len(timestamps)} sun positions ({len(altitude)} in daylight) over "
+                          f"{n_rows}x{n_cols} cells; the darkest cells get {most:.0f} hours of shade a year.")
+
+    def draw_hours_image(self, layer, label, hours, x, y, width, height):
+        """Replace the sublayer ``label`` of the layer with a heatmap of hours; returns the most hours."""
+        most = float(np.nanmax(hours)) if hours.size else 0.0
+        pixels = np.zeros(hours.shape, dtype=np.uint8)
+        if most > 0:
+            pixels = np.where(hours > 0, 1 + np.rint(254 * hours / most), 0).astype(np.uint8)
+        ramp = np.linspace(0, 1, 255)[:, None]
+        palette = [(0, 0, 0, 0)] + [tuple(int(round(v)) for v in color)
+                                    for color in (1 - ramp) * SHADE_LIGHT + ramp * np.array(SHADE_DARK)]
+
+        for old in layer.findall('svg:g', inkex.NSS):
+            if old.get(inkex.addNS('label', 'inkscape')) == label:
+                layer.remove(old)
+        sublayer = self.create_shadow_layer(layer, label)
+        image = self.add_image(sublayer, x, y, width, height, png_data_uri(pixels, palette=palette))
+        title = etree.SubElement(image, 'title')
+        title.text = f"Darkest: {most:.0f} hours of shade a year"
+        layer_transform = sublayer.getparent().composed_transform()
+        if layer_transform != inkex.Transform():
+            image.set('transform', str(-layer_transform))
+        return most
+
+    def add_image(self, layer, x, y, width, height, href):
+        image = etree.SubElement(layer, inkex.addNS('image', 'svg'))
+        image.set('x', str(x))
+        image.set('y', str(y))
+        image.set('width', str(width))
+        image.set('height', str(height))
+        image.set('preserveAspectRatio', 'none')
+        image.set('style', "image-rendering:optimizeSpeed")
+        image.set(inkex.addNS('href', 'xlink'), href)
+        return image
+
+    def footprint_rings(self, polygon, tolerance):
+        """The structure's subpaths as flattened (x, y) rings in document coordinates."""
+        path = polygon.path.to_absolute().transform(polygon.composed_transform())
+        superpath = path.to_superpath()
+        bezier.cspsubdiv(superpath, tolerance)
+        return [np.array([point[1] for point in subpath], dtype=np.float64)
+                for subpath in superpath if len(subpath) >= 3]
+
+    def find_layer(self, label):
+        """Find a layer by its label."""
+        layers = self.document.getroot().xpath(
+            f"//svg:g[@inkscape:label='{label}']", namespaces=inkex.NSS
         )
-        tan_alt = math.tan(sun_alt_rad)
-        if abs(tan_alt) < 1e-6:
-            tan_alt = 1e-6
-        shadow_length = height / tan_alt
-
-        cos_az = (math.sin(decl) - math.sin(lat_rad) * math.sin(sun_alt_rad)) / (math.cos(lat_rad) * math.cos(sun_alt_rad))
-        cos_az = max(min(cos_az, 1), -1)
-        az_rad = math.acos(cos_az)
-        if hour_angle > 0:
-            az_rad = 2 * math.pi - az_rad
-        sun_azimuth = math.degrees(az_rad)
-
-        inkex.utils.debug(f"Computed {date_time_str}: sun altitude = {math.degrees(sun_alt_rad):.2f}°, HA = {hour_angle_deg:.2f}°")
-        return shadow_length, sun_azimuth, shadow_datetime
+        return layers[0] if layers else None
 
     def get_shadow_time(self, shadow_datetime):
         return shadow_datetime.strftime("%H:%M")
 
-    def compute_convex_hull(self, points):
-        points = sorted(points)
-        lower = []
-        for p in points:
-            while len(lower) >= 2 and self.cross(lower[-2], lower[-1], p) <= 0:
-                lower.pop()
-            lower.append(p)
-        upper = []
-        for p in reversed(points):
-            while len(upper) >= 2 and self.cross(upper[-2], upper[-1], p) <= 0:
-                upper.pop()
-            upper.append(p)
-        return lower[:-1] + upper[:-1]
-
-    def cross(self, o, a, b):
-        return (a[0]-o[0])*(b[1]-o[1]) - (a[1]-o[1])*(b[0]-o[0])
-
-    def create_shadow_polygons(self, polygon, shadow_layer, shadow_offset, azimuth_angle):
-        # Create copies of the structure polygon for shadow calculation.
-        # These copies will be removed after combining.
-        original_shadow = polygon.copy()
-        original_shadow.set("id", f"copy_shadow_original_{id(original_shadow)}")
-        shadow_layer.append(original_shadow)
-
-        shadow_direction = (azimuth_angle + 180) % 360
-        azimuth_rad = math.radians(shadow_direction)
-        dx = shadow_offset * math.sin(azimuth_rad)
-        dy = -shadow_offset * math.cos(azimuth_rad)
-
-        offset_shadow = polygon.copy()
-        offset_shadow.set("id", f"copy_shadow_offset_{id(offset_shadow)}")
-        offset_shadow.set("transform", f"translate({dx},{dy})")
-        shadow_layer.append(offset_shadow)
-
-        return original_shadow, offset_shadow
-
-    def extrude_between_shadows(self, shadow_layer, original_shadow, offset_shadow, shadow_datetime):
-        # Create a combined shadow (convex hull) from the original and offset shadow nodes.
-        combined_layer = etree.SubElement(shadow_layer, inkex.addNS('g', 'svg'))
-        combined_layer.set(inkex.addNS('label', 'inkscape'), 'Combined Shadow')
-        combined_layer.set(inkex.addNS('groupmode', 'inkscape'), 'layer')
-
-        original_nodes = [seg[1] for seg in original_shadow.path.to_superpath()[0]]
-        offset_transform = offset_shadow.get("transform")
-        dx, dy = 0, 0
-        if offset_transform and "translate" in offset_transform:
-            translate_values = offset_transform.replace("translate(", "").replace(")", "").split(",")
-            dx, dy = float(translate_values[0]), float(translate_values[1])
-        offset_nodes = [[seg[1][0] + dx, seg[1][1] + dy] for seg in offset_shadow.path.to_superpath()[0]]
-        all_nodes = original_nodes + offset_nodes
-        hull = self.compute_convex_hull(all_nodes)
-        path_data = "M " + " L ".join([f"{p[0]},{p[1]}" for p in hull]) + " Z"
+    def draw_shadows(self, shadow_layer, structures, shadow_ratio, sun_azimuth, shadow_datetime,
+                     grid=None, bases=None):
+        """Draw the shadows of all the structures at one time as a single path.
+
+        ``shadow_ratio`` is the shadow length in document units per meter of
+        height. Over the elevation ``grid`` each structure stands on the ground
+        elevation in ``bases`` and its shadow runs until the ground meets the sun
+        ray. Returns the shadow outline of each structure.
+        """
+        shadow_direction = math.radians((sun_azimuth + 180) % 360)
+        dx = shadow_ratio * math.sin(shadow_direction)
+        dy = -shadow_ratio * math.cos(shadow_direction)
 
+        # The footprint swept to the shadow's far end, then the shadows that overlap joined
+        if grid is None:
+            outlines = [swept_outline(rings, (dx * height, dy * height)) for _, height, rings in structures]
+        else:
+            direction = (dx / shadow_ratio, dy / shadow_ratio)
+            spacing = min(abs(grid.dx), abs(grid.dy))
+            footprints = [densified(rings, spacing) for _, _, rings in structures]
+            rings = [ring for footprint in footprints for ring in footprint]
+            # Every vertex of every structure marched at once
+            points = np.vstack(rings)
+            per_structure = [sum(len(ring) for ring in footprint) for footprint in footprints]
+            ground = np.repeat(bases, per_structure)
+            tops = ground + np.repeat([height for _, height, _ in structures], per_structure)
+            lengths = shadow_lengths(grid, points[:, 0], points[:, 1], direction, grid.scale / shadow_ratio, tops, ground)
+            lengths = iter(np.split(lengths, np.cumsum([len(ring) for ring in rings])[:-1]))
+            outlines = [swept_outline_by(footprint, direction, [next(lengths) for _ in footprint])
+                        for footprint in footprints]
         shadow_path = inkex.PathElement()
-        shadow_path.set("d", path_data)
-        shadow_path.style = inkex.Style({"fill": "black", "stroke": "none", "fill-opacity": "0.5"})
-        shadow_time = self.get_shadow_time(shadow_datetime)
-        shadow_path.set(inkex.addNS('label', 'inkscape'), shadow_time)
+        shadow_path.set("d", polyline_path_data([np.vstack((ring, ring[:1])) for outline in merged(outlines)
+                                                 for ring in outline], precision=3))
+        shadow_path.style = inkex.Style({"fill": "black", "stroke": "none", "fill-opacity": "0.5", "fill-rule": "nonzero"})
+        shadow_path.set(inkex.addNS('label', 'inkscape'), self.get_shadow_time(shadow_datetime))
         shadow_layer.append(shadow_path)
-        inkex.utils.debug(f"Shadow successfully created for {shadow_time}.")
-
-        # Remove the shadow copies so only the final shadow remains.
-        if original_shadow.getparent() is not None:
-            original_shadow.getparent().remove(original_shadow)
-        if offset_shadow.getparent() is not None:
-            offset_shadow.getparent().remove(offset_shadow)
-
-    def remove_empty_combined_layers(self, shadow_layer):
-        """
-        Remove every direct child of the provided shadow_layer whose label is "Combined Shadow".
-        """
-        for child in list(shadow_layer):
-            if child.tag == inkex.addNS('g', 'svg'):
-                label = child.get(inkex.addNS('label', 'inkscape'))
-                if label == "Combined Shadow":
-                    shadow_layer.remove(child)
+        # The outlines are in document coordinates; the shadow layer adds no transform of its own
+        layer_transform = shadow_layer.getparent().composed_transform()
+        if layer_transform != inkex.Transform():
+            shadow_path.transform = -layer_transform
+        return outlines
+
+    def draw_terrain_shadow(self, shadow_layer, grid, horizons, shadow_ratio, sun_azimuth, shadow_datetime):
+        """Shade the grid nodes the terrain hides from the sun, as an image under the structures' shadows."""
+        sun_altitude = math.degrees(math.atan(1 / shadow_ratio))
+        hidden = terrain_shadow(horizons, sun_altitude, sun_azimuth)
+        n_rows, n_cols = grid.shape
+        # Each pixel is centred on its grid node
+        image = self.add_image(shadow_layer, grid.x0 - grid.dx / 2, grid.y0 - grid.dy / 2, n_cols * grid.dx,
+                               n_rows * grid.dy, png_data_uri(hidden.astype(np.uint8),
+                                                              palette=[(0, 0, 0, 0), TERRAIN_SHADOW]))
+        image.set(inkex.addNS('label', 'inkscape'), f"terrain {self.get_shadow_time(shadow_datetime)}")
+        layer_transform = shadow_layer.getparent().composed_transform()
+        if layer_transform != inkex.Transform():
+            image.set('transform', str(-layer_transform))
+        inkex.utils.debug(f"  The terrain shades {100 * np.count_nonzero(hidden) / hidden.size:.0f}% of the grid.")
+
+    def report_shaded(self, structures, outlines, footprint_index):
+        """List the structures each shadow falls on."""
+        for i, outline in enumerate(outlines):
+            shaded = [self.structure_name(structures[j][0]) for j in footprint_index.query(ring_bounds(outline))
+                      if j != i and polygons_overlap(outline, structures[j][2])]
+            if shaded:
+                inkex.utils.debug(f"  '{self.structure_name(structures[i][0])}' shades {', '.join(map(repr, shaded))}")
 
     def get_parent_layer(self, element):
         parent = element.getparent()
@@ -0,0 +1,145 @@
+"""Shadows over the terrain, from the elevation grid kept in the document.
+
+Structure shadows are marched along the ground: every point of an outline
+steps away from the sun in half a node spacing, all points at once, until
+the ground rises to the sun ray through the top of the structure.
+
+The terrain's own shade comes from its horizon: the altitude of the highest
+ground seen from each node, in a set of directions. The whole grid is
+compared with itself shifted by whole nodes along each direction, a few
+shifts per node spacing near by and ever sparser further out, so a
+direction costs some dozens of array comparisons rather than a ray per
+node. A node is in the terrain's shade when the sun is below its horizon.
+
+Distances along the ground are in document units and elevations in meters;
+``grid.scale`` converts between them.
+"""
+import math
+
+import numpy as np
+
+# Shifts one node apart up to this many nodes out, then growing by SHIFT_GROWTH
+NEAR_SHIFTS = 16
+SHIFT_GROWTH = 1.1
+
+
+def march_step(grid):
+    return min(abs(grid.dx), abs(grid.dy)) / 2
+
+
+def shadow_lengths(grid, x, y, direction, tan_altitude, top, fallback):
+    """Length of the shadow cast from points at elevation ``top`` (m), along ``direction``.
+
+    The shadow ends where the ground rises to the sun ray through the point.
+    Where the grid has no elevation the ground is taken as ``fallback`` (m).
+    ``top`` and ``fallback`` may be numbers or one per point. Lengths are in
+    document units, at most the grid's diagonal.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    top = np.broadcast_to(np.asarray(top, dtype=np.float64), x.shape)
+    fallback = np.broadcast_to(np.asarray(fallback, dtype=np.float64), x.shape)
+    step = march_step(grid)
+    drop = step / grid.scale * tan_altitude
+    n_rows, n_cols = grid.shape
+    diagonal = math.hypot(n_cols * grid.dx, n_rows * grid.dy)
+    lowest = min(np.nanmin(grid.z), fallback.min(initial=np.inf))
+    n_steps = int(min(math.ceil((top.max(initial=lowest) - lowest) / max(drop, 1e-12)),
+                      math.ceil(diagonal / step))) + 1
+
+    lengths = np.full(len(x), n_steps * step)
+    ground = grid.sample(x, y)
+    before = top - np.where(np.isnan(ground), fallback, ground)
+    lengths[before <= 0] = 0
+    running = np.flatnonzero(before > 0)
+    for k in range(1, n_steps + 1):
+        if not len(running):
+            break
+        ground = grid.sample(x[running] + k * step * direction[0], y[running] + k * step * direction[1])
+        clearance = (top[running] - k * drop) - np.where(np.isnan(ground), fallback[running], ground)
+        ended = clearance <= 0
+        if ended.any():
+            # Where the ray meets the ground, between this step and the one before
+            share = before[running[ended]] / np.maximum(before[running[ended]] - clearance[ended], 1e-12)
+            lengths[running[ended]] = (k - 1 + share) * step
+        before[running] = clearance
+        running = running[~ended]
+    return lengths
+
+
+def node_shifts(grid, azimuth):
+    """Whole-node shifts ``(rows, cols, distance_m)`` along an azimuth, nearest first."""
+    n_rows, n_cols = grid.shape
+    dx_m, dy_m = abs(grid.dx) / grid.scale, abs(grid.dy) / grid.scale
+    # Document y points south, and grid rows follow the sign of dy
+    east, south = math.sin(azimuth), -math.cos(azimuth)
+    reach = math.hypot(n_cols * dx_m, n_rows * dy_m)
+    spacing = min(dx_m, dy_m)
+    shifts = []
+    distance = spacing
+    while distance < reach:
+        col = int(round(distance * east / dx_m * math.copysign(1, grid.dx)))
+        row = int(round(distance * south / dy_m * math.copysign(1, grid.dy)))
+        if (row or col) and (not shifts or shifts[-1][:2] != (row, col)) and abs(row) < n_rows and abs(col) < n_cols:
+            shifts.append((row, col, math.hypot(col * dx_m, row * dy_m)))
+        distance = distance + spacing if distance < NEAR_SHIFTS * spacing else distance * SHIFT_GROWTH
+    return shifts
+
+
+def horizon_angles(grid, n_directions):
+    """Altitude of the terrain horizon (degrees, 0 for an open horizon) from every node.
+
+    Returns an (n_directions, rows, cols) array; direction ``i`` is the
+    azimuth ``i * 360 / n_directions`` degrees, clockwise from north.
+    """
+    # Single precision halves the memory every comparison goes through
+    z = grid.z.astype(np.float32)
+    n_rows, n_cols = grid.shape
+    rise_left = np.nanmax(z) - z
+    slope = np.empty(grid.shape, dtype=np.float32)
+    horizons = np.zeros((n_directions,) + grid.shape, dtype=np.float32)
+    for i in range(n_directions):
+        steepest = horizons[i]
+        for row, col, distance in node_shifts(grid, 2 * math.pi * i / n_directions):
+            # Stop once no hill further out could look steeper from any node
+            if not np.any(rise_left > steepest * distance):
+                break
+            here = (slice(max(0, -row), n_rows - max(0, row)), slice(max(0, -col), n_cols - max(0, col)))
+            there = (slice(max(0, row), n_rows + min(0, row)), slice(max(0, col), n_cols + min(0, col)))
+            rise = slope[:n_rows - abs(row), :n_cols - abs(col)]
+            np.subtract(z[there], z[here], out=rise)
+            rise /= distance
+            # fmax keeps the slope found so far where either node has no elevation
+            np.fmax(steepest[here], rise, out=steepest[here])
+        np.degrees(np.arctan(steepest, out=steepest), out=steepest)
+    horizons[:, np.isnan(z)] = np.nan
+    return horizons
+
+
+def horizon_towards(horizons, azimuth):
+    """Horizon altitude (degrees) at a sun azimuth, between the two nearest directions."""
+    n_directions = len(horizons)
+    position = (azimuth % 360) / 360 * n_directions
+    first = int(math.floor(position)) % n_directions
+    share = position - math.floor(position)
+    return (1 - share) * horizons[first] + share * horizons[(first + 1) % n_directions]
+
+
+def terrain_shadow(horizons, altitude, azimuth):
+    """Nodes the terrain itself hides from the sun at ``altitude``/``azimuth``, as a boolean grid."""
+    with np.errstate(invalid='ignore'):
+        return horizon_towards(horizons, azimuth) > altitude
+
+
+def positions_below_horizon(horizons, altitude, azimuth):
+    """How many of the sun positions (arrays of degrees) each node's horizon hides.
+
+    A sun position takes the horizon of the nearest direction.
+    """
+    n_directions = len(horizons)
+    direction = np.rint(np.asarray(azimuth) / 360 * n_directions).astype(np.int64) % n_directions
+    open_horizons = np.nan_to_num(horizons, nan=0.0)
+    counts = np.zeros(horizons.shape[1:], dtype=np.int64)
+    for i in range(n_directions):
+        counts += np.searchsorted(np.sort(altitude[direction == i]), open_horizons[i], side='left')
+    return counts
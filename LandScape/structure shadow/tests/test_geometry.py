@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from geometry import signed_area, split_edges, swept_outline, union
+
+
+def square(x, y, size):
+    return np.array([(x, y), (x + size, y), (x + size, y + size), (x, y + size)], dtype=np.float64)
+
+
+def area(rings):
+    return sum(signed_area(ring) for ring in rings)
+
+
+def test_split_edges_matches_every_pair():
+    rng = np.random.default_rng(0)
+    starts = rng.random((300, 2)) * 50
+    ends = starts + rng.normal(size=(300, 2)) * 4
+    pieces = np.hstack(split_edges(starts, ends))
+    # Cut by brute force: every pair of segments that cross
+    d = ends - starts
+    cuts = 0
+    for k in range(len(starts)):
+        q = starts - starts[k]
+        denominator = d[k, 0] * d[:, 1] - d[k, 1] * d[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (q[:, 0] * d[:, 1] - q[:, 1] * d[:, 0]) / denominator
+            u = (q[:, 0] * d[k, 1] - q[:, 1] * d[k, 0]) / denominator
+        cuts += np.count_nonzero((t > 0) & (t < 1) & (u > 0) & (u < 1))
+    assert len(pieces) == len(starts) + cuts
+    assert np.isclose(np.hypot(*(pieces[:, 2:] - pieces[:, :2]).T).sum(), np.hypot(*d.T).sum())
+
+
+def test_union_of_overlapping_squares():
+    assert np.isclose(area(union([square(0, 0, 2), square(1, 1, 2)])), 7)
+    assert np.isclose(area(union([square(0, 0, 2), square(5, 0, 1)])), 5)
+
+
+def test_flat_ring_adds_no_area():
+    flat = np.array([(0.5, 1), (3, 1), (1.5, 1)], dtype=np.float64)
+    assert np.isclose(area(union([square(0, 0, 2), flat])), 4)
+
+
+def test_swept_outline_area():
+    # A square swept by (dx, dy) gains |dx| + |dy| times its side
+    for offset in ((2, 1), (-3, 0.5), (0, -2)):
+        assert np.isclose(area(swept_outline([square(0, 0, 1)], offset)), 1 + abs(offset[0]) + abs(offset[1]))
@@ -0,0 +1,64 @@
+import math
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from geometry import points_inside, swept_outline
+from shade import shade_counts
+
+CELL = 1.0
+SHAPE = (60, 70)
+# Shadow edges the binned slices may move a cell across, as a share of the cell
+EDGE_SHIFT = 0.25
+
+
+def brute_force(structures, altitude, azimuth, centres):
+    """Sun positions shading each cell centre, from the exact swept shadow of every position.
+
+    Also returns, per cell, how many of those shadows have an edge within
+    ``EDGE_SHIFT`` cells of its centre.
+    """
+    nudges = [np.zeros(2)] + [np.array(step) * EDGE_SHIFT * CELL for step in ((1, 0), (-1, 0), (0, 1), (0, -1))]
+    counts = np.zeros(len(centres), dtype=np.int64)
+    on_edge = np.zeros(len(centres), dtype=np.int64)
+    for alt, az in zip(altitude, azimuth):
+        shaded = np.zeros((len(nudges), len(centres)), dtype=bool)
+        for rings, height in structures:
+            length = height / math.tan(math.radians(alt))
+            # Away from the sun, in document axes (y down)
+            outline = swept_outline(rings, (-math.sin(math.radians(az)) * length, math.cos(math.radians(az)) * length))
+            for k, nudge in enumerate(nudges):
+                shaded[k] |= points_inside(centres + nudge, outline)
+        counts += shaded[0]
+        on_edge += shaded.any(axis=0) != shaded.all(axis=0)
+    return counts, on_edge
+
+
+def test_binned_slices_match_swept_shadows():
+    square = [np.array([(20.0, 22.0), (30.0, 22.0), (30.0, 30.0), (20.0, 30.0)])]
+    ell = [np.array([(42.0, 30.0), (50.0, 30.0), (50.0, 34.0), (46.0, 34.0), (46.0, 40.0), (42.0, 40.0)])]
+    structures = [(square, 6.0), (ell, 3.0)]
+    rng = np.random.default_rng(0)
+    altitude = rng.uniform(15, 70, 60)
+    azimuth = rng.uniform(0, 360, 60)
+
+    counts, inside = shade_counts((0.0, 0.0), CELL, SHAPE, structures, altitude, azimuth, reach=5)
+    rows, cols = np.indices(SHAPE)
+    centres = np.column_stack(((cols.ravel() + 0.5) * CELL, (rows.ravel() + 0.5) * CELL))
+    expected, on_edge = brute_force(structures, altitude, azimuth, centres)
+
+    # Footprint cells come back in ``inside``
+    under = np.zeros(len(centres), dtype=bool)
+    for rings, _ in structures:
+        under |= points_inside(centres, rings)
+    assert np.array_equal(inside, under.reshape(SHAPE))
+
+    # Outside the footprints a cell is off only by sun positions whose shadow edge passes next to it
+    outside = ~inside.ravel()
+    difference = np.abs(counts.ravel() - expected)[outside]
+    assert (difference <= on_edge[outside]).all()
+    assert difference.max() <= 3
+    assert expected[outside].sum() > 5000
@@ -0,0 +1,54 @@
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from solar import parse_timezone, solar_noon, solar_position
+
+
+def position_at(latitude, longitude, moment, refract=True):
+    altitude, azimuth = solar_position(latitude, longitude, moment.timestamp(), refract=refract)
+    return float(altitude), float(azimuth)
+
+
+def test_equinox_sun_overhead_at_the_equator():
+    noon = solar_noon(0.0, datetime.date(2024, 3, 20))
+    altitude, _ = position_at(0.0, 0.0, noon)
+    assert altitude > 89.5
+
+
+def test_solar_noon_at_greenwich():
+    # The equation of time is near its maximum, +16.4 minutes, in early November
+    noon = solar_noon(0.0, datetime.date(2024, 11, 3))
+    expected = datetime.datetime(2024, 11, 3, 11, 43, 35, tzinfo=datetime.timezone.utc)
+    assert abs((noon - expected).total_seconds()) < 30
+
+
+def test_noon_altitude_and_azimuth_at_the_solstice():
+    noon = solar_noon(35.2, datetime.date(2024, 6, 21))
+    altitude, azimuth = position_at(32.0, 35.2, noon, refract=False)
+    # 90 degrees less the latitude, plus the declination of 23.44 degrees
+    assert altitude == pytest.approx(90 - 32.0 + 23.44, abs=0.05)
+    assert azimuth == pytest.approx(180, abs=0.5)
+
+
+def test_southern_summer_noon_sun_is_due_north():
+    noon = solar_noon(151.21, datetime.date(2024, 1, 15))
+    _, azimuth = position_at(-33.87, 151.21, noon)
+    assert min(azimuth, 360 - azimuth) < 0.5
+
+
+def test_parse_timezone():
+    summer = datetime.datetime(2024, 7, 1, 12)
+    winter = datetime.datetime(2024, 1, 1, 12)
+    jerusalem = parse_timezone("Asia/Jerusalem")
+    assert jerusalem.utcoffset(summer) == datetime.timedelta(hours=3)
+    assert jerusalem.utcoffset(winter) == datetime.timedelta(hours=2)
+    fixed = parse_timezone("+02:00")
+    assert fixed.utcoffset(summer) == fixed.utcoffset(winter) == datetime.timedelta(hours=2)
+    assert parse_timezone("UTC-5").utcoffset(None) == datetime.timedelta(hours=-5)
+    with pytest.raises(ValueError):
+        parse_timezone("Not/AZone")
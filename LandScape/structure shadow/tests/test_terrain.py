@@ -0,0 +1,55 @@
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'elevation'))
+
+from elevation_grid import ElevationGrid
+from terrain import horizon_angles, shadow_lengths
+
+# Document units per meter, and per node
+SCALE = 2.0
+SPACING = 1.0
+SHAPE = (80, 120)
+SLOPE = 0.2
+
+
+def plane(rise_east):
+    """A grid rising ``rise_east`` meters per meter towards the east (document +x)."""
+    cols = np.broadcast_to(np.arange(SHAPE[1], dtype=np.float64), SHAPE)
+    return ElevationGrid(rise_east * cols * SPACING / SCALE, 0.0, 0.0, SPACING, SPACING, SCALE)
+
+
+def shadows_east(grid, height, altitude):
+    x = np.array([10.0, 20.5, 33.3])
+    y = np.array([40.0, 12.7, 60.0])
+    ground = grid.sample(x, y)
+    return shadow_lengths(grid, x, y, (1.0, 0.0), math.tan(math.radians(altitude)), ground + height, 0.0)
+
+
+@pytest.mark.parametrize('altitude', [20.0, 35.0, 60.0])
+def test_shadow_on_flat_ground(altitude):
+    lengths = shadows_east(plane(0.0), 5.0, altitude)
+    assert lengths == pytest.approx(5.0 / math.tan(math.radians(altitude)) * SCALE, rel=1e-9)
+
+
+@pytest.mark.parametrize('altitude', [20.0, 35.0, 60.0])
+def test_shadow_shortened_by_rising_ground(altitude):
+    lengths = shadows_east(plane(SLOPE), 5.0, altitude)
+    assert lengths == pytest.approx(5.0 / (math.tan(math.radians(altitude)) + SLOPE) * SCALE, rel=1e-9)
+
+
+def test_horizon_of_a_slope():
+    n_directions = 8
+    horizons = horizon_angles(plane(SLOPE), n_directions)
+    east, west = n_directions // 4, 3 * n_directions // 4
+    # Away from the last column, looking uphill the horizon is the slope itself
+    assert horizons[east][:, :-1] == pytest.approx(math.degrees(math.atan(SLOPE)), abs=1e-4)
+    assert (horizons[east][:, -1] == 0).all()
+    # Downhill and across the slope the horizon is open
+    assert (horizons[west] == 0).all()
+    assert np.abs(horizons[0]).max() < 1e-4
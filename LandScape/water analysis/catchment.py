@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import os
+import sys
+
+import inkex
+import numpy as np
+from lxml import etree
+
+# The elevation grid and path helpers live with the elevation extension
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'elevation'))
+
+from elevation_grid import read_grid
+from path_data import polyline_path_data
+from hydrology import accumulate, d8_receivers, fill_depressions, upslope_mask
+from outline import fill_holes, mask_rings
+
+
+class CatchmentExtension(inkex.EffectExtension):
+    def add_arguments(self, pars):
+        pars.add_argument("--snap_distance", type=float, default=10.0,
+                          help="Move the pour point onto the largest flow within this distance (m)")
+
+    def effect(self):
+        svg_root = self.document.getroot()
+        pour_points = [point for point in map(self.pour_point, self.svg.selected.values()) if point is not None]
+        if not pour_points:
+            inkex.errormsg("Please select a circle, or a path ending, at the pour point (a dam, the low end of a swale...).")
+            return
+
+        precipitation_layer = self.find_layer("Precipitation")
+        if precipitation_layer is None:
+            inkex.errormsg("No 'Precipitation' layer found in the document.")
+            return
+        scale_factor = self.get_scale_factor()
+        if scale_factor is None:
+            return
+        grid = read_grid(svg_root, scale_factor)
+        if grid is None:
+            inkex.errormsg("No elevation grid found in the document. Run '3. Elevation' with "
+                           "'keep the elevation grid in the document' ticked first.")
+            return
+
+        # Single flow direction gives every cell to exactly one catchment
+        dx, dy = grid.spacing_m
+        filled = fill_depressions(grid.z)
+        receivers = d8_receivers(filled, dx, dy)
+        accumulation = accumulate(filled, dx * dy, receivers)
+
+        for x, y in pour_points:
+            outlet = self.snap_outlet(grid, accumulation, x, y)
+            if outlet is None:
+                inkex.errormsg(f"The pour point at ({x:.1f}, {y:.1f}) is outside the elevation grid.")
+                continue
+            mask = fill_holes(upslope_mask(receivers, [outlet], grid.shape))
+            area_m2 = mask.sum() * dx * dy
+            self.draw_catchment(precipitation_layer, grid, mask, area_m2)
+            inkex.utils.debug(f"Catchment of [{area_m2:.2f}m²] added to the 'Precipitation' layer. "
+                              f"Run '5. Precipitation' to label it with its yearly rain volume.")
+
+    def pour_point(self, element):
+        """Document position of a selected circle's centre or of a path's last node."""
+        if isinstance(element, (inkex.Circle, inkex.Ellipse)):
+            point = element.center
+        elif isinstance(element, inkex.PathElement):
+            end_points = list(element.path.end_points)
+            if not end_points:
+                return None
+            point = end_points[-1]
+        else:
+            return None
+        point = element.composed_transform().apply_to_point(point)
+        return point.x, point.y
+
+    def snap_outlet(self, grid, accumulation, x, y):
+        """Flat index of the cell draining the most within ``snap_distance`` of (x, y), or None."""
+        row, col = grid.to_grid(x, y)
+        n_rows, n_cols = grid.shape
+        if not (-0.5 <= row <= n_rows - 0.5 and -0.5 <= col <= n_cols - 0.5):
+            return None
+        dx, dy = grid.spacing_m
+        reach = self.options.snap_distance
+        rows = np.arange(max(0, int(np.floor(row - reach / dy))), min(n_rows, int(np.ceil(row + reach / dy)) + 1))
+        cols = np.arange(max(0, int(np.floor(col - reach / dx))), min(n_cols, int(np.ceil(col + reach / dx)) + 1))
+        distance = np.hypot((rows[:, None] - row) * dy, (cols[None, :] - col) * dx)
+        area = np.where((distance <= reach) & np.isfinite(grid.z[np.ix_(rows, cols)]),
+                        accumulation[np.ix_(rows, cols)], -1.0)
+        if area.max() < 0:
+            # Nothing within reach: take the nearest node with data
+            area = np.where(np.isfinite(grid.z[np.ix_(rows, cols)]), -distance, -np.inf)
+            if not np.isfinite(area.max()):
+                return None
+        best_row, best_col = np.unravel_index(np.argmax(area), area.shape)
+        return int(rows[best_row]) * n_cols + int(cols[best_col])
+
+    def draw_catchment(self, precipitation_layer, grid, mask, area_m2):
+        """Add the catchment outline as a closed path, straight in the 'Precipitation' layer."""
+        rings = []
+        for ring in mask_rings(mask):
+            # Corner (i, j) is the top-left corner of the cell around node (i, j)
+            x, y = grid.to_document(ring[:, 0] - 0.5, ring[:, 1] - 0.5)
+            rings.append(np.column_stack((x, y)))
+        path = etree.SubElement(precipitation_layer, inkex.addNS('path', 'svg'))
+        # Enough decimals for the Precipitation extension to measure the same area
+        path.set('d', polyline_path_data(rings, precision=4))
+        path.set('style', "fill:#1f78b4;fill-opacity:0.15;stroke:#1f78b4;stroke-width:0.5")
+        path.set(inkex.addNS('label', 'inkscape'), f"Catchment [{area_m2:.2f}m²]")
+        return path
+
+    def find_layer(self, label):
+        """Find a layer by its label."""
+        layers = self.document.getroot().xpath(
+            f"//svg:g[@inkscape:label='{label}']", namespaces=inkex.NSS
+        )
+        return layers[0] if layers else None
+
+    def get_scale_factor(self):
+        """Retrieve scale factor from metadata."""
+        scale_factor_element = self.document.getroot().xpath('//inkscape:scalefactor', namespaces=inkex.NSS)
+        if scale_factor_element:
+            try:
+                return float(scale_factor_element[0].text)
+            except ValueError:
+                inkex.errormsg("Invalid scale factor value in metadata.")
+        else:
+            inkex.errormsg("Scale factor not found in metadata.")
+        return None
+
+
+if __name__ == '__main__':
+    CatchmentExtension().run()
@@ -0,0 +1,272 @@
+"""Surface water routing on the elevation grid.
+
+* ``fill_depressions`` - priority-flood with an epsilon gradient (Barnes,
+  Lehman & Mulla 2014), O(n log n). Pits are raised just enough that every
+  cell drains to the grid edge or a missing sample.
+* ``d8_receivers`` / ``dinf_receivers`` - the steepest single neighbour
+  (D8), or the steepest direction split between two neighbours (D-infinity,
+  Tarboton 1997). Both are computed for the whole grid at once.
+* ``accumulate`` - upslope contributing area of every cell.
+* ``channel_segments`` - cells above an area threshold chained into
+  drainage lines between heads, confluences and outlets.
+* ``upslope_mask`` - every cell draining through a pour point (its catchment).
+* ``keypoint_index`` - where a valley floor profile turns from steepening
+  to flattening, the keyline keypoint.
+
+Cells are addressed by flat index ``row * cols + col``; -1 means "no cell".
+"""
+import heapq
+import math
+from collections import deque
+
+import numpy as np
+
+NEIGHBOURS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+# D-infinity facets: a cardinal neighbour and the diagonal one next to it
+FACETS = (
+    ((0, 1), (-1, 1)), ((-1, 0), (-1, 1)), ((-1, 0), (-1, -1)), ((0, -1), (-1, -1)),
+    ((0, -1), (1, -1)), ((1, 0), (1, -1)), ((1, 0), (1, 1)), ((0, 1), (1, 1)),
+)
+
+
+def shifted(padded, dr, dc, shape):
+    """View of the neighbour (dr, dc) of every cell in a grid padded by one cell."""
+    rows, cols = shape
+    return padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+
+
+def fill_depressions(z):
+    """Return ``z`` with every depression filled, keeping a tiny slope across flats.
+
+    Missing samples (NaN) stay missing and act as outlets, like the grid edge.
+    """
+    rows, cols = z.shape
+    width = cols + 2
+    padded = np.full((rows + 2, width), np.nan)
+    padded[1:-1, 1:-1] = z
+    missing = ~np.isfinite(padded)
+
+    # Flood from every cell next to the edge or to a missing sample
+    touching = np.zeros(z.shape, dtype=bool)
+    for dr, dc in NEIGHBOURS:
+        touching |= shifted(missing, dr, dc, z.shape)
+    seeds = np.zeros(padded.shape, dtype=bool)
+    seeds[1:-1, 1:-1] = touching & np.isfinite(z)
+    seeds = np.flatnonzero(seeds)
+
+    filled = padded.ravel().tolist()
+    closed = bytearray((missing.ravel() | np.isin(np.arange(padded.size), seeds)).astype(np.uint8).tobytes())
+    heap = list(zip(padded.ravel()[seeds].tolist(), seeds.tolist()))
+    heapq.heapify(heap)
+    pit = deque()
+    offsets = [dr * width + dc for dr, dc in NEIGHBOURS]
+    nextafter = math.nextafter
+    inf = math.inf
+
+    while heap or pit:
+        if pit and heap and heap[0][0] == filled[pit[0]]:
+            cell = heapq.heappop(heap)[1]
+        elif pit:
+            cell = pit.popleft()
+        else:
+            cell = heapq.heappop(heap)[1]
+        raised = nextafter(filled[cell], inf)
+        for offset in offsets:
+            n = cell + offset
+            if closed[n]:
+                continue
+            closed[n] = 1
+            if filled[n] <= raised:
+                filled[n] = raised
+                pit.append(n)
+            else:
+                heapq.heappush(heap, (filled[n], n))
+
+    return np.array(filled).reshape(padded.shape)[1:-1, 1:-1]
+
+
+def d8_receivers(filled, dx, dy):
+    """Flat index of the steepest downhill neighbour of every cell, -1 for outlets."""
+    rows, cols = filled.shape
+    padded = np.pad(filled, 1, constant_values=np.nan)
+    index = np.arange(rows * cols).reshape(rows, cols)
+    steepest = np.zeros(filled.shape)
+    receivers = np.full(filled.shape, -1, dtype=np.int64)
+    with np.errstate(invalid='ignore'):
+        for dr, dc in NEIGHBOURS:
+            slope = (filled - shifted(padded, dr, dc, filled.shape)) / math.hypot(dr * dy, dc * dx)
+            better = slope > steepest
+            steepest[better] = slope[better]
+            receivers[better] = (index + dr * cols + dc)[better]
+    return receivers.ravel()
+
+
+def dinf_receivers(filled, dx, dy):
+    """D-infinity flow of every cell as ``(cardinal, diagonal, cardinal_share)``.
+
+    The two receivers are flat indices (-1 for none); the diagonal one gets
+    ``1 - cardinal_share`` of the flow.
+    """
+    rows, cols = filled.shape
+    padded = np.pad(filled, 1, constant_values=np.nan)
+    index = np.arange(rows * cols).reshape(rows, cols)
+    steepest = np.zeros(filled.shape)
+    cardinal = np.full(filled.shape, -1, dtype=np.int64)
+    diagonal = np.full(filled.shape, -1, dtype=np.int64)
+    share = np.ones(filled.shape)
+
+    with np.errstate(invalid='ignore'):
+        for (r1, c1), (r2, c2) in FACETS:
+            d1, d2 = (dx, dy) if c1 else (dy, dx)
+            e1 = shifted(padded, r1, c1, filled.shape)
+            e2 = shifted(padded, r2, c2, filled.shape)
+            s1 = (filled - e1) / d1
+            s2 = (e1 - e2) / d2
+            alpha = math.atan2(d2, d1)
+            angle = np.arctan2(s2, s1)
+            slope = np.hypot(s1, s2)
+            # Directions outside the facet are clamped to its edges
+            low = angle < 0
+            angle[low] = 0
+            slope[low] = s1[low]
+            high = angle > alpha
+            angle[high] = alpha
+            slope[high] = ((filled - e2) / math.hypot(d1, d2))[high]
+
+            better = slope > steepest
+            steepest[better] = slope[better]
+            fraction = 1 - angle / alpha
+            share[better] = fraction[better]
+            cardinal[better] = (index + r1 * cols + c1)[better]
+            diagonal[better] = (index + r2 * cols + c2)[better]
+
+    # Drop a receiver that gets (almost) nothing
+    cardinal[share <= 1e-9] = -1
+    diagonal[share >= 1 - 1e-9] = -1
+    return cardinal.ravel(), diagonal.ravel(), share.ravel()
+
+
+def accumulate(filled, cell_area, receivers, second=None, share=None):
+    """Upslope area draining through every cell (including the cell itself).
+
+    ``receivers`` gets ``share`` of each cell's flow and ``second`` the rest;
+    with only ``receivers`` (D8) it gets all of it. Cells are visited from
+    the highest down, so every cell is complete before it passes flow on.
+    """
+    flat = filled.ravel()
+    valid = np.isfinite(flat)
+    area = np.where(valid, cell_area, 0.0).tolist()
+    order = np.flatnonzero(valid)
+    order = order[np.argsort(-flat[order], kind='stable')].tolist()
+    first = receivers.tolist()
+
+    if second is None:
+        for cell in order:
+            target = first[cell]
+            if target >= 0:
+                area[target] += area[cell]
+    else:
+        other = second.tolist()
+        shares = share.tolist()
+        for cell in order:
+            flow = area[cell]
+            target = first[cell]
+            if target >= 0:
+                area[target] += flow * shares[cell]
+            target = other[cell]
+            if target >= 0:
+                area[target] += flow * (1 - shares[cell])
+    return np.array(area).reshape(filled.shape)
+
+
+def channel_segments(receivers, accumulation, threshold):
+    """Chain the cells draining at least ``threshold`` into drainage lines.
+
+    Each line runs downstream from a channel head or a confluence to the next
+    confluence or outlet, so lines share their confluence cells. Returns the
+    lines as lists of flat indices, and the number of channel cells draining
+    into each cell.
+    """
+    stream = accumulation.ravel() >= threshold
+    flowing = np.flatnonzero(stream & (receivers >= 0))
+    targets = receivers[flowing]
+    inflows = np.bincount(targets[stream[targets]], minlength=stream.size)
+
+    receivers_list = receivers.tolist()
+    stream_list = stream.tolist()
+    inflows_list = inflows.tolist()
+    lines = []
+    for start in np.flatnonzero(stream & (inflows != 1)).tolist():
+        line = [start]
+        cell = receivers_list[start]
+        while cell >= 0 and stream_list[cell]:
+            line.append(cell)
+            if inflows_list[cell] != 1:
+                break
+            cell = receivers_list[cell]
+        if len(line) > 1:
+            lines.append(line)
+    return lines, inflows
+
+
+def main_donors(receivers, accumulation):
+    """For every cell, the neighbour draining into it with the largest area (-1 for none).
+
+    Following main donors upstream from a channel head traces its valley
+    floor up to the ridge.
+    """
+    area = accumulation.ravel()
+    donors = np.full(receivers.size, -1, dtype=np.int64)
+    flowing = np.flatnonzero(receivers >= 0)
+    # Sorted by receiver, then by area: the last donor of each receiver is the largest
+    flowing = flowing[np.lexsort((area[flowing], receivers[flowing]))]
+    targets = receivers[flowing]
+    last = np.append(targets[1:] != targets[:-1], True)
+    donors[targets[last]] = flowing[last]
+    return donors
+
+
+def keypoint_index(elevations, distances, margin=2):
+    """Index of the keypoint along a valley floor profile, or None.
+
+    The keypoint is where the valley turns from convex (steepening) to
+    concave (flattening), i.e. the steepest point of the lightly smoothed
+    profile. Profiles that only steepen or only flatten have none.
+    """
+    if len(elevations) < 2 * margin + 3:
+        return None
+    slope = -np.gradient(np.asarray(elevations, dtype=np.float64), np.asarray(distances, dtype=np.float64))
+    slope = np.convolve(np.pad(slope, 1, mode='edge'), np.ones(3) / 3, mode='valid')
+    index = int(np.argmax(slope))
+    if index < margin or index > len(slope) - 1 - margin:
+        return None
+    if slope[index] <= 1.2 * max(slope[0], slope[-1], 0):
+        return None
+    return index
+
+
+def upslope_mask(receivers, outlets, shape):
+    """Boolean grid of the cells draining through any of ``outlets`` (flat indices).
+
+    Donors are looked up in the receivers sorted once, and the search walks
+    upstream one ring of donors at a time, so each step is a few array
+    operations whatever the size of the catchment.
+    """
+    order = np.argsort(receivers, kind='stable')
+    sorted_receivers = receivers[order]
+    mask = np.zeros(receivers.size, dtype=bool)
+    frontier = np.unique(np.asarray(outlets, dtype=np.int64))
+    mask[frontier] = True
+    while frontier.size:
+        first = np.searchsorted(sorted_receivers, frontier, side='left')
+        counts = np.searchsorted(sorted_receivers, frontier, side='right') - first
+        total = int(counts.sum())
+        if not total:
+            break
+        # Positions first[k] .. first[k] + counts[k] - 1 of every frontier cell, flattened
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        donors = order[np.repeat(first, counts) + offsets]
+        frontier = donors[~mask[donors]]
+        mask[frontier] = True
+    return mask.reshape(shape)
@@ -0,0 +1,79 @@
+"""Outline of a set of grid cells as closed polygons.
+
+Every cell is the rectangle around its grid node, so the outline follows
+the cell edges (a staircase) and encloses exactly the cells' area.
+"""
+from collections import deque
+
+import numpy as np
+
+
+def fill_holes(mask):
+    """``mask`` with every region not connected to the grid edge filled in."""
+    padded = np.pad(mask, 1)
+    width = padded.shape[1]
+    open_cells = (~padded).ravel().tolist()
+    outside = bytearray(padded.size)
+    outside[0] = 1
+    queue = deque([0])
+    # Stepping off one end of a row lands on the padding of the next, which is open anyway
+    while queue:
+        cell = queue.popleft()
+        for n in (cell - width, cell + width, cell - 1, cell + 1):
+            if 0 <= n < padded.size and open_cells[n] and not outside[n]:
+                outside[n] = 1
+                queue.append(n)
+    reached = np.frombuffer(bytes(outside), dtype=np.uint8).reshape(padded.shape)[1:-1, 1:-1]
+    return mask | (reached == 0)
+
+
+def mask_rings(mask):
+    """Closed rings around the cells of ``mask``, in corner coordinates.
+
+    Corner (i, j) is the top-left corner of cell (i, j). Rings run clockwise
+    on the page (rows grow downwards), start and end on the same corner and
+    keep only the corners where the outline turns. Regions touching at a
+    single corner may come out as one ring pinched at that corner.
+    """
+    padded = np.pad(mask, 1)
+    inside = padded[1:-1, 1:-1]
+    rows, cols = np.nonzero(inside & ~padded[:-2, 1:-1])
+    edges = [((rows, cols), (rows, cols + 1))]
+    rows, cols = np.nonzero(inside & ~padded[1:-1, 2:])
+    edges.append(((rows, cols + 1), (rows + 1, cols + 1)))
+    rows, cols = np.nonzero(inside & ~padded[2:, 1:-1])
+    edges.append(((rows + 1, cols + 1), (rows + 1, cols)))
+    rows, cols = np.nonzero(inside & ~padded[1:-1, :-2])
+    edges.append(((rows + 1, cols), (rows, cols)))
+
+    following = {}
+    for (r0, c0), (r1, c1) in edges:
+        for start, end in zip(zip(r0.tolist(), c0.tolist()), zip(r1.tolist(), c1.tolist())):
+            following.setdefault(start, []).append(end)
+
+    rings = []
+    while following:
+        start = next(iter(following))
+        ring = [start]
+        corner = start
+        while True:
+            ends = following[corner]
+            end = ends.pop()
+            if not ends:
+                del following[corner]
+            corner = end
+            ring.append(corner)
+            if corner == start:
+                break
+        rings.append(corners_only(ring))
+    return rings
+
+
+def corners_only(ring):
+    """Drop the points of a closed ring that lie on a straight run."""
+    points = np.asarray(ring, dtype=np.int64)
+    before = points[:-1] - np.roll(points[:-1], 1, axis=0)
+    after = np.roll(points[:-1], -1, axis=0) - points[:-1]
+    turning = (before != after).any(axis=1)
+    kept = points[:-1][turning]
+    return np.vstack((kept, kept[:1]))
@@ -0,0 +1,70 @@
+import math
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from hydrology import accumulate, d8_receivers, dinf_receivers, fill_depressions
+
+
+def bowl_with_pits():
+    r, c = np.indices((30, 40), dtype=np.float64)
+    z = 0.1 * (r - 15) ** 2 + 0.05 * c
+    z[10, 10] -= 5
+    z[20:23, 30:33] -= 3
+    return z
+
+
+def test_filling_leaves_no_interior_sink():
+    z = bowl_with_pits()
+    z[5, 35] = np.nan
+    filled = fill_depressions(z)
+    assert np.array_equal(np.isnan(filled), np.isnan(z))
+    assert (filled[np.isfinite(z)] >= z[np.isfinite(z)]).all()
+    receivers = d8_receivers(filled, 1.0, 1.0).reshape(z.shape)
+    sinks = np.argwhere((receivers == -1) & np.isfinite(filled))
+    # Only cells next to the edge or the missing sample drain nowhere
+    for row, col in sinks:
+        around = filled[max(row - 1, 0):row + 2, max(col - 1, 0):col + 2]
+        assert row in (0, 29) or col in (0, 39) or np.isnan(around).any()
+
+
+def test_filling_raises_only_the_pits():
+    r, c = np.indices((30, 40), dtype=np.float64)
+    z = 0.05 * c + 0.01 * r
+    z[10, 10] -= 5
+    z[20:23, 30:33] -= 3
+    filled = fill_depressions(z)
+    raised = filled - z > 1e-6
+    assert raised[10, 10] and raised[20:23, 30:33].all()
+    assert np.count_nonzero(raised) == 1 + 9
+
+
+def test_dinf_splits_flow_between_the_facet_edges():
+    # Downhill to the east and half as steeply to the north
+    r, c = np.indices((5, 5), dtype=np.float64)
+    z = -c + 0.5 * r
+    cardinal, diagonal, share = dinf_receivers(z, 1.0, 1.0)
+    cell = 2 * 5 + 2
+    assert cardinal[cell] == cell + 1 and diagonal[cell] == cell - 5 + 1
+    assert np.isclose(share[cell], 1 - math.atan(0.5) / (math.pi / 4))
+
+
+def test_dinf_along_a_cardinal_direction_is_single():
+    r, c = np.indices((5, 5), dtype=np.float64)
+    cardinal, diagonal, share = dinf_receivers(-c, 1.0, 1.0)
+    assert cardinal[12] == 13 and diagonal[12] == -1 and share[12] == 1
+
+
+def test_accumulation_conserves_area():
+    r, c = np.indices((6, 8), dtype=np.float64)
+    ramp = -c + 0.0 * r
+    area = accumulate(ramp, 2.0, d8_receivers(ramp, 1.0, 1.0))
+    assert np.allclose(area, 2.0 * (c + 1))
+    z = fill_depressions(bowl_with_pits())
+    cardinal, diagonal, share = dinf_receivers(z, 1.0, 1.0)
+    area = accumulate(z, 1.0, cardinal, diagonal, share)
+    outlets = ((cardinal == -1) & (diagonal == -1)).reshape(z.shape)
+    assert np.isclose(area[outlets].sum(), z.size)
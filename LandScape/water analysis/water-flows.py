@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import math
+import os
+import sys
+
+import inkex
+import numpy as np
+from lxml import etree
+
+# The elevation grid and path helpers live with the elevation extension
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'elevation'))
+
+from elevation_grid import read_grid
+from path_data import polyline_path_data
+from hydrology import (accumulate, channel_segments, d8_receivers, dinf_receivers, fill_depressions,
+                       keypoint_index, main_donors)
+
+# Drainage lines are drawn in one path per width class, from the smallest streams up
+LINE_CLASSES = 4
+
+
+class WaterFlowsExtension(inkex.EffectExtension):
+    def add_arguments(self, pars):
+        pars.add_argument("--flow_method", type=str, default="dinf", help="d8 or dinf")
+        pars.add_argument("--threshold_area", type=float, default=2000.0, help="Upslope area of a drainage line (m²)")
+        pars.add_argument("--keypoints", type=inkex.Boolean, default=True, help="Mark candidate keypoints")
+
+    def effect(self):
+        svg_root = self.document.getroot()
+        flows_layer = self.find_layer("Flows")
+        if flows_layer is None:
+            inkex.errormsg("No 'Flows' layer found in the document. Run '1. Primary Data' first.")
+            return
+        keyline_layer = self.find_layer("Keyline Analysis")
+        if self.options.keypoints and keyline_layer is None:
+            inkex.errormsg("No 'Keyline Analysis' layer found in the document.")
+            return
+
+        scale_factor = self.get_scale_factor()
+        if scale_factor is None:
+            return
+        grid = read_grid(svg_root, scale_factor)
+        if grid is None:
+            inkex.errormsg("No elevation grid found in the document. Run '3. Elevation' with "
+                           "'keep the elevation grid in the document' ticked first.")
+            return
+        if not np.isfinite(grid.z).any():
+            inkex.errormsg("The elevation grid has no data.")
+            return
+
+        dx, dy = grid.spacing_m
+        cell_area = dx * dy
+        filled = fill_depressions(grid.z)
+        receivers = d8_receivers(filled, dx, dy)
+        if self.options.flow_method == "dinf":
+            accumulation = accumulate(filled, cell_area, *dinf_receivers(filled, dx, dy))
+        else:
+            accumulation = accumulate(filled, cell_area, receivers)
+
+        threshold = max(self.options.threshold_area, cell_area)
+        lines, inflows = channel_segments(receivers, accumulation, threshold)
+        self.draw_drainage_lines(flows_layer, grid, lines, accumulation, threshold)
+
+        keypoints = 0
+        if self.options.keypoints:
+            keypoints = self.draw_keypoints(keyline_layer, grid, filled, receivers, accumulation, lines, inflows)
+
+        inkex.utils.debug(f"Water flows ({self.options.flow_method}): {len(lines)} drainage lines draining "
+                          f"more than {threshold:.0f} m², {keypoints} candidate keypoints.")
+
+    def draw_drainage_lines(self, flows_layer, grid, lines, accumulation, threshold):
+        """Draw drainage lines in a 'drainage lines' sublayer, wider for larger upslope areas.
+
+        Area classes are powers of ten above the threshold.
+        """
+        sublayer = self.replace_sublayer(flows_layer, "drainage lines")
+        area = accumulation.ravel()
+        n_cols = grid.shape[1]
+        classes = {}
+        for line in lines:
+            # A line is classed by the area at its downstream end
+            size = min(int(math.log10(area[line[-1]] / threshold)), LINE_CLASSES - 1)
+            rows, cols = np.divmod(np.asarray(line), n_cols)
+            x, y = grid.to_document(rows, cols)
+            classes.setdefault(size, []).append(np.column_stack((x, y)))
+
+        stroke = self.svg.unittouu('0.3mm')
+        for size in sorted(classes):
+            path = etree.SubElement(sublayer, inkex.addNS('path', 'svg'))
+            path.set('d', polyline_path_data(classes[size]))
+            path.set('style', f"stroke:#1f78b4;fill:none;stroke-linecap:round;stroke-linejoin:round;"
+                              f"stroke-width:{stroke * (1 + size):.3f}")
+            path.set(inkex.addNS('label', 'inkscape'), f"over {threshold * 10 ** size:.0f} m²")
+
+    def draw_keypoints(self, keyline_layer, grid, filled, receivers, accumulation, lines, inflows):
+        """Mark the keypoint of every first-order valley in a 'keypoints' sublayer.
+
+        Each valley floor is traced from its channel head up to the ridge and
+        down to the first confluence.
+        """
+        sublayer = self.replace_sublayer(keyline_layer, "keypoints")
+        donors = main_donors(receivers, accumulation)
+        z = filled.ravel()
+        n_cols = grid.shape[1]
+        dx, dy = grid.spacing_m
+        radius = self.svg.unittouu('1mm')
+        count = 0
+
+        for line in lines:
+            head = line[0]
+            if inflows[head]:
+                continue
+            upstream = []
+            cell = donors[head]
+            while cell >= 0:
+                upstream.append(cell)
+                cell = donors[cell]
+            profile = np.asarray(upstream[::-1] + line, dtype=np.int64)
+            rows, cols = np.divmod(profile, n_cols)
+            steps = np.hypot(np.diff(cols) * dx, np.diff(rows) * dy)
+            distances = np.concatenate(([0.0], np.cumsum(steps)))
+            index = keypoint_index(z[profile], distances)
+            if index is None:
+                continue
+
+            cell = int(profile[index])
+            row, col = divmod(cell, n_cols)
+            x, y = grid.to_document(row, col)
+            elevation = float(grid.z[row, col]) if np.isfinite(grid.z[row, col]) else float(z[cell])
+            circle = etree.SubElement(sublayer, inkex.addNS('circle', 'svg'))
+            circle.set('style', "stroke:#ffffff;stroke-width:0.2;fill:#e31a1c")
+            circle.set('r', str(radius))
+            circle.set('cx', str(x))
+            circle.set('cy', str(y))
+            circle.set(inkex.addNS('label', 'inkscape'), f"Keypoint {elevation:.1f}m")
+            title = etree.SubElement(circle, 'title')
+            title.text = f"Keypoint: {elevation:.1f} m, {accumulation.ravel()[cell]:.0f} m² upslope"
+            count += 1
+        return count
+
+    def replace_sublayer(self, parent_layer, label):
+        """A fresh sublayer for this run; the one drawn by an earlier run is removed."""
+        for old in parent_layer.findall('svg:g', inkex.NSS):
+            if old.get(inkex.addNS('label', 'inkscape')) == label:
+                parent_layer.remove(old)
+        sublayer = etree.SubElement(parent_layer, inkex.addNS('g', 'svg'))
+        sublayer.set(inkex.addNS('label', 'inkscape'), label)
+        sublayer.set(inkex.addNS('groupmode', 'inkscape'), 'layer')
+        return sublayer
+
+    def find_layer(self, label):
+        """Find a layer by its label."""
+        layers = self.document.getroot().xpath(
+            f"//svg:g[@inkscape:label='{label}']", namespaces=inkex.NSS
+        )
+        return layers[0] if layers else None
+
+    def get_scale_factor(self):
+        """Retrieve scale factor from metadata."""
+        scale_factor_element = self.document.getroot().xpath('//inkscape:scalefactor', namespaces=inkex.NSS)
+        if scale_factor_element:
+            try:
+                return float(scale_factor_element[0].text)
+            except ValueError:
+                inkex.errormsg("Invalid scale factor value in metadata.")
+        else:
+            inkex.errormsg("Scale factor not found in metadata.")
+        return None
+
+
+if __name__ == '__main__':
+    WaterFlowsExtension().run()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Benchmark the elevation extension offline.
+
+Starts the stand-in proxy, generates a site SVG and runs the elevation
+extension headless once per grid size, each run in a fresh process with an
+empty elevation cache. For every run it records the wall time, peak RSS,
+proxy requests and output SVG size, plus the same figures per stage
+(sampling, contouring, writing) as reported by the extension:
+
+    python3 bench_elevation.py --sizes 50,100,200,350 --latency 0.02
+    python3 bench_elevation.py --sizes 200 --json results.jsonl -- --sampling=sparse
+
+Arguments after '--' are passed on to the extension.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from stand_in_proxy import StandInProxy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ELEVATION_SCRIPT = os.path.join(ROOT, 'LandScape', 'elevation', 'elevation.py')
+
+SITE_SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+     width="{width}mm" height="{height}mm" viewBox="0 0 {width} {height}">
+  <metadata>
+    <inkscape:geodata latitude="{lat}" longitude="{lon}" zoomlevel="17" annual_rainfall_avg="550"/>
+    <inkscape:scalefactor>{scale}</inkscape:scalefactor>
+  </metadata>
+  <g inkscape:label="Base Map" inkscape:groupmode="layer" id="base_map">
+    <g inkscape:label="Calculated Elevation Map" inkscape:groupmode="layer" id="calculated_elevation"/>
+  </g>
+</svg>
+"""
+
+
+def write_site(path, lat, lon, width=297, height=210, scale=1.0):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(SITE_SVG.format(lat=lat, lon=lon, width=width, height=height, scale=scale))
+
+
+def run_extension(svg_path, output_path, env, extra_args):
+    """Run the extension in a child process; returns (seconds, peak RSS in KiB or None, exit code, stderr)."""
+    command = [sys.executable, ELEVATION_SCRIPT, f'--output={output_path}'] + extra_args + [svg_path]
+    start = time.perf_counter()
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in bytes on macOS and KiB elsewhere
+            peak = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+        else:
+            process.wait()
+            peak = None
+        seconds = time.perf_counter() - start
+        stderr.seek(0)
+        messages = stderr.read().decode('utf-8', 'replace')
+    return seconds, peak, process.returncode, messages
+
+
+def bench_size(proxy, workdir, size, args, extra_args):
+    svg_path = os.path.join(workdir, 'site.svg')
+    output_path = os.path.join(workdir, f'out_{size}.svg')
+    timings_path = os.path.join(workdir, f'timings_{size}.json')
+    cache_dir = tempfile.mkdtemp(prefix=f'cache_{size}_', dir=workdir)
+
+    env = dict(os.environ)
+    env.update({
+        'LANDSCAPE_API_PROXY': proxy.url,
+        'LANDSCAPE_CACHE_DIR': cache_dir,
+        'LANDSCAPE_TIMINGS_FILE': timings_path,
+    })
+    proxy.reset_counts()
+    seconds, peak, code, messages = run_extension(
+        svg_path, output_path, env, [f'--num_points={size}', '--checkpoint=false'] + extra_args)
+
+    stages = []
+    if os.path.exists(timings_path):
+        with open(timings_path, encoding='utf-8') as f:
+            stages = json.load(f)['stages']
+    return {
+        'num_points': size,
+        'grid_points': size * size,
+        'exit_code': code,
+        'seconds': round(seconds, 3),
+        'peak_rss_kb': peak,
+        'requests': proxy.counts.get('elevation', 0),
+        'output_bytes': os.path.getsize(output_path) if os.path.exists(output_path) else None,
+        'latency': args.latency,
+        'args': extra_args,
+        'stages': [dict(stage, seconds=round(stage['seconds'], 3)) for stage in stages],
+        'messages': messages.strip().splitlines()[-5:] if code else [],
+    }
+
+
+def print_result(result):
+    rss = f"{result['peak_rss_kb'] / 1024:.0f} MB" if result['peak_rss_kb'] else "n/a"
+    size = f"{result['output_bytes'] / 1024:.0f} KB" if result['output_bytes'] is not None else "n/a"
+    print(f"{result['num_points']:>5} x {result['num_points']:<5} {result['seconds']:>8.2f} s {rss:>8} "
+          f"{result['requests']:>8} req {size:>9}")
+    for stage in result['stages']:
+        stage_rss = f"{stage['peak_rss_kb'] / 1024:.0f} MB" if stage['peak_rss_kb'] else "n/a"
+        print(f"      {stage['stage']:<11} {stage['seconds']:>8.2f} s {stage_rss:>8} {stage['requests']:>8} req")
+    for message in result['messages']:
+        print(f"      ! {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='50,100,200,350', help="comma separated num_points values")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the stand-in proxy adds to every request")
+    parser.add_argument('--failure_rate', type=float, default=0.0, help="fraction of proxy requests answered with HTTP 503")
+    parser.add_argument('--lat', type=float, default=32.1)
+    parser.add_argument('--lon', type=float, default=34.9)
+    parser.add_argument('--json', help="append one JSON line per run to this file")
+    parser.add_argument('extension_args', nargs='*', help="extra arguments for the extension (after '--')")
+    args = parser.parse_args()
+
+    proxy = StandInProxy(('127.0.0.1', 0), args.latency, args.failure_rate)
+    proxy.start()
+    print(f"stand-in proxy on {proxy.url}, latency {args.latency}s, extension args: {' '.join(args.extension_args) or '-'}")
+    print(f"{'grid':<13} {'wall':>10} {'peak RSS':>8} {'requests':>12} {'output':>9}")
+
+    with tempfile.TemporaryDirectory(prefix='landscape_bench_') as workdir:
+        write_site(os.path.join(workdir, 'site.svg'), args.lat, args.lon)
+        for size in (int(s) for s in args.sizes.split(',')):
+            result = bench_size(proxy, workdir, size, args, args.extension_args)
+            print_result(result)
+            if args.json:
+                with open(args.json, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(result) + '\n')
+    proxy.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Local stand-in for the LandScape API proxy.
+
+Answers the same POST requests as LANDSCAPE_API_PROXY for the endpoints the
+extensions use - elevation, staticmap, timezone and sunrise-sunset - from
+synthetic data, so the extensions can run offline and be benchmarked:
+
+    python3 stand_in_proxy.py --port 8765 --latency 0.05
+    LANDSCAPE_API_PROXY=http://127.0.0.1:8765/ python3 ../LandScape/elevation/elevation.py ...
+
+A GET request returns the number of requests served per endpoint as JSON.
+"""
+import argparse
+import datetime
+import json
+import math
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+METERS_PER_DEGREE = 111139
+# Limits of the real elevation service and proxy
+MAX_LOCATIONS = 512
+MAX_URL_LENGTH = 16384
+
+
+def terrain(lat, lon):
+    """Synthetic elevation in meters: long slopes with rolling hills and small ridges on top."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    y = lat * METERS_PER_DEGREE
+    x = lon * METERS_PER_DEGREE * np.cos(np.radians(lat))
+    slopes = 40 * np.sin(x / 3000.0) + 30 * np.cos(y / 2500.0)
+    hills = 6 * np.sin(x / 45.0) * np.cos(y / 60.0) + 2.5 * np.sin((x + y) / 23.0)
+    return 150 + slopes + hills
+
+
+def png_bytes(width, height):
+    """A plain RGB PNG with a green-brown gradient, standing in for the satellite image."""
+    ys, xs = np.mgrid[0:height, 0:width]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = 90 + (xs * 60 // max(1, width - 1))
+    pixels[..., 1] = 120 + (ys * 60 // max(1, height - 1))
+    pixels[..., 2] = 70
+    raw = np.hstack((np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, -1))).tobytes()
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b'')
+
+
+def solar_day(lat, lon, date):
+    """Approximate UTC solar noon, sunrise and sunset for a date."""
+    day = date.timetuple().tm_yday
+    b = 2 * math.pi * (day - 81) / 364
+    equation_of_time = 9.87 * math.sin(2 * b) - 7.53 * math.cos(b) - 1.5 * math.sin(b)
+    noon_minutes = 720 - 4 * lon - equation_of_time
+    declination = math.radians(23.45) * math.sin(2 * math.pi * (284 + day) / 365)
+    cos_hour = -math.tan(math.radians(lat)) * math.tan(declination)
+    half_day = math.degrees(math.acos(max(-1.0, min(1.0, cos_hour)))) * 4
+    midnight = datetime.datetime.combine(date, datetime.time(), tzinfo=datetime.timezone.utc)
+    return [midnight + datetime.timedelta(minutes=m)
+            for m in (noon_minutes, noon_minutes - half_day, noon_minutes + half_day)]
+
+
+def decode_polyline(text):
+    """Points of a Google encoded polyline."""
+    values = []
+    value = shift = 0
+    for char in text:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    coordinates = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 1e5
+    return coordinates[:, 0].tolist(), coordinates[:, 1].tolist()
+
+
+def elevation(params):
+    text = params['locations']
+    if text.startswith('enc:'):
+        lats, lons = decode_polyline(text[4:])
+    else:
+        locations = [loc.split(',') for loc in text.split('|')]
+        lats = [float(lat) for lat, _ in locations]
+        lons = [float(lon) for _, lon in locations]
+    if len(lats) > MAX_LOCATIONS:
+        return 400, {'results': [], 'status': 'INVALID_REQUEST',
+                     'errorMessage': f"at most {MAX_LOCATIONS} locations per request"}
+    heights = terrain(lats, lons).tolist()
+    results = [{'elevation': z, 'location': {'lat': lat, 'lng': lon}, 'resolution': 9.5}
+               for z, lat, lon in zip(heights, lats, lons)]
+    return 200, {'results': results, 'status': 'OK'}
+
+
+def timezone(params):
+    lat, lon = (float(v) for v in params['location'].split(','))
+    offset = round(lon / 15) * 3600
+    return 200, {'dstOffset': 0, 'rawOffset': offset, 'status': 'OK',
+            'timeZoneId': f"Etc/GMT{-offset // 3600:+d}", 'timeZoneName': 'Synthetic Time'}
+
+
+def sunrise_sunset(params):
+    date = datetime.date.fromisoformat(params['date'])
+    noon, sunrise, sunset = solar_day(float(params['lat']), float(params['lng']), date)
+    return 200, {'results': {'sunrise': sunrise.isoformat(), 'sunset': sunset.isoformat(),
+                        'solar_noon': noon.isoformat(),
+                        'day_length': int((sunset - sunrise).total_seconds())},
+            'status': 'OK'}
+
+
+JSON_ENDPOINTS = {
+    'elevation': elevation,
+    'timezone': timezone,
+    'sunrise-sunset': sunrise_sunset,
+}
+
+
+class StandInProxy(ThreadingHTTPServer):
+    """The stand-in server. ``counts`` holds the requests served per endpoint."""
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, failure_rate=0.0):
+        super().__init__(address, ProxyHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts = {}
+
+    def start(self):
+        """Serve on a background thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.send_json(200, {'requests': dict(self.server.counts)})
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            endpoint = body['endpoint']
+            params = body.get('params', {})
+        except (ValueError, KeyError, TypeError):
+            self.send_json(400, {'status': 'INVALID_REQUEST'})
+            return
+
+        with self.server.lock:
+            self.server.counts[endpoint] = self.server.counts.get(endpoint, 0) + 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.failure_rate and random.random() < self.server.failure_rate:
+            self.send_json(503, {'status': 'UNAVAILABLE'})
+            return
+
+        try:
+            if endpoint == 'staticmap':
+                width, height = (int(v) for v in params.get('size', '640x640').split('x'))
+                scale = int(params.get('scale', 1))
+                self.send_body(200, 'image/png', png_bytes(width * scale, height * scale))
+            elif endpoint in JSON_ENDPOINTS:
+                if len(json.dumps(params)) > MAX_URL_LENGTH:
+                    self.send_json(414, {'status': 'URI_TOO_LONG'})
+                    return
+                self.send_json(*JSON_ENDPOINTS[endpoint](params))
+            else:
+                self.send_json(404, {'status': 'UNKNOWN_ENDPOINT'})
+        except (ValueError, KeyError) as e:
+            self.send_json(400, {'status': 'INVALID_REQUEST', 'errorMessage': str(e)})
+
+    def send_json(self, status, data):
+        self.send_body(status, 'application/json', json.dumps(data).encode('utf-8'))
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--failure_rate', type=float, default=0.0, help="fraction of requests answered with HTTP 503")
+    args = parser.parse_args()
+
+    server = StandInProxy((args.host, args.port), args.latency, args.failure_rate)
+    print(f"Stand-in proxy on {server.url} (latency {args.latency}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()